@@ -1,15 +1,40 @@
 # app.py
-import os, csv, time, shutil, subprocess
+import os, csv, time, shutil
 import uuid
 import cv2
 import numpy as np
 import gradio as gr
 
 from set_modal import (
-    infer,            # ใช้กับภาพนิ่ง
-    infer_frame_bgr,  # ใช้ประมวลผลทีละเฟรมของวิดีโอ
-    MIN_KP_CONF_DEFAULT
+    infer,               # ใช้กับภาพนิ่ง
+    predict_frames_bgr,  # ทำนายวิดีโอเป็น batch หลายเฟรม
+    render_frame_kps_bgr,  # วาดผลลัพธ์ต่อเฟรม (คืน keypoints เป็น structured array)
+    to_model_input,
+    MODELS,              # registry ของโมเดล (โหลดตอนใช้ครั้งแรก)
+    MODEL_PATH,
+    PRED_CACHE,          # แคชผลทำนายภาพนิ่ง
+    MIN_KP_CONF_DEFAULT,
+    KEYPOINT_NAMES,
+    CASCADE,             # สถิติโหมด cascade
 )
+from kp_post import extract_keypoints
+from kp_track import TrackWriter, TRACK_MIN_CONF
+from video_pipeline import iter_annotated_frames, iter_keyframe_frames, frames_in_flight, BATCH_SIZE_DEFAULT
+from kp_propagate import KeypointPropagator, KEYFRAME_INTERVAL_DEFAULT
+from roi import RoiPredictor
+from history_store import DiskStore, SessionHistory
+from metrics import METRICS, start_http_server
+from video_stream import HlsSegmentWriter
+from video_io import open_reader, FFmpegWriter, fit_size
+from live_stream import iter_live, LIVE_TARGET_MS, LIVE_SOURCES
+
+# ===== ขนาดของวิดีโอผลลัพธ์ (ด้านยาว px, 0 = ตามต้นฉบับ) =====
+# inference / วาด overlay / encode แยกกัน: คลิป 4K ไม่ต้องวาดและ encode ที่ 4K ทั้งที่ player แสดงเล็กกว่านั้นมาก
+VIDEO_INFER_IMGSZ = int(os.getenv("POSE_INFER_IMGSZ", "0"))      # 0 = ขนาดของโมเดล
+VIDEO_RENDER_SIZE = int(os.getenv("POSE_RENDER_SIZE", "1280"))
+VIDEO_ENCODE_SIZE = int(os.getenv("POSE_ENCODE_SIZE", "0"))      # 0 = เท่าขนาดวาด
+INFER_SIZE_CHOICES = [("ตามโมเดล", 0), ("320", 320), ("480", 480), ("640", 640), ("960", 960), ("1280", 1280)]
+OUT_SIZE_CHOICES = [("ต้นฉบับ", 0), ("1920 (1080p)", 1920), ("1280 (720p)", 1280), ("854 (480p)", 854)]
 
 # ---------------- Utility ----------------
 def _get_video_path(video):
@@ -32,36 +57,18 @@ def _get_video_path(video):
 def _has_ffmpeg():
     return shutil.which("ffmpeg") is not None
 
-def _ffmpeg_h264_writer(out_stub, fps, width, height):
-    """สร้างไฟล์ MP4 ด้วย H.264 ที่เล่นได้บนเบราว์เซอร์"""
-    fps = max(1.0, float(fps))
-    out_mp4 = out_stub + ".mp4"
-    # บังคับให้กว้าง/สูงเป็นเลขคู่และใช้ yuv420p เพื่อความเข้ากันได้
-    vf = "scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p"
-    cmd = [
-        "ffmpeg", "-y",
-        "-f", "rawvideo", "-vcodec", "rawvideo",
-        "-pix_fmt", "rgb24",
-        "-s", f"{width}x{height}",
-        "-r", f"{fps}",
-        "-i", "-",
-        "-an",
-        "-vf", vf,
-        "-c:v", "libx264",
-        "-preset", "veryfast",
-        "-movflags", "+faststart",
-        "-pix_fmt", "yuv420p",
-        out_mp4
-    ]
-    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
-    return proc, proc.stdin, out_mp4
 
+# ภาพผลลัพธ์เต็มขนาดเก็บบนดิสก์ร่วมกันทุก session (ลบตาม TTL/ขนาด); ใน gr.State เก็บแค่ thumbnail
+HISTORY_STORE = DiskStore()
 
 # ---------------- App (UI แบบเวอร์ชันแรก + วิดีโอมีเอาต์พุตเดียว) ----------------
 with gr.Blocks(title="Dog Pose (Thai Labels) – YOLO + Gradio") as app:
     gr.Markdown("## 🐶 Dog Pose Estimation (Thai Labels)\nอัปโหลดภาพหมาหรือวิดีโอ แล้วระบบจะทำนาย keypoints พร้อมป้ายชื่อภาษาไทย")
 
-    history = gr.State([])
+    history = gr.State(None)  # SessionHistory (สร้างตอนทำนายครั้งแรกของ session)
+
+    # เลือก weights ได้ต่อ request (โหลดครั้งแรกตอนใช้งาน แล้วเก็บไว้ใน LRU)
+    model_dd = gr.Dropdown(choices=MODELS.available(), value=MODEL_PATH, label="โมเดล (weights)")
 
     # ========== UI: ภาพนิ่ง ==========
     with gr.Tab("ภาพนิ่ง"):
@@ -71,9 +78,12 @@ with gr.Blocks(title="Dog Pose (Thai Labels) – YOLO + Gradio") as app:
 
         with gr.Row():
             conf = gr.Slider(0.1, 0.95, value=0.5, step=0.05, label="ค่าความมั่นใจขั้นต่ำ (conf)")
+            kp_conf = gr.Slider(0.0, 0.95, value=MIN_KP_CONF_DEFAULT, step=0.05, label="ความมั่นใจขั้นต่ำของจุด (keypoint)")
             show_index = gr.Checkbox(value=False, label="โชว์เลขดัชนี (0–25) ข้างชื่อจุด")
+            cascade = gr.Checkbox(value=False, label="โหมด cascade (รัน 320 ก่อน ขยับเป็นครอป/640 เมื่อไม่มั่นใจ)")
 
         run_btn = gr.Button("ทำนาย (ภาพนิ่ง)")
+        cache_info = gr.Markdown()
 
         with gr.Row():
             with gr.Column(scale=1):
@@ -88,26 +98,53 @@ with gr.Blocks(title="Dog Pose (Thai Labels) – YOLO + Gradio") as app:
             with gr.Column(scale=1):
                 pass
 
-        def predict_and_store(image, conf, show_index, hist):
-            out_np, _ = infer(image, conf, show_index)
+        def _cache_text(hist=None):
+            st = PRED_CACHE.stats()
+            text = (f"แคชผลทำนาย: hit {st['hits']} / miss {st['misses']} (hit rate {st['hit_rate']:.0%}), "
+                    f"{st['items']} ภาพ, {st['bytes'] / 2**20:.1f}/{st['max_bytes'] / 2**20:.0f} MB")
+            if hist is not None:
+                text += f"  \nประวัติ session นี้: {len(hist)} ภาพ, {hist.nbytes() / 1024:.0f} KB ในหน่วยความจำ"
+            return text
+
+        def predict_and_store(image, conf, kp_conf, show_index, model_name, cascade, hist):
+            out_np, _ = infer(image, conf, show_index, kp_conf, model_name=model_name, cascade=cascade)
             if out_np is not None:
-                hist = (hist or []) + [out_np]
-                if len(hist) > 30:
-                    hist = hist[-30:]
-            return out_np, gr.update(value=hist), hist
+                hist = hist if hist is not None else SessionHistory(HISTORY_STORE)
+                hist.add(out_np)
+            thumbs = hist.thumbnails() if hist is not None else []
+            return out_np, gr.update(value=thumbs), hist, _cache_text(hist)
+
+        def open_history_item(hist, evt: gr.SelectData):
+            """เปิดภาพเต็มขนาดจากดิสก์เมื่อคลิกรายการในแกลเลอรี"""
+            img = hist.full(evt.index) if hist is not None else None
+            return img if img is not None else gr.update()
+
+        def rerender(image, conf, kp_conf, show_index, model_name, cascade):
+            """ปรับ conf / kp_conf / show_index: ใช้ผลจากแคช แล้วกรอง + วาดใหม่ (ไม่รันโมเดลซ้ำ)"""
+            if image is None:
+                return gr.update(), _cache_text()
+            out_np, _ = infer(image, conf, show_index, kp_conf, model_name=model_name, cascade=cascade)
+            return out_np, _cache_text()
 
         run_btn.click(
             fn=predict_and_store,
-            inputs=[inp, conf, show_index, history],
-            outputs=[out_img, gallery, history],
+            inputs=[inp, conf, kp_conf, show_index, model_dd, cascade, history],
+            outputs=[out_img, gallery, history, cache_info],
         )
 
         inp.upload(
             fn=predict_and_store,
-            inputs=[inp, conf, show_index, history],
-            outputs=[out_img, gallery, history],
+            inputs=[inp, conf, kp_conf, show_index, model_dd, cascade, history],
+            outputs=[out_img, gallery, history, cache_info],
         )
 
+        rerender_inputs = [inp, conf, kp_conf, show_index, model_dd, cascade]
+        gallery.select(fn=open_history_item, inputs=[history], outputs=[out_img])
+
+        conf.release(fn=rerender, inputs=rerender_inputs, outputs=[out_img, cache_info])
+        kp_conf.release(fn=rerender, inputs=rerender_inputs, outputs=[out_img, cache_info])
+        show_index.change(fn=rerender, inputs=rerender_inputs, outputs=[out_img, cache_info])
+
     # ========== UI: วิดีโอ ==========
     with gr.Tab("วิดีโอ"):
         with gr.Row():
@@ -118,81 +155,273 @@ with gr.Blocks(title="Dog Pose (Thai Labels) – YOLO + Gradio") as app:
                 autoplay=True,
                 show_download_button=True,
             )
+            out_stream = gr.Video(
+                label="ผลลัพธ์แบบทยอยเล่น (เริ่มเล่นได้ระหว่างประมวลผล)",
+                interactive=False,
+                autoplay=True,
+                streaming=True,
+            )
 
         with gr.Row():
             conf_v = gr.Slider(0.1, 0.95, value=0.5, step=0.05, label="ค่าความมั่นใจขั้นต่ำ (conf)")
             show_index_v = gr.Checkbox(value=False, label="โชว์เลขดัชนี (0–25) ข้างชื่อจุด")
             frame_stride = gr.Slider(1, 8, value=1, step=1, label="ข้ามเฟรม (frame_stride)")
+            batch_v = gr.Slider(1, 16, value=BATCH_SIZE_DEFAULT, step=1, label="จำนวนเฟรมต่อ batch (inference)")
+
+        with gr.Row():
+            keyframe_v = gr.Checkbox(value=False, label="โหมด keyframe (รันโมเดลเฉพาะบางเฟรม + optical flow, ได้ fps เต็ม)")
+            key_interval_v = gr.Slider(2, 10, value=KEYFRAME_INTERVAL_DEFAULT, step=1, label="รันโมเดลทุก N เฟรม (keyframe)")
+            roi_v = gr.Checkbox(value=False, label="โหมด ROI (ครอปรอบหมาจากเฟรมก่อน เหมาะกับวิดีโอ 1080p/4K)")
+            stream_v = gr.Checkbox(value=True, label="ทยอยเล่นระหว่างประมวลผล (HLS ชิ้นละ ~1 วินาที)")
+            cascade_v = gr.Checkbox(value=False, label="โหมด cascade (รัน 320 ก่อน ขยับเป็นครอป/640 เมื่อไม่มั่นใจ)")
 
-        # ❗ ไม่มีเอาต์พุตอื่นแล้ว (เหลือเพียง out_vid ตัวเดียว)
-        def predict_video(video, conf, show_idx, stride, progress=gr.Progress()):
+        with gr.Row():
+            infer_size_v = gr.Dropdown(choices=INFER_SIZE_CHOICES, value=VIDEO_INFER_IMGSZ, label="ขนาด inference (imgsz)")
+            render_size_v = gr.Dropdown(choices=OUT_SIZE_CHOICES, value=VIDEO_RENDER_SIZE,
+                                        label="ขนาดที่วาด overlay (ด้านยาว)")
+            encode_size_v = gr.Dropdown(choices=[("เท่าขนาดวาด", 0)] + OUT_SIZE_CHOICES[1:], value=VIDEO_ENCODE_SIZE,
+                                        label="ขนาดวิดีโอที่ encode (ด้านยาว)")
+
+        # generator: (MP4 ไฟล์เต็ม, ชิ้น HLS ล่าสุด) -> โหมดทยอยเล่นส่งชิ้นให้ out_stream ระหว่างทาง แล้วส่ง MP4 ตอนจบ
+        def predict_video(video, conf, show_idx, stride, batch_size, keyframe, key_interval, use_roi, model_name,
+                          stream, use_cascade, infer_size, render_size, encode_size, progress=gr.Progress()):
             # ถ้าไม่มี ffmpeg ให้ไม่คืนไฟล์ (หลีกเลี่ยงส่งข้อความผิดชนิดเข้า gr.Video)
             if not _has_ffmpeg():
-                return gr.update()
+                yield gr.update(), gr.update()
+                return
 
             vpath = _get_video_path(video)
             if not vpath or (not os.path.exists(vpath)):
-                return gr.update()
-
-            cap = cv2.VideoCapture(vpath)
-            if not cap.isOpened():
-                return gr.update()
-
-            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-            W, H = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-
-            base = os.path.splitext(os.path.basename(vpath))[0]
-            uid = uuid.uuid4().hex[:8]
-            out_stub = os.path.abspath(f"{base}_pred_{uid}")
-
-            # เปิดตัวเขียน H.264 (stdin raw RGB -> ffmpeg)
-            ff_proc, ff_stdin, out_path = _ffmpeg_h264_writer(
-                out_stub, max(1.0, float(fps) / max(1, int(stride))), W, H
-            )
-
-            frame_idx = 0
-            iterable = range(total) if total > 0 else range(10**9)
-            for _ in progress.tqdm(iterable, desc="วิเคราะห์วิดีโอ (สร้าง MP4/H.264)"):
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                if stride > 1 and (frame_idx % stride != 0):
-                    frame_idx += 1
-                    continue
-
-                plotted_bgr, _rows = infer_frame_bgr(frame, conf, show_idx, MIN_KP_CONF_DEFAULT)
-
-                # ส่งเฟรมเข้า ffmpeg เป็น RGB24
-                ff_stdin.write(cv2.cvtColor(plotted_bgr, cv2.COLOR_BGR2RGB).tobytes())
-
-                frame_idx += 1
-                if total == 0 and frame_idx > 2000:
-                    break
-
-            cap.release()
+                yield gr.update(), gr.update()
+                return
+
+            # โหมด keyframe ให้ผลลัพธ์ครบทุกเฟรม จึงไม่ข้ามเฟรม
+            if keyframe:
+                stride = 1
+            stride = max(1, int(stride))
+
+            # decode ผ่าน ffmpeg ลง buffer ที่จองไว้ (ข้ามเฟรมตาม stride ตั้งแต่ใน decoder); ไม่มี ffprobe -> cv2 แบบเดิม
+            cap = open_reader(vpath, stride=stride, n_buffers=max(frames_in_flight(batch_size), 10) + 2)
+            # ทรัพยากรที่ต้องคืนเสมอ แม้ Gradio ยกเลิก generator (GeneratorExit ที่ yield) หรือเกิด error กลางทาง
+            hls = writer = track = frames = None
             try:
-                ff_stdin.close()
-            except Exception:
-                pass
-            ff_proc.wait()
-
-            # รอให้ไฟล์พร้อมอ่านเล็กน้อย
-            for _ in range(20):
-                if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
-                    break
-                time.sleep(0.1)
-
-            # คืน "ไฟล์วิดีโอ" เพียงอย่างเดียวตามที่ต้องการ
-            return out_path
+                if not cap.isOpened():
+                    yield gr.update(), gr.update()
+                    return
+
+                fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+                W, H = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+                # inference ใช้เฟรมเต็ม (ย่อเป็น imgsz ในโมเดลเอง) -> ย่อครั้งเดียวก่อนวาด -> ย่ออีกทีเฉพาะถ้า encode เล็กกว่าที่วาด
+                render_wh = fit_size(W, H, int(render_size or 0))
+                encode_wh = fit_size(*render_wh, int(encode_size or 0))
+                enc_W, enc_H = encode_wh
+
+                base = os.path.splitext(os.path.basename(vpath))[0]
+                uid = uuid.uuid4().hex[:8]
+                out_stub = os.path.abspath(f"{base}_pred_{uid}")
+
+                # เปิดตัวเขียน H.264 (stdin raw BGR -> ffmpeg): MP4 ไฟล์เดียว หรือ HLS ทีละชิ้น
+                out_fps = max(1.0, float(fps) / stride)
+                if stream:
+                    hls = HlsSegmentWriter(out_stub + "_hls", out_fps, enc_W, enc_H)
+                    ff_write = hls.write
+                else:
+                    writer = FFmpegWriter(out_stub + ".mp4", out_fps, enc_W, enc_H)
+                    out_path = writer.path
+                    ff_write = writer.write
+
+                imgsz = int(infer_size or 0) or None
+                predict_batch = lambda batch: predict_frames_bgr(batch, conf, model_name, use_cascade, imgsz)
+                roi = None
+                if use_roi:
+                    # ครอปรอบกล่องหมาล่าสุด แล้วสแกนทั้งเฟรมเป็นระยะ/เมื่อหมาหาย
+                    roi = RoiPredictor(predict_batch, to_input=to_model_input)
+                    predict_batch = roi
+
+                def render(r, frame):
+                    plotted, _ = render_frame_kps_bgr(r, frame, show_idx, MIN_KP_CONF_DEFAULT, size=render_wh)
+                    # เก็บลง track store (พิกัดเฟรมต้นฉบับ) ที่ conf ต่ำกว่าที่วาด แล้วไปกรองเพิ่มตอน query
+                    return plotted, (extract_keypoints(r, TRACK_MIN_CONF, KEYPOINT_NAMES) if r is not None else None)
+
+                # keypoints ทุกเฟรมลงไฟล์ .kpt (memory map) ข้างไฟล์ MP4 สำหรับวิเคราะห์ต่อ (kp_track.TrackStore)
+                track = TrackWriter(out_stub, meta={
+                    "source": os.path.basename(vpath), "fps": float(fps), "width": W, "height": H,
+                    "stride": stride, "keyframe": bool(keyframe), "model": model_name or MODEL_PATH,
+                    "names": list(KEYPOINT_NAMES),
+                })
+                kf_stats = {}
+                if keyframe:
+                    frames = iter_keyframe_frames(
+                        cap, predict_batch, render,
+                        propagator=KeypointPropagator(to_input=to_model_input),
+                        interval=key_interval,
+                        total=total,
+                        stats=kf_stats,
+                    )
+                else:
+                    # pipeline: decode (thread) -> inference ทีละ batch (thread) -> วาด + ส่งเข้า ffmpeg (thread นี้)
+                    frames = iter_annotated_frames(
+                        cap, predict_batch, render,
+                        stride=stride,
+                        total=total,
+                        batch_size=batch_size,
+                    )
+                n_out = (total + stride - 1) // stride if total > 0 else None
+                t_video = time.perf_counter()
+                for idx, plotted_bgr, kps in progress.tqdm(frames, total=n_out, desc="วิเคราะห์วิดีโอ (สร้าง MP4/H.264)"):
+                    track.append(idx, kps)
+                    if encode_wh != render_wh:
+                        with METRICS.span("video.encode_resize"):
+                            plotted_bgr = cv2.resize(plotted_bgr, encode_wh, interpolation=cv2.INTER_AREA)
+                    # ส่งเฟรม BGR เข้า ffmpeg ตรง ๆ ผ่าน memoryview (ffmpeg แปลงเป็น yuv420p เอง)
+                    with METRICS.span("video.encode_write"):
+                        ff_write(plotted_bgr)
+                    if stream:
+                        for seg in hls.new_segments():
+                            yield gr.update(), seg
+
+                cap.release()
+                track.close()
+                print(f"[track] {track.n_rows} keypoints -> {track.data_path}")
+                if kf_stats:
+                    print(f"[keyframe] model calls {kf_stats['model_calls']}/{kf_stats['frames']} frames "
+                          f"(refresh {kf_stats['refreshes']})")
+                if roi is not None:
+                    print(f"[roi] full {roi.stats['full_frames']} / roi {roi.stats['roi_frames']} frames "
+                          f"(lost {roi.stats['lost']})")
+                if use_cascade:
+                    print(f"[cascade] {CASCADE.summary()}")
+                if stream:
+                    for seg in hls.close():
+                        yield gr.update(), seg
+                    if hls.first_segment_s is not None:
+                        METRICS.observe_stage("video.first_output", hls.first_segment_s)
+                    # รวมชิ้นเป็น MP4 (copy stream) ให้ดาวน์โหลดได้เหมือนโหมดปกติ
+                    out_path = hls.remux_mp4(out_stub + ".mp4")
+                    METRICS.observe_stage("video.total", time.perf_counter() - t_video)
+                    print(f"[stream] first segment {hls.first_segment_s or 0:.2f}s, "
+                          f"total {time.perf_counter() - t_video:.2f}s")
+                    yield (out_path or gr.update()), gr.update()
+                    return
+
+                writer.close()
+                # โหมดไฟล์เดียว: เล่นได้ก็ต่อเมื่อ encode เสร็จทั้งคลิป -> first_output = total
+                dt = time.perf_counter() - t_video
+                METRICS.observe_stage("video.first_output", dt)
+                METRICS.observe_stage("video.total", dt)
+
+                # รอให้ไฟล์พร้อมอ่านเล็กน้อย
+                for _ in range(20):
+                    if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+                        break
+                    time.sleep(0.1)
+
+                yield out_path, gr.update()
+            finally:
+                if frames is not None:
+                    frames.close()   # หยุด thread decode/inference ของ pipeline
+                cap.release()
+                if track is not None:
+                    track.close()
+                for w in (hls, writer):
+                    if w is not None:
+                        w.abort()    # ยังไม่ได้ close (ยกเลิก/error) -> ฆ่า ffmpeg + ลบไฟล์ที่ไม่ครบ
 
         run_video_btn = gr.Button("ทำนายทั้งวิดีโอ")
         run_video_btn.click(
             fn=predict_video,
-            inputs=[in_vid, conf_v, show_index_v, frame_stride],
-            outputs=[out_vid],
+            inputs=[in_vid, conf_v, show_index_v, frame_stride, batch_v, keyframe_v, key_interval_v, roi_v, model_dd,
+                    stream_v, cascade_v, infer_size_v, render_size_v, encode_size_v],
+            outputs=[out_vid, out_stream],
+            queue=True,
+        )
+
+    # ========== UI: สด (กล้อง / RTSP) ==========
+    # แหล่งภาพฝั่ง server (กล้องของเครื่อง server / RTSP) เลือกได้เฉพาะที่อยู่ใน POSE_LIVE_SOURCES
+    # -> ผู้ใช้เว็บสั่งให้ server เปิดไฟล์/URL อะไรก็ได้ไม่ได้ ; กล้องของผู้ใช้เองใช้ webcam ของเบราว์เซอร์
+    with gr.Tab("สด (กล้อง/RTSP)"):
+        with gr.Row():
+            cam_in = gr.Image(sources=["webcam"], streaming=True, type="numpy", label="กล้องของคุณ (เบราว์เซอร์)")
+            cam_out = gr.Image(label="ผลลัพธ์จากกล้องของคุณ", interactive=False)
+        with gr.Row():
+            live_src = gr.Dropdown(choices=LIVE_SOURCES, value=LIVE_SOURCES[0] if LIVE_SOURCES else None,
+                                   label="แหล่งภาพฝั่ง server (POSE_LIVE_SOURCES)", visible=bool(LIVE_SOURCES))
+            live_file = gr.Video(label="หรืออัปโหลดคลิปเพื่อทดสอบ (เล่นซ้ำตาม fps จริง)", sources=["upload"])
+        with gr.Row():
+            conf_l = gr.Slider(0.1, 0.95, value=0.5, step=0.05, label="ค่าความมั่นใจขั้นต่ำ (conf)")
+            target_l = gr.Slider(50, 2000, value=LIVE_TARGET_MS, step=50, label="latency เป้าหมาย (ms)")
+            infer_size_l = gr.Dropdown(choices=INFER_SIZE_CHOICES, value=VIDEO_INFER_IMGSZ, label="ขนาด inference (imgsz)")
+            render_size_l = gr.Dropdown(choices=OUT_SIZE_CHOICES, value=VIDEO_RENDER_SIZE,
+                                        label="ขนาดที่วาด overlay (ด้านยาว)")
+        with gr.Row():
+            live_start = gr.Button("เริ่ม")
+            live_stop = gr.Button("หยุด")
+        live_out = gr.Image(label="ภาพสด (เฟรมใหม่สุดที่ทำนายแล้ว)", interactive=False)
+        live_stats = gr.Markdown()
+
+        def _live_render(render_size):
+            def render(r, frame):
+                size = fit_size(frame.shape[1], frame.shape[0], int(render_size or 0))
+                plotted, _ = render_frame_kps_bgr(r, frame, False, MIN_KP_CONF_DEFAULT, size=size)
+                return plotted
+            return render
+
+        def run_webcam(frame_rgb, conf, infer_size, render_size, model_name):
+            """เฟรมจากกล้องของผู้ใช้ทีละภาพ (เฟรมที่มาระหว่างกำลังทำนายถูกข้าม: trigger_mode="always_last")"""
+            if frame_rgb is None:
+                return None
+            frame = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+            with METRICS.span("live.webcam"):
+                r = predict_frames_bgr([frame], conf, model_name, imgsz=int(infer_size or 0) or None)[0]
+                plotted = _live_render(render_size)(r, frame)
+            return cv2.cvtColor(plotted, cv2.COLOR_BGR2RGB)
+
+        def run_live(src_choice, src_file, conf, target_ms, infer_size, render_size, model_name):
+            """ทำนายเฟรมใหม่สุดเสมอ ทิ้งเฟรมเก่า ปรับ stride ให้ latency อยู่ใต้เป้า แล้วส่งภาพกลับทีละเฟรม"""
+            source = _get_video_path(src_file)
+            if source is None and src_choice:
+                if src_choice not in LIVE_SOURCES:   # ค่าจาก client เชื่อไม่ได้ ตรวจซ้ำฝั่ง server
+                    yield gr.update(), "แหล่งภาพนี้ไม่ได้รับอนุญาต (ดู POSE_LIVE_SOURCES)"
+                    return
+                source = src_choice
+            if not source:
+                yield gr.update(), "ยังไม่ได้เลือกแหล่งภาพ"
+                return
+            imgsz = int(infer_size or 0) or None
+            predict_batch = lambda batch: predict_frames_bgr(batch, conf, model_name, imgsz=imgsz)
+
+            rep = None
+            try:
+                for plotted, rep in iter_live(source, predict_batch, _live_render(render_size), target_ms):
+                    text = (f"**{rep['fps']} fps** (ต้นทาง {rep['source_fps']}) · ทิ้ง {rep['drop_rate']:.0%} · "
+                            f"latency p50 {rep['latency_ms_p50']} / p95 {rep['latency_ms_p95']} ms · "
+                            f"ใต้เป้า {rep['on_target']:.0%} · stride {rep['stride']}")
+                    yield cv2.cvtColor(plotted, cv2.COLOR_BGR2RGB), text
+            except IOError as e:
+                yield gr.update(), str(e)
+                return
+            if rep is not None:
+                print(f"[live] {rep}")
+
+        live_event = live_start.click(
+            fn=run_live,
+            inputs=[live_src, live_file, conf_l, target_l, infer_size_l, render_size_l, model_dd],
+            outputs=[live_out, live_stats],
             queue=True,
         )
+        # ปิด generator -> finally ใน iter_live ปล่อยกล้อง/สตรีม
+        live_stop.click(fn=None, cancels=[live_event])
+        cam_in.stream(
+            fn=run_webcam,
+            inputs=[cam_in, conf_l, infer_size_l, render_size_l, model_dd],
+            outputs=cam_out,
+            trigger_mode="always_last",
+            show_progress="hidden",
+        )
+
+# metrics แบบ Prometheus ที่ http://127.0.0.1:9108/metrics (POSE_METRICS_PORT=0 เพื่อปิด)
+start_http_server()
 
-app.queue().launch()
+# ให้หลาย request ทำงานพร้อมกันได้ เพื่อให้ scheduler ใน set_modal รวมเป็น batch เดียวกัน
+app.queue(default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY", "8"))).launch()
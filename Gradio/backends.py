@@ -0,0 +1,156 @@
+# backends.py
+import os
+import shutil
+import time
+from pathlib import Path
+import numpy as np
+from ultralytics import YOLO
+
+from pose_results import result_numpy
+
+# ===== backend สำหรับ inference =====
+# torch          = PyTorch (.pt) เดิม
+# onnx           = ONNX Runtime (CPU)
+# openvino       = OpenVINO IR (FP32)
+# openvino-int8  = OpenVINO IR แบบ INT8 (static quantization, calibrate จาก dataset)
+BACKENDS = ("torch", "onnx", "openvino", "openvino-int8")
+BACKEND_DEFAULT = os.getenv("POSE_BACKEND", "torch")
+EXPORT_IMGSZ = 640
+CALIB_DATA = os.getenv("POSE_CALIB_DATA")     # data.yaml ของ dataset สำหรับ calibrate INT8
+CALIB_FRACTION = 0.1                          # ใช้แค่บางส่วนของ dataset พอ (calibration set เล็ก ๆ)
+WARMUP_RUNS = 2
+
+
+def _exported_path(weights, backend):
+    w = Path(weights)
+    if backend == "onnx":
+        return w.with_suffix(".onnx")
+    if backend == "openvino":
+        return w.parent / f"{w.stem}_openvino_model"
+    if backend == "openvino-int8":
+        return w.parent / f"{w.stem}_int8_openvino_model"
+    return w
+
+
+def _is_fresh(out, weights):
+    return out.exists() and out.stat().st_mtime >= Path(weights).stat().st_mtime
+
+
+def export_backend(weights, backend, imgsz=EXPORT_IMGSZ, data=CALIB_DATA):
+    """export best.pt เป็น backend ที่เลือก (ครั้งเดียว ถ้าไฟล์ export ใหม่กว่า weights ก็ใช้ซ้ำ) -> path ที่โหลดได้"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (เลือกจาก {', '.join(BACKENDS)})")
+    out = _exported_path(weights, backend)
+    if backend == "torch" or _is_fresh(out, weights):
+        return str(out)
+
+    src = YOLO(weights)
+    # dynamic=True เพื่อให้ส่งหลายเฟรมเป็น batch ได้ (video pipeline)
+    if backend == "onnx":
+        path = src.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    elif backend == "openvino":
+        path = src.export(format="openvino", imgsz=imgsz, dynamic=True)
+    else:
+        if not data:
+            raise RuntimeError("INT8 ต้องมี data.yaml สำหรับ calibration (ตั้ง POSE_CALIB_DATA)")
+        path = src.export(format="openvino", imgsz=imgsz, dynamic=True, int8=True,
+                          data=data, fraction=CALIB_FRACTION)
+        # ชื่อโฟลเดอร์ INT8 ต่างกันในแต่ละเวอร์ชันของ ultralytics -> ย้ายให้ตรงกับชื่อที่เราใช้
+        path = Path(path)
+        if path != out:
+            if out.exists():
+                shutil.rmtree(out)
+            path.rename(out)
+        path = out
+    return str(path)
+
+
+def load_model(weights, backend=BACKEND_DEFAULT):
+    """โหลดโมเดลตาม backend (export ให้ก่อนถ้ายังไม่มี); ใช้ผ่าน model.predict ได้เหมือนกันทุก backend"""
+    path = export_backend(weights, backend)
+    model = YOLO(path, task="pose")
+    if backend == "torch":
+        try:
+            model.to(0)  # CUDA ถ้ามี
+        except Exception:
+            pass  # ไม่มีก็วิ่งบน CPU
+    return model
+
+
+def model_imgsz(model):
+    """ขนาด inference ของโมเดลเอง: imgsz ที่ตั้งไว้ใน overrides -> imgsz ตอนเทรน (checkpoint .pt) -> EXPORT_IMGSZ (ไฟล์ export)"""
+    imgsz = model.overrides.get("imgsz")
+    if not imgsz:
+        args = getattr(model.model, "args", None)
+        imgsz = args.get("imgsz") if isinstance(args, dict) else None
+    return imgsz or EXPORT_IMGSZ
+
+
+def warmup(model, imgsz=EXPORT_IMGSZ, runs=WARMUP_RUNS):
+    """รัน dummy inference ให้ backend จัดสรรหน่วยความจำ/คอมไพล์ graph ให้เสร็จก่อนรับ request จริง"""
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(max(1, int(runs))):
+        model.predict(dummy, imgsz=imgsz, verbose=False)
+    return model
+
+
+def _match_drift(ref, other, min_conf=0.5):
+    """จับคู่หมาตาม IoU ของกล่อง แล้วคืนระยะเฉลี่ย (px) ของ keypoints ที่ทั้งสองฝั่งมั่นใจ"""
+    rb, rk = result_numpy(ref)
+    ob, ok = result_numpy(other)
+    if len(rb) == 0 or len(ob) == 0 or rk.shape[1] == 0 or ok.shape[1] == 0:
+        return None
+    x1 = np.maximum(rb[:, None, 0], ob[None, :, 0]); y1 = np.maximum(rb[:, None, 1], ob[None, :, 1])
+    x2 = np.minimum(rb[:, None, 2], ob[None, :, 2]); y2 = np.minimum(rb[:, None, 3], ob[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = lambda b: (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    iou = inter / np.maximum(area(rb)[:, None] + area(ob)[None, :] - inter, 1e-6)
+    dists = []
+    for i in range(len(rb)):
+        j = int(np.argmax(iou[i]))
+        if iou[i, j] < 0.5:
+            continue
+        vis = (rk[i, :, 2] >= min_conf) & (ok[j, :, 2] >= min_conf)
+        if vis.any():
+            dists.append(np.linalg.norm(rk[i, vis, :2] - ok[j, vis, :2], axis=1))
+    return float(np.concatenate(dists).mean()) if dists else None
+
+
+def compare_backends(weights, images, backends=BACKENDS, conf=0.25, imgsz=EXPORT_IMGSZ):
+    """เทียบ latency (ms/ภาพ) และ keypoint drift (px) ของแต่ละ backend กับ PyTorch"""
+    import cv2
+    frames = [cv2.imread(str(p)) for p in images]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise RuntimeError("ไม่พบภาพสำหรับเทียบ")
+
+    ref_model = warmup(load_model(weights, "torch"), imgsz)
+    ref = [ref_model.predict(f, conf=conf, imgsz=imgsz, verbose=False)[0] for f in frames]
+
+    report = {}
+    for b in backends:
+        m = ref_model if b == "torch" else warmup(load_model(weights, b), imgsz)
+        lat, drift = [], []
+        for f, r0 in zip(frames, ref):
+            t0 = time.perf_counter()
+            r = m.predict(f, conf=conf, imgsz=imgsz, verbose=False)[0]
+            lat.append((time.perf_counter() - t0) * 1000)
+            d = _match_drift(r0, r)
+            if d is not None:
+                drift.append(d)
+        report[b] = {
+            "latency_ms_p50": round(float(np.percentile(lat, 50)), 2),
+            "latency_ms_p95": round(float(np.percentile(lat, 95)), 2),
+            "kp_drift_px": round(float(np.mean(drift)), 3) if drift else None,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    # python backends.py best.pt <โฟลเดอร์ภาพ> [backend ...]
+    import sys
+    import json
+    weights, img_dir = sys.argv[1], Path(sys.argv[2])
+    chosen = sys.argv[3:] or [b for b in BACKENDS if b != "openvino-int8" or CALIB_DATA]
+    imgs = sorted(p for p in img_dir.rglob("*") if p.suffix.lower() in {".jpg", ".jpeg", ".png", ".bmp", ".webp"})[:50]
+    print(json.dumps(compare_backends(weights, imgs, chosen), indent=2, ensure_ascii=False))
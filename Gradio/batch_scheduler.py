@@ -0,0 +1,241 @@
+# batch_scheduler.py
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from pose_results import filter_by_conf
+from metrics import METRICS
+
+# ===== ค่าเริ่มต้นของ micro-batching =====
+BATCH_MAX_SIZE = int(os.getenv("POSE_BATCH_MAX", "8"))          # ภาพสูงสุดต่อ forward pass
+BATCH_MAX_WAIT_MS = float(os.getenv("POSE_BATCH_WAIT_MS", "5"))  # รอรวม batch นานสุดนับจาก request แรก
+LATENCY_WINDOW = 2000                                           # เก็บสถิติ latency ล่าสุดกี่ request
+
+
+class _Request:
+    __slots__ = ("img", "conf", "model_name", "imgsz", "future", "t_submit")
+
+    def __init__(self, img, conf, model_name, imgsz=None):
+        self.img = img
+        self.conf = float(conf)
+        self.model_name = model_name
+        self.imgsz = imgsz
+        self.future = Future()
+        self.t_submit = time.perf_counter()
+
+
+class BatchScheduler:
+    """
+    รวม request ภาพนิ่ง/เฟรมวิดีโอจากหลายผู้ใช้เป็น batch เดียวภายในช่วงเวลาสั้น ๆ (หรือจนครบ max_batch)
+    แล้วรัน forward pass ครั้งเดียวใน worker thread ก่อนส่งผลกลับให้แต่ละผู้เรียก
+    predict_fn(imgs, conf, model_name, imgsz=..., worker=i) -> list ผลลัพธ์ (ยาวเท่า imgs)
+    request แยก batch ตาม imgsz (เช่น cascade.py); imgsz=None ส่งต่อเป็น None ให้ predict_fn แปลงเป็นขนาดของโมเดลเอง
+    workers > 1: worker หลายตัวดึงจากคิวเดียวกัน (ตัวที่ว่างได้งานก่อน) แต่ละตัวใช้โมเดลของตัวเอง (worker=i)
+    worker_init(i) ถูกเรียกใน thread ของ worker ก่อนเริ่มงาน (เช่น ผูกคอร์ ใน worker_pool.py)
+    """
+
+    def __init__(self, predict_fn, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, workers=1,
+                 worker_init=None):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        self.worker_init = worker_init
+        self._q = queue.Queue()
+        self._threads = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latency = deque(maxlen=LATENCY_WINDOW)
+        self._batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self.n_requests = 0
+        self.n_batches = 0
+        self.worker_batches = [0] * self.workers
+
+    def _ensure_worker(self):
+        if self._threads is not None:
+            return
+        with self._start_lock:
+            if self._threads is None:
+                threads = [threading.Thread(target=self._loop, args=(i,), name=f"pose-batcher-{i}", daemon=True)
+                           for i in range(self.workers)]
+                for t in threads:
+                    t.start()
+                self._threads = threads
+
+    def submit(self, img, conf, model_name=None, imgsz=None):
+        """ส่งภาพ 1 ภาพเข้าคิว -> Future ของผลลัพธ์ (imgsz=None = ขนาดเริ่มต้นของโมเดล)"""
+        self._ensure_worker()
+        req = _Request(img, conf, model_name, imgsz)
+        self._q.put(req)
+        return req.future
+
+    def predict(self, imgs, conf, model_name=None, imgsz=None):
+        """แบบ blocking: ส่งหลายภาพแล้วรอผลครบ (ลำดับเดิม)"""
+        futures = [self.submit(im, conf, model_name, imgsz) for im in imgs]
+        return [f.result() for f in futures]
+
+    def _collect(self):
+        first = self._q.get()
+        batch = [first]
+        deadline = first.t_submit + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                # เลยกำหนดแล้วก็ยังเก็บ request ที่รออยู่ในคิวไปด้วย (ไม่รอเพิ่ม)
+                req = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(req)
+        return batch
+
+    def _loop(self, worker=0):
+        if self.worker_init is not None:
+            try:
+                self.worker_init(worker)
+            except Exception as e:   # ผูกคอร์ไม่ได้ก็ยังรับงานต่อ (ไม่ให้ worker ตายแล้ว request ค้าง)
+                print(f"[scheduler] worker {worker} init ล้มเหลว: {e}")
+        while True:
+            batch = self._collect()
+            groups = {}
+            for req in batch:
+                groups.setdefault((req.model_name, req.imgsz), []).append(req)
+            for (model_name, imgsz), reqs in groups.items():
+                try:
+                    self._run_group(worker, model_name, imgsz, reqs)
+                except BaseException as e:
+                    # อะไรพังก็ตาม request ที่ยังไม่ได้ผลต้องได้ exception กลับไป ไม่งั้น Future ค้างตลอดไป
+                    for r in reqs:
+                        if not r.future.done():
+                            r.future.set_exception(e)
+                    if not isinstance(e, Exception):
+                        raise
+
+    def _run_group(self, worker, model_name, imgsz, reqs):
+        # รันที่ conf ต่ำสุดของกลุ่ม แล้วกรองตาม conf ของแต่ละ request
+        floor = min(r.conf for r in reqs)
+        t_start = time.perf_counter()
+        for r in reqs:
+            METRICS.observe_stage("scheduler.queue_wait", t_start - r.t_submit)
+        METRICS.histogram("batch_size").observe(len(reqs))
+        with METRICS.span("scheduler.forward"):
+            results = list(self.predict_fn([r.img for r in reqs], floor, model_name, imgsz=imgsz, worker=worker))
+        if len(results) != len(reqs):
+            raise RuntimeError(f"predict_fn คืนผล {len(results)} รายการ แต่ส่งไป {len(reqs)} ภาพ")
+        now = time.perf_counter()
+        with self._stats_lock:
+            self.n_batches += 1
+            self.n_requests += len(reqs)
+            self.worker_batches[worker] += 1
+            self._batch_sizes.append(len(reqs))
+            self._latency.extend(now - r.t_submit for r in reqs)
+        for r, res in zip(reqs, results):
+            try:
+                r.future.set_result(filter_by_conf(res, r.conf))
+            except Exception as e:
+                r.future.set_exception(e)
+
+    def stats(self):
+        with self._stats_lock:
+            lat = np.array(self._latency, dtype=np.float64) * 1000
+            sizes = np.array(self._batch_sizes, dtype=np.float64)
+            return {
+                "requests": self.n_requests,
+                "batches": self.n_batches,
+                "mean_batch": round(float(sizes.mean()), 2) if sizes.size else 0.0,
+                "latency_ms_p50": round(float(np.percentile(lat, 50)), 2) if lat.size else 0.0,
+                "latency_ms_p95": round(float(np.percentile(lat, 95)), 2) if lat.size else 0.0,
+                "queue_depth": self._q.qsize(),
+                "workers": self.workers,
+                "worker_batches": list(self.worker_batches),
+            }
+
+
+def run_load(scheduler, images, clients, duration_s, conf=0.5):
+    """load generator: clients thread ยิง request ต่อเนื่อง (closed loop) -> throughput และ latency"""
+    stop = time.perf_counter() + duration_s
+    lat = []
+    lock = threading.Lock()
+
+    def _client(ci):
+        i = ci
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            scheduler.predict([images[i % len(images)]], conf)
+            with lock:
+                lat.append(time.perf_counter() - t0)
+            i += clients
+
+    threads = [threading.Thread(target=_client, args=(c,)) for c in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dt = time.perf_counter() - t0
+    lat_ms = np.array(lat) * 1000
+    return {
+        "clients": clients,
+        "throughput_rps": round(len(lat) / dt, 2),
+        "latency_ms_p50": round(float(np.percentile(lat_ms, 50)), 2) if lat else None,
+        "latency_ms_p95": round(float(np.percentile(lat_ms, 95)), 2) if lat else None,
+        "mean_batch": scheduler.stats()["mean_batch"],
+        "workers": scheduler.workers,
+    }
+
+
+if __name__ == "__main__":
+    # เส้นโค้ง throughput vs p95 latency: python batch_scheduler.py [ระยะเวลา/จุด (วินาที)] [--workers]
+    #   --workers: เทียบจำนวน worker ที่ผูกคอร์ (worker_pool.py) กับผู้ใช้พร้อมกัน 4–16 คน
+    import sys
+    import json
+    from set_modal import MODELS, MODEL_PATH, _predict_batch, to_model_input
+    from worker_pool import available_cores, core_slices, pinned_init
+
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    duration = float(args[0]) if args else 10.0
+    rng = np.random.default_rng(0)
+    imgs = [to_model_input(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)) for _ in range(16)]
+
+    if "--workers" in sys.argv:
+        n_cores = len(available_cores())
+        counts = sorted({w for w in (1, 2, 4, 8, 16) if w <= n_cores} | {n_cores})
+        MODELS.replicas = max(counts)
+
+        def warm_init(slices, ready):
+            # เหมือนตอนใช้งานจริง: ผูกคอร์แล้วโหลด/warm-up replica ใน thread ของ worker เอง
+            # -> thread pool ของ torch/ONNX Runtime/OpenVINO ถูกสร้างในชุดคอร์ของ worker นั้น
+            pin = pinned_init(slices)
+
+            def init(worker):
+                try:
+                    pin(worker)
+                    MODELS.get(MODEL_PATH, replica=worker)
+                finally:
+                    ready.release()
+            return init
+
+        for workers in counts:
+            slices = core_slices(workers)
+            MODELS.clear()   # replica ของการแบ่งคอร์ก่อนหน้าผูกกับชุดคอร์อื่น -> โหลดใหม่
+            for clients in (4, 8, 16):
+                ready = threading.Semaphore(0)
+                sch = BatchScheduler(_predict_batch, workers=len(slices), worker_init=warm_init(slices, ready))
+                sch.predict(imgs[:1], 0.5)      # เริ่ม worker ทุกตัว
+                for _ in slices:
+                    ready.acquire()             # รอทุก replica โหลด/warm-up เสร็จก่อนจับเวลา
+                row = run_load(sch, imgs, clients, duration)
+                row["threads_per_worker"] = len(slices[0])
+                print(json.dumps(row))
+        sys.exit(0)
+
+    for max_batch in (1, 4, 8, 16):
+        for clients in (1, 4, 8, 16):
+            sch = BatchScheduler(_predict_batch, max_batch=max_batch)
+            row = run_load(sch, imgs, clients, duration)
+            row["max_batch"] = max_batch
+            print(json.dumps(row))
@@ -0,0 +1,302 @@
+# bench.py
+"""
+benchmark แยกตาม stage ของ infer / infer_frame_bgr / ลูปวิดีโอ (รันบน CPU ได้ ไม่ต้องดาวน์โหลดอะไร)
+  python bench.py                              # พิมพ์ JSON
+  python bench.py --save-baseline base.json    # เก็บ baseline
+  python bench.py --baseline base.json         # เทียบ baseline แล้ว exit 1 ถ้าช้าลงเกินเกณฑ์
+  python bench.py --sizes                      # ต้นทุนต่อเฟรมที่ 1080p/4K: วาด+encode ที่ขนาดต้นฉบับ vs แยกขนาดวาด/encode
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import set_modal
+from set_modal import (
+    infer, infer_frame_bgr, predict_frames_bgr, render_frame_bgr, to_model_input,
+    _draw_keypoints, KEYPOINT_NAMES, MIN_KP_CONF_DEFAULT, MODELS, PRED_CACHE,
+)
+from kp_post import extract_keypoints
+from pose_results import build_result, scale_result
+from video_pipeline import iter_annotated_frames
+from video_io import FFmpegWriter, fit_size, has_ffmpeg, write_frame
+
+BENCH_MODEL_NAME = "bench:yolov8n-pose-random"
+RESOLUTIONS = {"480p": (854, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+DOG_COUNTS = (1, 3, 8)
+N_KPTS = len(KEYPOINT_NAMES)
+REGRESS_THRESHOLD = 0.25   # ช้าลงเกิน 25% ของ baseline (p50) = fail
+SIZE_RESOLUTIONS = {"1080p": (1920, 1080), "2160p": (3840, 2160)}
+SIZE_MODES = {                                 # (ขนาดวาด, ขนาด encode) ด้านยาว; 0 = ต้นฉบับ / เท่าขนาดวาด
+    "source": (0, 0),                          # แบบเดิม: วาดและ encode ที่ขนาดต้นฉบับ
+    "render1280": (1280, 0),
+    "render1280_encode854": (1280, 854),
+}
+
+
+def _load_bench_model():
+    """โมเดล pose ขนาดเล็กสุดแบบสุ่มค่าเริ่มต้น (สร้างจาก yaml ไม่ต้องโหลด weights)"""
+    import copy
+    from ultralytics import YOLO
+    base = YOLO("yolov8n-pose.yaml", task="pose")   # ไม่เคย predict -> ยังไม่มี predictor (deepcopy ได้)
+    # ทุก replica เป็นสำเนาของ base -> น้ำหนักสุ่มชุดเดียวกัน ; registry warm-up ให้เอง
+    return MODELS.register(BENCH_MODEL_NAME, lambda: copy.deepcopy(base))
+
+
+def _synthetic_frame(W, H, seed=0):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 255, (H // 8, W // 8, 3), dtype=np.uint8)
+    return cv2.resize(small, (W, H), interpolation=cv2.INTER_LINEAR)
+
+
+def _synthetic_result(frame_bgr, dogs, seed=0):
+    """Results ปลอมที่มีหมา dogs ตัว ตัวละ N_KPTS จุด (ใช้วัด stage วาด/กรอง โดยไม่ขึ้นกับสิ่งที่โมเดลสุ่มทายได้)"""
+    H, W = frame_bgr.shape[:2]
+    rng = np.random.default_rng(seed)
+    bw, bh = W / (dogs + 1), H / 3
+    boxes = np.zeros((dogs, 6), np.float32)
+    kpts = np.zeros((dogs, N_KPTS, 3), np.float32)
+    for i in range(dogs):
+        x1, y1 = bw * (i + 0.5), H / 3
+        boxes[i] = (x1, y1, x1 + bw * 0.8, y1 + bh, 0.9, 0)
+        kpts[i, :, 0] = rng.uniform(x1, x1 + bw * 0.8, N_KPTS)
+        kpts[i, :, 1] = rng.uniform(y1, y1 + bh, N_KPTS)
+        kpts[i, :, 2] = rng.uniform(0.5, 1.0, N_KPTS)
+    template = SimpleNamespace(names={0: "dog"}, path="")
+    return build_result(template, frame_bgr, boxes, kpts)
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def time(self, stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        out = fn(*args, **kwargs)
+        self.samples[stage].append((time.perf_counter() - t0) * 1000)
+        return out
+
+    def summary(self):
+        return {
+            stage: {
+                "p50_ms": round(float(np.percentile(v, 50)), 3),
+                "p95_ms": round(float(np.percentile(v, 95)), 3),
+                "n": len(v),
+            }
+            for stage, v in self.samples.items()
+        }
+
+
+def _pipe_sink():
+    """process ปลายทางที่อ่าน stdin ทิ้ง (แทน ffmpeg) เพื่อวัดต้นทุนการเขียน pipe อย่างเดียว"""
+    code = "import sys\nr = sys.stdin.buffer.read\nwhile r(1 << 20):\n    pass\n"
+    return subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE)
+
+
+def bench_frame_stages(W, H, dogs, iters, conf):
+    """stage ย่อยของ infer_frame_bgr: แปลงสี, predict, plot, กรอง keypoints, วาดป้าย, แปลงเป็น RGB, เขียน pipe"""
+    timer = StageTimer()
+    model = MODELS.get(BENCH_MODEL_NAME)
+    sink = _pipe_sink()
+    for i in range(iters):
+        frame = _synthetic_frame(W, H, seed=i)
+        img = timer.time("color_convert", to_model_input, frame)
+        timer.time("predict", model.predict, img, conf=conf, verbose=False)
+        r = _synthetic_result(img, dogs, seed=i)
+        plotted = timer.time("plot", r.plot)
+        kps = timer.time("postprocess", extract_keypoints, r, MIN_KP_CONF_DEFAULT, KEYPOINT_NAMES)
+        timer.time("labels", _draw_keypoints, plotted, kps, False)
+        rgb = timer.time("to_rgb", cv2.cvtColor, plotted, cv2.COLOR_BGR2RGB)
+        timer.time("pipe_write", sink.stdin.write, rgb.tobytes())
+    sink.stdin.close()
+    sink.wait()
+    return timer.summary()
+
+
+def bench_end_to_end(W, H, iters, conf):
+    """infer (PIL -> RGB) และ infer_frame_bgr ทั้งฟังก์ชัน ด้วยโมเดลสุ่ม"""
+    timer = StageTimer()
+    for i in range(iters):
+        frame = _synthetic_frame(W, H, seed=1000 + i)
+        timer.time("infer", infer, Image.fromarray(frame[:, :, ::-1]), conf, False,
+                   model_name=BENCH_MODEL_NAME)
+        timer.time("infer_frame_bgr", infer_frame_bgr, frame, conf, False, model_name=BENCH_MODEL_NAME)
+    return timer.summary()
+
+
+def _make_clip(path, W, H, n_frames, fps=25):
+    vw = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (W, H))
+    base = _synthetic_frame(W, H)
+    for i in range(n_frames):
+        vw.write(np.roll(base, 4 * i, axis=1))
+    vw.release()
+
+
+def bench_video(W, H, n_frames, batch_size, conf, workdir):
+    """ลูปวิดีโอแบบเดียวกับ predict_video (decode -> batch inference -> วาด -> RGB -> pipe) -> fps"""
+    clip = os.path.join(workdir, f"clip_{W}x{H}.mp4")
+    if not os.path.exists(clip):
+        _make_clip(clip, W, H, n_frames)
+    timer = StageTimer()
+    cap = cv2.VideoCapture(clip)
+    sink = _pipe_sink()
+    frames = iter_annotated_frames(
+        cap,
+        predict_batch=lambda b: predict_frames_bgr(b, conf, BENCH_MODEL_NAME),
+        render=lambda r, f: timer.time("render", render_frame_bgr, r, f, False, MIN_KP_CONF_DEFAULT),
+        batch_size=batch_size,
+    )
+    t0 = time.perf_counter()
+    n = 0
+    for _idx, plotted, _rows in frames:
+        rgb = timer.time("to_rgb", cv2.cvtColor, plotted, cv2.COLOR_BGR2RGB)
+        timer.time("pipe_write", sink.stdin.write, rgb.tobytes())
+        n += 1
+    dt = time.perf_counter() - t0
+    cap.release()
+    sink.stdin.close()
+    sink.wait()
+    out = timer.summary()
+    out["fps"] = round(n / max(dt, 1e-9), 2)
+    out["frames"] = n
+    return out
+
+
+def bench_sizes(W, H, dogs, iters, conf, render_long, encode_long, workdir):
+    """
+    ต้นทุนต่อเฟรมของ predict_video เมื่อแยกขนาด inference / วาด / encode:
+    predict (เฟรมเต็ม) -> ย่อเฟรม + แปลงพิกัด -> plot + ป้าย -> ย่อก่อน encode -> libx264 (หรือ pipe ถ้าไม่มี ffmpeg)
+    """
+    timer = StageTimer()
+    model = MODELS.get(BENCH_MODEL_NAME)
+    rw, rh = fit_size(W, H, render_long)
+    ew, eh = fit_size(rw, rh, encode_long)
+    if has_ffmpeg():
+        writer = FFmpegWriter(os.path.join(workdir, f"sizes_{W}x{H}_{rw}_{ew}.mp4"), 25, ew, eh)
+        write, close = writer.write, writer.close
+    else:
+        sink = _pipe_sink()
+        write, close = (lambda f: write_frame(sink.stdin, f)), (lambda: (sink.stdin.close(), sink.wait()))
+    t0 = time.perf_counter()
+    for i in range(iters):
+        frame = _synthetic_frame(W, H, seed=i)
+        timer.time("predict", model.predict, frame, conf=conf, verbose=False)
+        r = _synthetic_result(frame, dogs, seed=i)
+        if (rw, rh) != (W, H):
+            frame = timer.time("resize", cv2.resize, frame, (rw, rh), interpolation=cv2.INTER_AREA)
+            r = timer.time("scale_result", scale_result, r, frame, rw / W, rh / H)
+        plotted = timer.time("plot", r.plot)
+        kps = timer.time("postprocess", extract_keypoints, r, MIN_KP_CONF_DEFAULT, KEYPOINT_NAMES)
+        timer.time("labels", _draw_keypoints, plotted, kps, False)
+        if (ew, eh) != (rw, rh):
+            plotted = timer.time("encode_resize", cv2.resize, plotted, (ew, eh), interpolation=cv2.INTER_AREA)
+        timer.time("encode_write", write, plotted)
+    timer.time("encode_flush", close)   # เวลารอ encoder เคลียร์คิวที่ค้างใน pipe ตอนจบ
+    dt = time.perf_counter() - t0
+    out = timer.summary()
+    out["fps"] = round(iters / max(dt, 1e-9), 2)
+    out["render_size"] = [rw, rh]
+    out["encode_size"] = [ew, eh]
+    out["encoder"] = "libx264" if has_ffmpeg() else "pipe"
+    return out
+
+
+def run_sizes(resolutions=SIZE_RESOLUTIONS, modes=SIZE_MODES, dogs=3, iters=30, conf=0.25):
+    """เทียบ SIZE_MODES ที่ 1080p/4K -> {"1080p/source": {...}, ...} พร้อม speedup ของ fps เทียบโหมด source"""
+    _load_bench_model()
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for res, (W, H) in resolutions.items():
+            for mode, (render_long, encode_long) in modes.items():
+                report[f"{res}/{mode}"] = bench_sizes(W, H, dogs, iters, conf, render_long, encode_long, workdir)
+            base_fps = report[f"{res}/source"]["fps"] if "source" in modes else None
+            for mode in modes:
+                if base_fps:
+                    report[f"{res}/{mode}"]["speedup"] = round(report[f"{res}/{mode}"]["fps"] / base_fps, 2)
+    return report
+
+
+def run(resolutions=RESOLUTIONS, dog_counts=DOG_COUNTS, iters=10, video_frames=48, batch_size=4, conf=0.25):
+    _load_bench_model()
+    PRED_CACHE.max_bytes = 0  # ปิดแคช ให้ทุกรอบรันโมเดลจริง
+    report = {"cases": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for res, (W, H) in resolutions.items():
+            for dogs in dog_counts:
+                report["cases"][f"frame_stages/{res}/dogs{dogs}"] = bench_frame_stages(W, H, dogs, iters, conf)
+            report["cases"][f"end_to_end/{res}"] = bench_end_to_end(W, H, iters, conf)
+            report["cases"][f"video/{res}"] = bench_video(W, H, video_frames, batch_size, conf, workdir)
+    report["meta"] = {"iters": iters, "video_frames": video_frames, "batch_size": batch_size,
+                      "cpu_count": os.cpu_count(), "set_modal": set_modal.__file__}
+    return report
+
+
+def compare(report, baseline, threshold=REGRESS_THRESHOLD):
+    """คืนรายการ stage ที่ p50 ช้าลงเกิน threshold (หรือ fps ลดลงเกิน threshold)"""
+    regressions = []
+    for case, stages in baseline.get("cases", {}).items():
+        cur = report["cases"].get(case)
+        if cur is None:
+            continue
+        for stage, base in stages.items():
+            now = cur.get(stage)
+            if now is None:
+                continue
+            if stage == "fps":
+                if now < base * (1 - threshold):
+                    regressions.append(f"{case} fps {base} -> {now}")
+            elif isinstance(base, dict) and now["p50_ms"] > base["p50_ms"] * (1 + threshold):
+                regressions.append(f"{case} {stage} p50 {base['p50_ms']}ms -> {now['p50_ms']}ms")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="per-stage benchmark สำหรับ set_modal / ลูปวิดีโอ")
+    ap.add_argument("--iters", type=int, default=10)
+    ap.add_argument("--video-frames", type=int, default=48)
+    ap.add_argument("--batch", type=int, default=4)
+    ap.add_argument("--res", nargs="*", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    ap.add_argument("--dogs", nargs="*", type=int, default=list(DOG_COUNTS))
+    ap.add_argument("--out", help="เขียนผล JSON ลงไฟล์")
+    ap.add_argument("--baseline", help="ไฟล์ baseline สำหรับเทียบ")
+    ap.add_argument("--save-baseline", help="บันทึกผลรอบนี้เป็น baseline")
+    ap.add_argument("--threshold", type=float, default=REGRESS_THRESHOLD)
+    ap.add_argument("--sizes", action="store_true", help="เทียบขนาดวาด/encode ที่ 1080p และ 4K แทน benchmark ปกติ")
+    args = ap.parse_args()
+
+    if args.sizes:
+        text = json.dumps(run_sizes(iters=max(args.iters, 10)), indent=2, ensure_ascii=False)
+        print(text)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text)
+        return
+
+    report = run({k: RESOLUTIONS[k] for k in args.res}, args.dogs, args.iters, args.video_frames, args.batch)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("[REGRESSION]\n  " + "\n  ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+        print("[OK] ไม่มี stage ที่ช้าลงเกินเกณฑ์", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# cascade.py
+"""
+ทำนายแบบ cascade ตามความยากของภาพ:
+  1) รันทุกภาพที่ความละเอียดต่ำ (CASCADE_LOW_IMGSZ เช่น 320) ก่อน
+  2) ภาพที่ไม่เจอหมา หรือกล่อง/ค่าเฉลี่ย conf ของจุดต่ำกว่าเกณฑ์ -> รันใหม่
+       - หมาตัวเล็กในภาพ (กล่องรวม < CASCADE_CROP_MAX_AREA ของภาพ): ครอปรอบหมาแล้วรันที่ CASCADE_HIGH_IMGSZ
+       - นอกนั้น: รันทั้งภาพที่ CASCADE_HIGH_IMGSZ
+ภาพง่าย (หมาตัวใหญ่ชัด) จบในรอบแรกที่ถูกกว่า ~4 เท่า; การตัดสินใจทุกภาพนับใน METRICS และเขียนลง POSE_CASCADE_LOG (JSONL) ถ้าตั้งไว้
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import METRICS
+from pose_results import result_numpy
+from roi import plan_crops, combine_crop_results
+
+CASCADE_LOW_IMGSZ = int(os.getenv("POSE_CASCADE_LOW", "320"))
+CASCADE_HIGH_IMGSZ = int(os.getenv("POSE_CASCADE_HIGH", "640"))
+CASCADE_DETECT_CONF = 0.25      # กล่องที่ conf ต่ำกว่านี้ไม่นับเป็นหมาตอนตัดสินใจ
+CASCADE_BOX_CONF = float(os.getenv("POSE_CASCADE_BOX_CONF", "0.5"))    # หมาทุกตัวต้องมี conf กล่อง >= ค่านี้
+CASCADE_KP_CONF = float(os.getenv("POSE_CASCADE_KP_CONF", "0.5"))      # และค่าเฉลี่ย conf ของจุด >= ค่านี้
+CASCADE_CROP_MAX_AREA = 0.15    # กล่องรวมเล็กกว่าสัดส่วนนี้ของภาพ -> ครอปแทนการรันทั้งภาพ
+CASCADE_LOG = os.getenv("POSE_CASCADE_LOG")
+RECENT_DECISIONS = 200
+
+
+def assess(r, detect_conf=CASCADE_DETECT_CONF, box_conf=CASCADE_BOX_CONF, kp_conf=CASCADE_KP_CONF):
+    """ผลรอบแรก -> (ผ่านไหม, เหตุผล, กล่องหมาที่นับ [N,6], conf กล่องต่ำสุด, ค่าเฉลี่ย conf จุดต่ำสุด)"""
+    boxes, kpts = result_numpy(r)
+    keep = boxes[:, 4] >= detect_conf if len(boxes) else np.zeros(0, bool)
+    boxes = boxes[keep]
+    if len(boxes) == 0:
+        return False, "no_dog", boxes, 0.0, 0.0
+    min_box = float(boxes[:, 4].min())
+    min_kp = float(kpts[keep][..., 2].mean(axis=1).min()) if kpts.shape[1] else 1.0
+    if min_box < box_conf:
+        return False, "low_box_conf", boxes, min_box, min_kp
+    if min_kp < kp_conf:
+        return False, "low_kp_conf", boxes, min_box, min_kp
+    return True, "confident", boxes, min_box, min_kp
+
+
+class Cascade:
+    """
+    cascade(predict_fn, imgs) -> list ผลลัพธ์ (ยาวเท่า imgs, พิกัดภาพเต็ม)
+    predict_fn(imgs, imgsz) -> list ผลลัพธ์ ; รอบเดียวกันส่งเป็น batch เดียว (ผ่าน BatchScheduler ได้)
+    """
+
+    def __init__(self, low_imgsz=CASCADE_LOW_IMGSZ, high_imgsz=CASCADE_HIGH_IMGSZ, box_conf=CASCADE_BOX_CONF,
+                 kp_conf=CASCADE_KP_CONF, crop_max_area=CASCADE_CROP_MAX_AREA, log_path=CASCADE_LOG):
+        self.low_imgsz = int(low_imgsz)
+        self.high_imgsz = int(high_imgsz)
+        self.box_conf = float(box_conf)
+        self.kp_conf = float(kp_conf)
+        self.crop_max_area = float(crop_max_area)
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=RECENT_DECISIONS)
+        self.stats = {"low": 0, "crop": 0, "full": 0}
+        self._counters = {k: METRICS.counter(f"cascade_{k}") for k in self.stats}
+
+    def _log(self, decisions):
+        with self._lock:
+            for d in decisions:
+                self.stats[d["stage"]] += 1
+                self.recent.append(d)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    for d in decisions:
+                        f.write(json.dumps(d) + "\n")
+        for d in decisions:
+            self._counters[d["stage"]].inc()
+
+    def __call__(self, predict_fn, imgs, tag=None):
+        if not imgs:
+            return []
+        t0 = time.perf_counter()
+        with METRICS.span("cascade.low"):
+            results = list(predict_fn(imgs, self.low_imgsz))
+
+        decisions, crop_jobs, full_idx = [], [], []
+        for i, (img, r) in enumerate(zip(imgs, results)):
+            H, W = img.shape[:2]
+            ok, reason, boxes, min_box, min_kp = assess(r, box_conf=self.box_conf, kp_conf=self.kp_conf)
+            stage = "low"
+            if not ok:
+                rects = plan_crops(boxes, W, H) if len(boxes) else []
+                area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in rects)
+                if rects and area < self.crop_max_area * W * H:
+                    stage = "crop"
+                    crop_jobs.append((i, rects))
+                else:
+                    stage = "full"
+                    full_idx.append(i)
+            decisions.append({"time": round(time.time(), 3), "tag": tag, "index": i, "size": [W, H],
+                              "stage": stage, "reason": reason, "dogs": int(len(boxes)),
+                              "min_box_conf": round(min_box, 3), "min_kp_conf": round(min_kp, 3)})
+
+        if crop_jobs:
+            with METRICS.span("cascade.crop"):
+                crops = [imgs[i][y1:y2, x1:x2] for i, rects in crop_jobs for (x1, y1, x2, y2) in rects]
+                crop_results = list(predict_fn(crops, self.high_imgsz))
+            pos = 0
+            for i, rects in crop_jobs:
+                r = combine_crop_results(imgs[i], crop_results[pos:pos + len(rects)], rects)
+                pos += len(rects)
+                if r is not None and len(result_numpy(r)[0]):
+                    results[i] = r
+                else:
+                    decisions[i]["reason"] += "+crop_empty"   # ครอปไม่เจอ -> ใช้ผลรอบแรก
+        if full_idx:
+            with METRICS.span("cascade.full"):
+                for i, r in zip(full_idx, predict_fn([imgs[i] for i in full_idx], self.high_imgsz)):
+                    results[i] = r
+
+        dt_ms = round((time.perf_counter() - t0) * 1000 / len(imgs), 2)
+        for d in decisions:
+            d["ms"] = dt_ms   # เวลาเฉลี่ยต่อภาพของ batch นี้
+        self._log(decisions)
+        return results
+
+    def summary(self):
+        with self._lock:
+            n = sum(self.stats.values())
+            return {**self.stats, "images": n,
+                    "escalated": round((self.stats["crop"] + self.stats["full"]) / n, 3) if n else 0.0}
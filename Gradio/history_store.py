@@ -0,0 +1,138 @@
+# history_store.py
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# ===== ค่าเริ่มต้นของประวัติการทำนาย =====
+HISTORY_MAX_ITEMS = 30                  # จำนวนรายการต่อ session (ring buffer)
+THUMB_MAX_SIDE = 256                    # ขนาด thumbnail ด้านยาวสุด (px)
+THUMB_JPEG_QUALITY = 80
+FULL_JPEG_QUALITY = 92
+STORE_DIR = os.getenv("POSE_HISTORY_DIR", os.path.join(tempfile.gettempdir(), "dog_pose_history"))
+STORE_TTL_SEC = 6 * 3600                # ไฟล์เต็มขนาดเก่ากว่านี้ถูกลบ
+STORE_MAX_BYTES = 2 * 1024 ** 3         # ขนาดรวมของโฟลเดอร์บนดิสก์
+SWEEP_EVERY_SEC = 60
+
+
+def _encode_jpeg(img_rgb, quality):
+    ok, buf = cv2.imencode(".jpg", cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return buf.tobytes()
+
+
+def _decode_jpeg(data):
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def _thumbnail(img_rgb, max_side):
+    h, w = img_rgb.shape[:2]
+    s = max_side / float(max(h, w))
+    if s >= 1.0:
+        return img_rgb
+    return cv2.resize(img_rgb, (max(1, int(w * s)), max(1, int(h * s))), interpolation=cv2.INTER_AREA)
+
+
+class DiskStore:
+    """ที่เก็บภาพผลลัพธ์เต็มขนาดบนดิสก์ (JPEG) ลบตามอายุ (TTL) และขนาดรวม (เก่าสุดออกก่อน)"""
+
+    def __init__(self, root=STORE_DIR, ttl_sec=STORE_TTL_SEC, max_bytes=STORE_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl_sec = float(ttl_sec)
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def put(self, img_rgb):
+        key = uuid.uuid4().hex
+        path = self.root / f"{key}.jpg"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(_encode_jpeg(img_rgb, FULL_JPEG_QUALITY))
+        os.replace(tmp, path)
+        self.maybe_sweep()
+        return key
+
+    def path(self, key):
+        p = self.root / f"{key}.jpg"
+        return str(p) if p.exists() else None
+
+    def load(self, key):
+        p = self.path(key)
+        return _decode_jpeg(Path(p).read_bytes()) if p else None
+
+    def maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < SWEEP_EVERY_SEC:
+            return
+        self._last_sweep = now
+        self.sweep(now)
+
+    def sweep(self, now=None):
+        """ลบไฟล์หมดอายุ แล้วลบไฟล์เก่าสุดจนขนาดรวมไม่เกินงบ -> จำนวนไฟล์ที่ลบ"""
+        now = now or time.time()
+        removed = 0
+        with self._lock:
+            files = []
+            for p in self.root.glob("*.jpg"):
+                try:
+                    st = p.stat()
+                except FileNotFoundError:
+                    continue
+                if now - st.st_mtime > self.ttl_sec:
+                    p.unlink(missing_ok=True)
+                    removed += 1
+                else:
+                    files.append((st.st_mtime, st.st_size, p))
+            total = sum(sz for _, sz, _ in files)
+            for _mt, sz, p in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= sz
+                removed += 1
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+
+class SessionHistory:
+    """ประวัติต่อ session: thumbnail JPEG ในหน่วยความจำ (ring buffer) + key ของภาพเต็มบนดิสก์"""
+
+    def __init__(self, store, max_items=HISTORY_MAX_ITEMS, thumb_side=THUMB_MAX_SIDE):
+        self.store = store
+        self.thumb_side = int(thumb_side)
+        self._items = deque(maxlen=int(max_items))   # (thumb_jpeg_bytes, full_key)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, img_rgb):
+        thumb = _encode_jpeg(_thumbnail(img_rgb, self.thumb_side), THUMB_JPEG_QUALITY)
+        key = self.store.put(img_rgb)
+        self._items.append((thumb, key))
+
+    def thumbnails(self):
+        """รายการ thumbnail (RGB numpy) สำหรับ gr.Gallery"""
+        return [_decode_jpeg(t) for t, _ in self._items]
+
+    def full(self, index):
+        """โหลดภาพเต็มขนาดจากดิสก์เมื่อผู้ใช้เปิดรายการนั้น (None ถ้าถูกลบไปแล้ว)"""
+        if index is None or not (0 <= index < len(self._items)):
+            return None
+        return self.store.load(self._items[index][1])
+
+    def nbytes(self):
+        """หน่วยความจำที่ session นี้ใช้ (เฉพาะ thumbnail ที่เก็บไว้)"""
+        return sum(len(t) for t, _ in self._items)
@@ -0,0 +1,93 @@
+# kp_post.py
+from functools import lru_cache
+import numpy as np
+
+# แถวของ keypoint ที่ผ่านการกรองแล้ว (1 แถว = 1 จุดของ 1 ตัว)
+KP_DTYPE = np.dtype([
+    ("person", np.int32),
+    ("kp", np.int32),
+    ("x", np.float32),
+    ("y", np.float32),
+    ("conf", np.float32),
+])
+
+TABLE_HEADERS = ["บุคคล", "ดัชนีจุด", "ชื่อจุด (ไทย)", "x", "y", "conf"]
+
+
+def _to_numpy(t):
+    if t is None:
+        return None
+    return t.cpu().numpy() if hasattr(t, "cpu") else np.asarray(t)
+
+
+def kp_name(names, ki):
+    return names[ki] if ki < len(names) else f"จุด {ki}"
+
+
+@lru_cache(maxsize=16)
+def _name_keep_mask(names, K):
+    m = np.array([kp_name(names, ki).strip().lower() != "null" for ki in range(K)], dtype=bool)
+    m.flags.writeable = False
+    return m
+
+
+def name_keep_mask(names, K):
+    """True = จุดที่ควรแสดง (ตัดจุดที่ชื่อเป็น 'Null' ออก)"""
+    return _name_keep_mask(tuple(names), int(K))
+
+
+def result_arrays(r):
+    """ดึง (kps_xy [N,K,2], kps_conf [N,K] หรือ None) เป็น numpy จากผลลัพธ์ Ultralytics"""
+    kps = getattr(r, "keypoints", None)
+    if kps is None:
+        return None, None
+    xy = _to_numpy(kps.xy)
+    conf = _to_numpy(getattr(kps, "conf", None))
+    return xy, conf
+
+
+def filter_keypoints(kps_xy, kps_conf, min_kp_conf, names):
+    """กรอง NaN / conf ต่ำ / จุด 'Null' ด้วย boolean mask -> structured array (KP_DTYPE) เรียงตาม (person, kp)"""
+    if kps_xy is None or kps_conf is None:
+        return np.empty(0, dtype=KP_DTYPE)
+    kps_xy = np.asarray(kps_xy, dtype=np.float32).reshape(-1, kps_xy.shape[-2], 2)
+    N, K = kps_xy.shape[:2]
+    if N == 0:
+        return np.empty(0, dtype=KP_DTYPE)
+    kps_conf = np.asarray(kps_conf, dtype=np.float32).reshape(N, K)
+
+    # NaN ใน conf จะเป็น False จากการเทียบ >= อยู่แล้ว
+    mask = ~np.isnan(kps_xy).any(axis=2)
+    mask &= kps_conf >= float(min_kp_conf)
+    mask &= name_keep_mask(names, K)[None, :]
+
+    pi, ki = np.nonzero(mask)
+    out = np.empty(pi.size, dtype=KP_DTYPE)
+    out["person"] = pi
+    out["kp"] = ki
+    out["x"] = kps_xy[pi, ki, 0]
+    out["y"] = kps_xy[pi, ki, 1]
+    out["conf"] = kps_conf[pi, ki]
+    return out
+
+
+def extract_keypoints(r, min_kp_conf, names):
+    xy, conf = result_arrays(r)
+    return filter_keypoints(xy, conf, min_kp_conf, names)
+
+
+def rows_from_keypoints(kps, names):
+    """แปลง structured array เป็นแถวตาราง [person, kp, ชื่อ, x, y, conf]"""
+    if kps.size == 0:
+        return []
+    return [
+        [p, k, kp_name(names, k), round(x, 2), round(y, 2), round(c, 3)]
+        for p, k, x, y, c in zip(
+            kps["person"].tolist(), kps["kp"].tolist(),
+            kps["x"].tolist(), kps["y"].tolist(), kps["conf"].tolist(),
+        )
+    ]
+
+
+def make_table(rows):
+    return [TABLE_HEADERS] + rows if rows else None
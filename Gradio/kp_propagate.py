@@ -0,0 +1,93 @@
+# kp_propagate.py
+import numpy as np
+import cv2
+
+from pose_results import result_numpy, build_result
+
+# ===== ค่าเริ่มต้นโหมด keyframe =====
+KEYFRAME_INTERVAL_DEFAULT = 5   # รันโมเดลทุก N เฟรม (เฟรมระหว่างกลางใช้ optical flow)
+MIN_TRACK_QUALITY = 0.6         # สัดส่วนจุดที่ยังตามได้ ต่ำกว่านี้ -> ทำนายใหม่ทันที
+SEED_KP_CONF = 0.30             # จุดที่ conf ต่ำกว่านี้ไม่ใช้เป็นจุดตั้งต้นของ flow
+MAX_FB_ERROR = 1.5              # ระยะ forward-backward (px) สูงสุดที่ยอมรับ
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+)
+
+
+class KeypointPropagator:
+    """
+    ต่อ keypoints จาก keyframe ล่าสุดไปยังเฟรมถัดไปด้วย sparse optical flow (Lucas–Kanade + ตรวจ forward-backward)
+    แล้วสร้าง Results ใหม่ให้วาดด้วย r.plot() ได้เหมือนผลจากโมเดล
+    """
+
+    def __init__(self, to_input=None, min_quality=MIN_TRACK_QUALITY, seed_conf=SEED_KP_CONF,
+                 max_fb_error=MAX_FB_ERROR):
+        self.to_input = to_input or (lambda frame_bgr: frame_bgr)  # แปลงเฟรมให้ตรงกับที่ส่งเข้า model.predict
+        self.min_quality = float(min_quality)
+        self.seed_conf = float(seed_conf)
+        self.max_fb_error = float(max_fb_error)
+        self._r = None
+        self._gray = None
+        self._kpts = None    # [N,K,3] (x, y, conf)
+        self._boxes = None   # [N,6]   (x1, y1, x2, y2, conf, cls)
+        self._alive = None   # [N,K] จุดที่ยังตามอยู่
+        self._n_seed = 0
+
+    @property
+    def ready(self):
+        return self._r is not None
+
+    def reset(self, frame_bgr, r):
+        """ตั้ง keyframe ใหม่จากผลลัพธ์ของโมเดล"""
+        self._r = r
+        self._gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        self._boxes, self._kpts = result_numpy(r)
+        data = self._kpts
+        self._alive = (data[..., 2] >= self.seed_conf) & ~np.isnan(data[..., :2]).any(axis=-1)
+        self._n_seed = int(self._alive.sum())
+
+    def step(self, frame_bgr):
+        """
+        ต่อ keypoints ไปยัง frame_bgr -> (Results หรือ None, quality)
+        คืน None เมื่อคุณภาพการตามต่ำกว่าเกณฑ์ (ผู้เรียกควรรันโมเดลใหม่)
+        """
+        if self._r is None:
+            return None, 0.0
+        gray = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+        if self._n_seed == 0:
+            self._gray = gray
+            return self._make_result(frame_bgr), 1.0
+
+        pi, ki = np.nonzero(self._alive)
+        p0 = self._kpts[pi, ki, :2].reshape(-1, 1, 2)
+        p1, st1, _ = cv2.calcOpticalFlowPyrLK(self._gray, gray, p0, None, **LK_PARAMS)
+        p0r, st0, _ = cv2.calcOpticalFlowPyrLK(gray, self._gray, p1, None, **LK_PARAMS)
+        fb = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+        ok = (st1.ravel() == 1) & (st0.ravel() == 1) & (fb < self.max_fb_error)
+
+        quality = float(ok.sum()) / float(self._n_seed)
+        if quality < self.min_quality:
+            return None, quality
+
+        moved = p1.reshape(-1, 2)
+        delta = moved - p0.reshape(-1, 2)
+        self._kpts[pi[ok], ki[ok], :2] = moved[ok]
+        lost = ~ok
+        self._alive[pi[lost], ki[lost]] = False
+        self._kpts[pi[lost], ki[lost], 2] = 0.0  # จุดที่หลุดไม่วาดต่อ
+
+        # เลื่อนกล่องตาม median ของการเคลื่อนที่ของจุดในตัวนั้น
+        for n in range(self._boxes.shape[0]):
+            sel = ok & (pi == n)
+            if sel.any():
+                dx, dy = np.median(delta[sel], axis=0)
+                self._boxes[n, [0, 2]] += dx
+                self._boxes[n, [1, 3]] += dy
+
+        self._gray = gray
+        return self._make_result(frame_bgr), quality
+
+    def _make_result(self, frame_bgr):
+        return build_result(self._r, self.to_input(frame_bgr), self._boxes, self._kpts)
@@ -0,0 +1,201 @@
+# kp_track.py
+"""
+ที่เก็บ keypoints ของวิดีโอแบบคอลัมน์ (fixed dtype) บนดิสก์ อ่านผ่าน memory map
+  <stem>.kpt        ข้อมูลดิบ TRACK_DTYPE ต่อกันทีละเฟรม (เขียนต่อท้ายระหว่างประมวลผล)
+  <stem>.kpt.idx    ดัชนีเฟรม [frame, offset เริ่ม] (int64) -> หาเฟรมช่วงใดก็ได้ด้วย searchsorted
+  <stem>.kpt.json   ข้อมูลประกอบ (fps, ขนาดภาพ, ชื่อจุด, stride ฯลฯ)
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+from kp_post import kp_name
+
+# 1 แถว = 1 จุดของหมา 1 ตัวในเฟรมหนึ่ง (20 ไบต์)
+TRACK_DTYPE = np.dtype([
+    ("frame", np.int32),
+    ("dog", np.int16),
+    ("kp", np.int16),
+    ("x", np.float32),
+    ("y", np.float32),
+    ("conf", np.float32),
+])
+IDX_DTYPE = np.dtype([("frame", np.int64), ("start", np.int64)])
+
+TRACK_MIN_CONF = 0.05          # เก็บจุดที่ conf ต่ำกว่านี้ทิ้ง (กรองเพิ่มตอน query ได้)
+INDEX_FLUSH_EVERY = 500        # เขียนดัชนีลงไฟล์ทุก N เฟรม (กันข้อมูลหายถ้า process ตาย)
+CSV_CHUNK_ROWS = 1 << 18       # export ทีละก้อน ไม่โหลดทั้งไฟล์
+
+
+def _select(part, kps, dogs, min_conf):
+    mask = None
+    if min_conf > 0:
+        mask = part["conf"] >= float(min_conf)
+    if kps is not None:
+        m = np.isin(part["kp"], np.asarray(list(kps), dtype=np.int16))
+        mask = m if mask is None else mask & m
+    if dogs is not None:
+        m = np.isin(part["dog"], np.asarray(list(dogs), dtype=np.int16))
+        mask = m if mask is None else mask & m
+    return np.array(part if mask is None else part[mask])
+
+
+def _paths(path):
+    base = path[:-4] if path.endswith(".kpt") else path
+    return base + ".kpt", base + ".kpt.idx", base + ".kpt.json"
+
+
+class TrackWriter:
+    """เขียน keypoints ทีละเฟรม (frame ต้องเพิ่มขึ้นเรื่อย ๆ) รับ structured array KP_DTYPE จาก kp_post"""
+
+    def __init__(self, path, meta=None):
+        self.data_path, self.idx_path, self.meta_path = _paths(path)
+        self.meta = dict(meta or {})
+        self._f = open(self.data_path, "wb")
+        self._idx = []
+        self._idx_written = 0
+        self._n = 0
+        self._last_frame = -1
+        self._write_meta()
+        open(self.idx_path, "wb").close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @property
+    def n_rows(self):
+        return self._n
+
+    def append(self, frame, kps):
+        frame = int(frame)
+        if frame <= self._last_frame:
+            raise ValueError(f"frame ต้องเพิ่มขึ้น: {frame} หลัง {self._last_frame}")
+        self._last_frame = frame
+        self._idx.append((frame, self._n))
+        if kps is not None and kps.size:
+            rec = np.empty(kps.size, dtype=TRACK_DTYPE)
+            rec["frame"] = frame
+            rec["dog"] = kps["person"]
+            rec["kp"] = kps["kp"]
+            rec["x"] = kps["x"]
+            rec["y"] = kps["y"]
+            rec["conf"] = kps["conf"]
+            self._f.write(memoryview(rec).cast("B"))
+            self._n += rec.size
+        if len(self._idx) - self._idx_written >= INDEX_FLUSH_EVERY:
+            self._flush_index()
+
+    def _flush_index(self):
+        self._f.flush()
+        new = np.array(self._idx[self._idx_written:], dtype=IDX_DTYPE)
+        with open(self.idx_path, "ab") as f:
+            f.write(memoryview(new).cast("B"))
+        self._idx_written = len(self._idx)
+
+    def _write_meta(self, **extra):
+        meta = {**self.meta, **extra, "dtype": TRACK_DTYPE.descr}
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.meta_path)
+
+    def close(self):
+        if self._f.closed:
+            return
+        self._flush_index()
+        self._f.close()
+        self._write_meta(rows=self._n, frames=len(self._idx), complete=True)
+
+
+class TrackStore:
+    """อ่านไฟล์ .kpt แบบ memory map: query ตามช่วงเฟรม/จุด/หมา/conf โดยแตะเฉพาะหน้าที่ต้องใช้"""
+
+    def __init__(self, path):
+        self.data_path, self.idx_path, self.meta_path = _paths(path)
+        with open(self.meta_path, encoding="utf-8") as f:
+            self.meta = json.load(f)
+        n = os.path.getsize(self.data_path) // TRACK_DTYPE.itemsize
+        self.data = (np.memmap(self.data_path, dtype=TRACK_DTYPE, mode="r", shape=(n,))
+                     if n else np.empty(0, dtype=TRACK_DTYPE))
+        if self.meta.get("complete") and os.path.exists(self.idx_path):
+            idx = np.fromfile(self.idx_path, dtype=IDX_DTYPE)
+        else:
+            # process ตายก่อน close -> สร้างดัชนีใหม่จากคอลัมน์ frame (เฟรมที่ไม่มีจุดเลยจะไม่อยู่ในดัชนี)
+            idx = self._rebuild_index()
+        self.frames = idx["frame"]
+        self.starts = np.append(idx["start"], n)   # แถวของเฟรม i = [starts[i], starts[i+1])
+
+    def _rebuild_index(self):
+        f = np.asarray(self.data["frame"])
+        if f.size == 0:
+            return np.empty(0, dtype=IDX_DTYPE)
+        first = np.flatnonzero(np.r_[True, f[1:] != f[:-1]])
+        idx = np.empty(first.size, dtype=IDX_DTYPE)
+        idx["frame"] = f[first]
+        idx["start"] = first
+        return idx
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def n_frames(self):
+        return int(self.frames.size)
+
+    @property
+    def names(self):
+        return self.meta.get("names") or []
+
+    def _row_range(self, frame_start, frame_stop):
+        lo = 0 if frame_start is None else int(np.searchsorted(self.frames, frame_start, "left"))
+        hi = self.frames.size if frame_stop is None else int(np.searchsorted(self.frames, frame_stop, "left"))
+        return int(self.starts[lo]), int(self.starts[hi])
+
+    def query(self, frame_start=None, frame_stop=None, kps=None, dogs=None, min_conf=0.0):
+        """
+        คืน structured array (TRACK_DTYPE) ของเฟรมในช่วง [frame_start, frame_stop)
+        kps / dogs: รายการดัชนีจุด / หมาที่ต้องการ (None = ทั้งหมด), min_conf: conf ขั้นต่ำ
+        """
+        a, b = self._row_range(frame_start, frame_stop)
+        return _select(self.data[a:b], kps, dogs, min_conf)
+
+    def iter_chunks(self, rows=CSV_CHUNK_ROWS, frame_start=None, frame_stop=None, kps=None, dogs=None, min_conf=0.0):
+        """query เป็นก้อน ๆ ละประมาณ rows แถว ตัดที่ขอบเฟรม (ใช้ตอน export ไฟล์ใหญ่)"""
+        a, b = self._row_range(frame_start, frame_stop)
+        while a < b:
+            end = min(a + rows, b)
+            if end < b:
+                fi = int(np.searchsorted(self.starts, end, "right")) - 1
+                end = int(self.starts[fi]) if self.starts[fi] > a else int(self.starts[fi + 1])
+            yield _select(self.data[a:end], kps, dogs, min_conf)
+            a = end
+
+    def to_numpy(self, path, **query):
+        """บันทึกผล query เป็นไฟล์ .npy (structured array)"""
+        np.save(path, self.query(**query))
+        return path
+
+    def to_csv(self, path, with_names=True, **query):
+        """export เป็น CSV ทีละก้อน: frame, time_s, dog, kp, [name], x, y, conf"""
+        fps = float(self.meta.get("fps") or 0) or None
+        names = self.names
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["frame", "time_s", "dog", "kp"] + (["name"] if with_names else []) + ["x", "y", "conf"])
+            for chunk in self.iter_chunks(**query):
+                fr = chunk["frame"].tolist()
+                t = [round(x / fps, 4) for x in fr] if fps else [""] * len(fr)
+                kp = chunk["kp"].tolist()
+                cols = [fr, t, chunk["dog"].tolist(), kp]
+                if with_names:
+                    cols.append([kp_name(names, k) for k in kp])
+                # float64 ก่อนปัด ไม่งั้นได้เลขทศนิยมยาวจาก float32
+                cols += [np.round(chunk[c].astype(np.float64), d).tolist() for c, d in (("x", 2), ("y", 2), ("conf", 3))]
+                w.writerows(zip(*cols))
+        return path
@@ -0,0 +1,85 @@
+# label_atlas.py
+from collections import namedtuple
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# sprite ของป้าย 1 อัน: pixels [h,w,3] (BGR, กล่องพื้นหลังทึบทั้งกล่อง), ox/oy = offset มุมซ้ายบนเทียบกับจุด anchor
+Sprite = namedtuple("Sprite", ["pixels", "ox", "oy"])
+
+
+class LabelAtlas:
+    """แคช sprite ของป้ายข้อความ (กล่องดำ + ตัวหนังสือขาว) วาดด้วย PIL ครั้งเดียว แล้ว blit ลงเฟรม BGR ด้วย NumPy"""
+
+    def __init__(self, font_path=None, padding=3, fg=255, bg=0):
+        self.font_path = font_path
+        self.padding = int(padding)
+        self.fg = fg
+        self.bg = bg
+        self._fonts = {}
+        self._sprites = {}
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def font(self, size_px):
+        f = self._fonts.get(size_px)
+        if f is None:
+            f = None
+            if self.font_path:
+                try:
+                    f = ImageFont.truetype(self.font_path, size_px)
+                except Exception:
+                    f = None
+            if f is None:
+                f = ImageFont.load_default()
+            self._fonts[size_px] = f
+        return f
+
+    def _rasterize(self, text, size_px):
+        font = self.font(size_px)
+        probe = ImageDraw.Draw(Image.new("L", (1, 1)))
+        x1, y1, x2, y2 = probe.textbbox((0, 0), text, font=font)
+        p = self.padding
+        x1 -= p; y1 -= p
+        x2 += p; y2 += p
+
+        # กล่องของ PIL รวมขอบทั้งสองฝั่ง (inclusive) จึง +1
+        w, h = x2 - x1 + 1, y2 - y1 + 1
+        canvas = Image.new("L", (w, h), color=self.bg)
+        ImageDraw.Draw(canvas).text((-x1, -y1), text, font=font, fill=self.fg)
+
+        gray = np.asarray(canvas, dtype=np.uint8)
+        pixels = np.ascontiguousarray(np.repeat(gray[:, :, None], 3, axis=2))
+        return Sprite(pixels, x1, y1)
+
+    def get(self, text, size_px):
+        key = (text, int(size_px))
+        sp = self._sprites.get(key)
+        if sp is None:
+            sp = self._rasterize(text, int(size_px))
+            self._sprites[key] = sp
+        return sp
+
+    def warmup(self, names, size_px, show_index=(False, True)):
+        """สร้าง sprite ล่วงหน้าให้ครบทุกชื่อจุด × รูปแบบ show_index"""
+        for si in show_index:
+            for ki, name in enumerate(names):
+                self.get(f"{ki}: {name}" if si else name, size_px)
+        return len(self)
+
+    def blit(self, img_bgr, sprite, anchor_xy):
+        """วางป้ายลงภาพแบบ in-place (ตัดขอบตามขนาดภาพ); ป้ายทึบทั้งกล่อง -> copy ตรง ๆ ไม่ต้อง blend"""
+        H, W = img_bgr.shape[:2]
+        h, w = sprite.pixels.shape[:2]
+        x0 = int(anchor_xy[0]) + sprite.ox
+        y0 = int(anchor_xy[1]) + sprite.oy
+
+        fx1, fy1 = max(0, x0), max(0, y0)
+        fx2, fy2 = min(W, x0 + w), min(H, y0 + h)
+        if fx1 >= fx2 or fy1 >= fy2:
+            return img_bgr
+
+        sx1, sy1 = fx1 - x0, fy1 - y0
+        sx2, sy2 = sx1 + (fx2 - fx1), sy1 + (fy2 - fy1)
+        img_bgr[fy1:fy2, fx1:fx2] = sprite.pixels[sy1:sy2, sx1:sx2]
+        return img_bgr
@@ -0,0 +1,226 @@
+# live_stream.py
+"""
+โหมดสด (กล้อง / RTSP / ไฟล์ที่เล่นซ้ำตาม fps จริง):
+  LiveSource      : อ่านเฟรมใน thread แยก เก็บเฉพาะเฟรมล่าสุด เฟรมที่ไม่ทันถูกหยิบก็ทิ้งไป (ไม่มีคิวสะสม)
+  StrideController: ปรับ stride (ระยะห่างขั้นต่ำของเฟรมที่ส่งเข้าโมเดล) ให้งานต่อเฟรมพอดีกับงบเวลา stride / fps
+  iter_live       : หยิบเฟรมใหม่สุด -> ทำนาย -> วาด -> yield (ภาพ, รายงาน fps / drop rate / latency)
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from metrics import METRICS
+
+# ===== ค่าเริ่มต้นโหมดสด =====
+LIVE_TARGET_MS = float(os.getenv("POSE_LIVE_TARGET_MS", "300"))   # latency เป้าหมาย (จับภาพ -> วาดเสร็จ)
+# แหล่งภาพฝั่ง server ที่ผู้ใช้เว็บเลือกได้ (คั่นด้วย , เช่น "0,rtsp://cam1/stream") ; ว่าง = รับเฉพาะไฟล์อัปโหลด/กล้องของเบราว์เซอร์
+LIVE_SOURCES = [s.strip() for s in os.getenv("POSE_LIVE_SOURCES", "").split(",") if s.strip()]
+LIVE_MAX_STRIDE = 8          # stride สูงสุด (ส่งเข้าโมเดล 1 ใน N เฟรม)
+LIVE_EWMA_ALPHA = 0.2        # น้ำหนักค่าล่าสุดของ latency เฉลี่ย
+LIVE_LOW_WATER = 0.8         # งานต่อเฟรมต่ำกว่างบของ stride ที่เล็กลง × ค่านี้ -> ลด stride
+LIVE_COOLDOWN = 5            # รออย่างน้อยกี่เฟรมหลังเปลี่ยน stride ก่อนเปลี่ยนอีก (กันแกว่ง)
+LIVE_READ_TIMEOUT = 2.0      # ไม่มีเฟรมใหม่นานเกินนี้ (วินาที) = แหล่งภาพหลุด
+LATENCY_WINDOW = 300         # เก็บ latency ล่าสุดกี่เฟรมสำหรับ p50/p95
+
+
+def parse_source(source):
+    """"0" -> กล้องหมายเลข 0, นอกนั้น (rtsp://..., path ไฟล์) ส่งให้ cv2.VideoCapture ตรง ๆ"""
+    s = str(source).strip()
+    return int(s) if s.isdigit() else s
+
+
+class LiveSource:
+    """
+    อ่านเฟรมจาก cv2.VideoCapture ใน thread แยก เก็บไว้แค่เฟรมล่าสุด (seq, เวลาจับภาพ, เฟรม)
+    realtime=True: เล่นไฟล์ตาม fps จริง (จำลองกล้อง); None = เปิดเองเมื่อ source เป็นไฟล์ในเครื่อง
+    """
+
+    def __init__(self, source, realtime=None):
+        self.source = parse_source(source)
+        self.realtime = (isinstance(self.source, str) and os.path.exists(self.source)) if realtime is None else realtime
+        self._cap = cv2.VideoCapture(self.source)
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)   # กล้อง/RTSP: ไม่ให้ backend เก็บเฟรมเก่าค้างไว้
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = -1
+        self._ts = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self.ended = False
+        self.captured = 0
+        self._captured_counter = METRICS.counter("live_frames_captured")
+
+    def isOpened(self):
+        return self._cap.isOpened()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="live-source", daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        t0 = time.perf_counter()
+        n = 0
+        try:
+            while not self._stop.is_set():
+                ret, frame = self._cap.read()
+                if not ret:
+                    break
+                n += 1
+                if self.realtime:
+                    delay = t0 + n / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                with self._cond:
+                    self._frame, self._seq, self._ts = frame, self._seq + 1, time.perf_counter()
+                    self.captured += 1
+                    self._cond.notify_all()
+                self._captured_counter.inc()
+        finally:
+            with self._cond:
+                self.ended = True
+                self._cond.notify_all()
+
+    def latest(self, min_seq=0, timeout=LIVE_READ_TIMEOUT):
+        """รอจนมีเฟรมที่ seq >= min_seq แล้วคืนเฟรมใหม่สุด (seq, เวลาจับภาพ, เฟรม); None ถ้าหมด/หมดเวลา"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq >= min_seq or self.ended, timeout)
+            if self._seq < min_seq:
+                return None
+            return self._seq, self._ts, self._frame
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._cap.release()
+
+
+class StrideController:
+    """
+    งบเวลาต่อเฟรม = stride / fps ต้นทาง ; งานต่อเฟรม = อายุเฟรมตอนหยิบ + ทำนาย + วาด (EWMA)
+    งานเกินงบ -> เพิ่ม stride (เว้นระยะเท่าที่ไล่ทันจริง แทนการไล่ไม่ทันแล้วทิ้งเฟรมเอง)
+    งานต่ำกว่างบของ stride ที่เล็กลง × LIVE_LOW_WATER -> ลด stride
+    stride ไม่เกิน target × fps: การเว้นระยะต้องไม่ทำให้ภาพบนจอค้างนานกว่า latency เป้าหมาย
+    (latency ต่ำกว่าเวลาทำนาย 1 เฟรมไม่ได้ไม่ว่า stride เท่าไร -> ไม่ใช้ latency เทียบกับเป้าโดยตรง)
+    """
+
+    def __init__(self, fps, target_ms=LIVE_TARGET_MS, max_stride=LIVE_MAX_STRIDE, alpha=LIVE_EWMA_ALPHA,
+                 low_water=LIVE_LOW_WATER, cooldown=LIVE_COOLDOWN):
+        self.fps = max(float(fps), 1e-3)
+        self.target = float(target_ms) / 1000.0
+        self.max_stride = max(1, min(int(max_stride), int(self.target * self.fps)))
+        self.alpha = float(alpha)
+        self.low_water = float(low_water)
+        self.cooldown = int(cooldown)
+        self.stride = 1
+        self.ewma = None
+        self._since_change = 0
+
+    def budget(self, stride=None):
+        return (stride or self.stride) / self.fps
+
+    def update(self, busy_s):
+        self.ewma = busy_s if self.ewma is None else self.alpha * busy_s + (1 - self.alpha) * self.ewma
+        self._since_change += 1
+        if self._since_change >= self.cooldown:
+            if self.ewma > self.budget() and self.stride < self.max_stride:
+                self.stride += 1
+                self._since_change = 0
+            elif self.stride > 1 and self.ewma < self.budget(self.stride - 1) * self.low_water:
+                self.stride -= 1
+                self._since_change = 0
+        return self.stride
+
+
+class LiveReport:
+    """สถิติระหว่างรัน: fps ที่ทำได้, สัดส่วนเฟรมที่ถูกทิ้ง, latency p50/p95 + สัดส่วนที่อยู่ใต้เป้า, stride ปัจจุบัน"""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.processed = 0
+        self._latency = deque(maxlen=LATENCY_WINDOW)
+        self._processed_counter = METRICS.counter("live_frames_processed")
+
+    def add(self, latency_s):
+        self.processed += 1
+        self._latency.append(latency_s)
+        self._processed_counter.inc()
+        METRICS.observe_stage("live.latency", latency_s)
+
+    def snapshot(self, source, controller):
+        dt = max(time.perf_counter() - self.t0, 1e-9)
+        lat = np.array(self._latency, dtype=np.float64) * 1000
+        captured = max(source.captured, 1)
+        return {
+            "fps": round(self.processed / dt, 2),
+            "source_fps": round(float(source.fps), 2),
+            "captured": source.captured,
+            "processed": self.processed,
+            "drop_rate": round(1 - min(self.processed, captured) / captured, 3),
+            "latency_ms_p50": round(float(np.percentile(lat, 50)), 1) if lat.size else None,
+            "latency_ms_p95": round(float(np.percentile(lat, 95)), 1) if lat.size else None,
+            "target_ms": round(controller.target * 1000, 1),
+            "on_target": round(float((lat <= controller.target * 1000).mean()), 3) if lat.size else None,
+            "stride": controller.stride,
+            "frame_budget_ms": round(controller.budget() * 1000, 1),
+        }
+
+
+def iter_live(source, predict_batch, render, target_ms=LIVE_TARGET_MS, realtime=None, stop=None):
+    """
+    predict_batch(frames_bgr) -> results ; render(r, frame_bgr) -> ภาพที่วาดแล้ว
+    yield (ภาพที่วาดแล้ว, รายงาน dict) ทุกเฟรมที่ทำนาย จนแหล่งภาพหมด/หลุด หรือ stop (threading.Event) ถูก set
+    """
+    src = LiveSource(source, realtime)
+    if not src.isOpened():
+        src.stop()
+        raise IOError(f"เปิดแหล่งภาพไม่ได้: {source}")
+    src.start()
+    ctl = StrideController(src.fps, target_ms)
+    report = LiveReport()
+    last_seq = -1
+    try:
+        while stop is None or not stop.is_set():
+            got = src.latest(last_seq + ctl.stride)
+            if got is None:
+                break
+            seq, ts, frame = got
+            last_seq = seq
+            with METRICS.span("live.predict"):
+                r = predict_batch([frame])[0]
+            with METRICS.span("live.render"):
+                plotted = render(r, frame)
+            latency = time.perf_counter() - ts
+            report.add(latency)
+            ctl.update(latency)
+            yield plotted, report.snapshot(src, ctl)
+    finally:
+        src.stop()
+
+
+if __name__ == "__main__":
+    # ทดสอบโหมดสดด้วยไฟล์ที่เล่นซ้ำตาม fps จริง: python live_stream.py clip.mp4 [target_ms ...]
+    import sys
+    import json
+    from set_modal import predict_frames_bgr, render_frame_kps_bgr, MIN_KP_CONF_DEFAULT
+    from video_io import fit_size
+
+    path = sys.argv[1]
+    targets = [float(t) for t in sys.argv[2:]] or [LIVE_TARGET_MS]
+    predict = lambda frames: predict_frames_bgr(frames, 0.5)
+
+    def render(r, frame):
+        size = fit_size(frame.shape[1], frame.shape[0], 1280)
+        return render_frame_kps_bgr(r, frame, False, MIN_KP_CONF_DEFAULT, size=size)[0]
+
+    for target in targets:
+        last = None
+        for _plotted, last in iter_live(path, predict, render, target):
+            pass
+        print(json.dumps(last))
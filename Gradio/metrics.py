@@ -0,0 +1,209 @@
+# metrics.py
+import atexit
+import bisect
+import csv
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ===== ค่าเริ่มต้นของ metrics =====
+METRICS_HOST = os.getenv("POSE_METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("POSE_METRICS_PORT", "9108"))   # 0 = ไม่เปิด endpoint
+TRACE_CSV = os.getenv("POSE_TRACE_CSV")                      # ตั้ง path เพื่อเก็บทุก span ลง CSV
+TRACE_FLUSH_EVERY = 256                                      # เขียนลงไฟล์ทุก N แถว
+
+# ขอบ bucket (วินาที) แบบเดียวกับ Prometheus: สะสมจากน้อยไปมาก
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "n", "_lock")
+
+    def __init__(self, bounds=SECONDS_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)   # ช่องสุดท้าย = +Inf
+        self.total = 0.0
+        self.n = 0
+        self._lock = threading.Lock()
+
+    def observe(self, v):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += v
+            self.n += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.n
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class _TraceWriter:
+    """เขียน span ลง CSV แบบ buffer (ts, stage, duration_ms, thread); แถวที่ค้างใน buffer เขียนให้ตอนปิดโปรแกรม (atexit)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._rows = []
+        self._lock = threading.Lock()
+        new = not os.path.exists(path)
+        self._f = open(path, "a", newline="", encoding="utf-8")
+        self._w = csv.writer(self._f)
+        if new:
+            self._w.writerow(["ts", "stage", "duration_ms", "thread"])
+        atexit.register(self.close)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._rows.append((round(time.time(), 6), stage, round(seconds * 1000, 4), threading.get_ident()))
+            if len(self._rows) >= TRACE_FLUSH_EVERY:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self._f.closed:
+            return
+        self._w.writerows(self._rows)
+        self._rows.clear()
+        self._f.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._f.close()
+
+
+class Metrics:
+    """เก็บ histogram ของเวลาแต่ละ stage + ตัวนับ แล้วแสดงเป็นข้อความแบบ Prometheus"""
+
+    def __init__(self, prefix="pose", trace_csv=TRACE_CSV):
+        self.prefix = prefix
+        self._stages = {}
+        self._hists = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._trace = _TraceWriter(trace_csv) if trace_csv else None
+
+    def stage(self, name):
+        h = self._stages.get(name)
+        if h is None:
+            with self._lock:
+                h = self._stages.setdefault(name, Histogram(SECONDS_BUCKETS))
+        return h
+
+    def histogram(self, name, bounds=COUNT_BUCKETS):
+        h = self._hists.get(name)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(name, Histogram(bounds))
+        return h
+
+    def counter(self, name):
+        c = self._counters.get(name)
+        if c is None:
+            with self._lock:
+                c = self._counters.setdefault(name, Counter())
+        return c
+
+    def observe_stage(self, name, seconds):
+        self.stage(name).observe(seconds)
+        if self._trace is not None:
+            self._trace.add(name, seconds)
+
+    def span(self, name):
+        """with METRICS.span("infer.predict"): ... -> จับเวลาเข้า histogram ของ stage นั้น"""
+        return _Span(self, name)
+
+    def render(self):
+        p = self.prefix
+        lines = [f"# TYPE {p}_stage_seconds histogram"]
+        for name, h in sorted(self._stages.items()):
+            lines += _hist_lines(f"{p}_stage_seconds", h, f'stage="{name}"')
+        for name, h in sorted(self._hists.items()):
+            lines.append(f"# TYPE {p}_{name} histogram")
+            lines += _hist_lines(f"{p}_{name}", h, "")
+        for name, c in sorted(self._counters.items()):
+            lines.append(f"# TYPE {p}_{name}_total counter")
+            lines.append(f"{p}_{name}_total {c.value}")
+        if self._trace is not None:
+            self._trace.flush()
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    __slots__ = ("m", "name", "t0")
+
+    def __init__(self, m, name):
+        self.m = m
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.m.observe_stage(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+def _hist_lines(metric, h, labels):
+    counts, total, n = h.snapshot()
+    sep = "," if labels else ""
+    out, acc = [], 0
+    for bound, c in zip(h.bounds, counts):
+        acc += c
+        out.append(f'{metric}_bucket{{{labels}{sep}le="{bound}"}} {acc}')
+    out.append(f'{metric}_bucket{{{labels}{sep}le="+Inf"}} {n}')
+    lbl = f"{{{labels}}}" if labels else ""
+    out.append(f"{metric}_sum{lbl} {total:.6f}")
+    out.append(f"{metric}_count{lbl} {n}")
+    return out
+
+
+METRICS = Metrics()
+
+
+def start_http_server(port=METRICS_PORT, host=METRICS_HOST, metrics=METRICS):
+    """เปิด endpoint /metrics (text/plain แบบ Prometheus) ใน daemon thread; port=0 = ไม่เปิด"""
+    if not port:
+        return None
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, int(port)), _Handler)
+    except OSError as e:   # เช่น port ถูกใช้อยู่ (รันหลาย instance) -> ทำงานต่อได้ แค่ไม่มี /metrics
+        print(f"[metrics] เปิด http://{host}:{port}/metrics ไม่ได้ ({e}); ตั้ง POSE_METRICS_PORT เป็นค่าอื่น หรือ 0 เพื่อปิด")
+        return None
+    threading.Thread(target=server.serve_forever, name="pose-metrics", daemon=True).start()
+    print(f"[metrics] http://{host}:{port}/metrics")
+    return server
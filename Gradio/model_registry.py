@@ -0,0 +1,106 @@
+# model_registry.py
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from backends import export_backend, load_model, warmup, BACKEND_DEFAULT
+
+# ===== ค่าเริ่มต้นของ registry =====
+MAX_LOADED_MODELS = 3                 # จำนวน checkpoint ที่เก็บไว้ในหน่วยความจำพร้อมกัน (LRU)
+RUNS_GLOB = "runs/pose/*/weights/*.pt"
+
+
+class ModelRegistry:
+    """
+    โหลดโมเดลตอนใช้งานครั้งแรก (lazy) + warm-up แล้วเก็บไว้แบบ LRU หลาย checkpoint
+    replica: สำเนาแยกของ checkpoint เดียวกัน (หนึ่งต่อ worker ของ worker_pool) เพราะ predictor ใช้ร่วมข้าม thread ไม่ได้
+    export ของ checkpoint เดียวกันทำทีละครั้ง (ล็อกต่อ path × backend) แล้วทุก replica โหลดจากไฟล์ที่ export เสร็จแล้ว
+    """
+
+    def __init__(self, default_path, search_root=None, max_models=MAX_LOADED_MODELS, backend=BACKEND_DEFAULT,
+                 replicas=1):
+        self.default_path = str(default_path)
+        self.search_root = Path(search_root) if search_root else None
+        self.max_models = max(1, int(max_models))
+        self.backend = backend
+        self.replicas = max(1, int(replicas))
+        self._models = OrderedDict()   # (path, backend, replica) -> model
+        self._lock = threading.Lock()
+        self._loading = {}             # (path, backend, replica) -> Lock (กันโหลดไฟล์เดียวกันซ้ำพร้อมกัน)
+        self._exporting = {}           # (path, backend) -> Lock (กันหลาย replica export ทับไฟล์เดียวกัน)
+        self._factories = {}           # (name, backend) -> factory ของโมเดลที่ register ไว้ (ไม่ถูก evict)
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0}
+
+    def available(self):
+        """รายชื่อ weights ที่เลือกได้: default + runs/pose/*/weights/*.pt (ถ้ามี)"""
+        found = [self.default_path]
+        if self.search_root is not None:
+            for p in sorted(self.search_root.glob(RUNS_GLOB)):
+                s = str(p)
+                if s not in found:
+                    found.append(s)
+        return found
+
+    def loaded(self):
+        with self._lock:
+            return list(dict.fromkeys(k[0] for k in self._models))
+
+    def clear(self):
+        """ทิ้งโมเดลที่โหลดไว้ทั้งหมด (เช่น เปลี่ยนการแบ่งคอร์ของ worker -> replica ต้องโหลดใหม่ใน thread ที่ผูกคอร์ใหม่)"""
+        with self._lock:
+            self._models.clear()
+
+    def _evict(self):
+        # ความจุนับเป็นโมเดลในหน่วยความจำ: max_models checkpoint × replicas (ไม่นับโมเดลที่ register ไว้)
+        evictable = [k for k in self._models if k[:2] not in self._factories]
+        while len(evictable) > self.max_models * self.replicas:
+            del self._models[evictable.pop(0)]
+            self.stats["evictions"] += 1
+
+    def register(self, name, factory, backend=None):
+        """
+        ใส่โมเดลที่ไม่มีไฟล์ weights (เช่น โมเดลสุ่มสำหรับ benchmark): factory() -> โมเดลใหม่ 1 ตัว
+        แต่ละ replica เรียก factory ของตัวเองตอนใช้ครั้งแรก ; โมเดลที่ register ไว้ไม่ถูก evict
+        คืน replica 0 (โหลด + warm-up แล้ว)
+        """
+        with self._lock:
+            self._factories[(str(name), backend or self.backend)] = factory
+        return self.get(name, backend)
+
+    def _export_lock(self, path, backend):
+        with self._lock:
+            return self._exporting.setdefault((path, backend), threading.Lock())
+
+    def get(self, path=None, backend=None, replica=0):
+        key = (str(path or self.default_path), backend or self.backend, int(replica))
+        with self._lock:
+            m = self._models.get(key)
+            if m is not None:
+                self._models.move_to_end(key)
+                self.stats["hits"] += 1
+                return m
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                m = self._models.get(key)
+                if m is not None:  # thread อื่นโหลดเสร็จระหว่างรอ
+                    self._models.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return m
+                factory = self._factories.get(key[:2])
+            if factory is not None:
+                m = warmup(factory())
+            elif not Path(key[0]).exists():
+                raise FileNotFoundError(f"ไม่พบไฟล์ weights: {key[0]}")
+            else:
+                with self._export_lock(*key[:2]):
+                    export_backend(key[0], key[1])
+                # โหลดใน thread ที่เรียก (worker ที่ผูกคอร์ไว้แล้ว) -> thread ของ backend อยู่ในชุดคอร์เดียวกัน
+                m = warmup(load_model(key[0], key[1]))   # export เสร็จแล้ว -> load_model ใช้ไฟล์เดิม
+            with self._lock:
+                self._models[key] = m
+                self.stats["loads"] += 1
+                self._evict()
+                self._loading.pop(key, None)
+            return m
@@ -0,0 +1,58 @@
+# pose_results.py
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+
+def _to_numpy(t):
+    return t.cpu().numpy() if hasattr(t, "cpu") else np.asarray(t)
+
+
+def result_numpy(r):
+    """ผลลัพธ์ Ultralytics -> (boxes [N,6] (x1,y1,x2,y2,conf,cls), kpts [N,K,3] (x,y,conf)) เป็น float32"""
+    boxes = getattr(r, "boxes", None) if r is not None else None
+    kps = getattr(r, "keypoints", None) if r is not None else None
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 6), np.float32), np.zeros((0, 0, 3), np.float32)
+
+    b = _to_numpy(boxes.data).astype(np.float32)
+    if kps is None:
+        return b, np.zeros((b.shape[0], 0, 3), np.float32)
+    k = _to_numpy(kps.data).astype(np.float32)
+    if k.shape[-1] == 2:  # โมเดลที่ไม่มี conf ต่อจุด
+        k = np.concatenate([k, np.ones(k.shape[:2] + (1,), np.float32)], axis=-1)
+    return b, k
+
+
+def build_result(template, orig_img, boxes, kpts):
+    """สร้าง Results ใหม่ (วาดด้วย r.plot() ได้) จาก numpy โดยยืม path/names จากผลลัพธ์ต้นแบบ"""
+    has_kpts = kpts.shape[0] > 0 and kpts.shape[1] > 0
+    return Results(
+        orig_img,
+        path=getattr(template, "path", ""),
+        names=template.names,
+        boxes=torch.from_numpy(np.array(boxes, dtype=np.float32)),
+        keypoints=torch.from_numpy(np.array(kpts, dtype=np.float32)) if has_kpts else None,
+    )
+
+
+def scale_result(r, orig_img, sx, sy):
+    """ย้ายผลลัพธ์ไปอยู่บนภาพที่ย่อ/ขยายแล้ว (orig_img): คูณพิกัด x ด้วย sx, y ด้วย sy (จุด (0,0) = ไม่มี คงเดิม)"""
+    boxes, kpts = result_numpy(r)
+    boxes[:, [0, 2]] *= sx
+    boxes[:, [1, 3]] *= sy
+    if kpts.shape[1]:
+        kpts[..., 0] *= sx
+        kpts[..., 1] *= sy
+    return build_result(r, orig_img, boxes, kpts)
+
+
+def filter_by_conf(r, conf):
+    """กรองผลลัพธ์ที่ทำนายไว้ที่ conf ต่ำสุด ให้เหลือเฉพาะกล่องที่ conf >= ค่าที่เลือก"""
+    if r is None:
+        return None
+    boxes, kpts = result_numpy(r)
+    keep = boxes[:, 4] >= float(conf) if len(boxes) else np.zeros(0, dtype=bool)
+    if keep.all():
+        return r
+    return build_result(r, r.orig_img, boxes[keep], kpts[keep] if len(kpts) else kpts)
@@ -0,0 +1,113 @@
+# pred_cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from pose_results import result_numpy
+
+# ===== ค่าเริ่มต้นของแคชผลทำนาย =====
+CACHE_CONF_FLOOR = 0.10               # ทำนายที่ conf ต่ำสุดของ slider แล้วค่อยกรองตามค่าที่ผู้ใช้เลือก
+CACHE_MAX_BYTES = 512 * 1024 * 1024   # งบหน่วยความจำรวมของแคช
+
+
+def image_key(img):
+    """hash จากเนื้อภาพ (รวม shape/dtype) -> ภาพเดียวกันได้ key เดิม ไม่ว่าจะมาจาก upload หรือปุ่ม"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((img.shape, img.dtype.str)).encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+def _result_nbytes(r):
+    boxes, kpts = result_numpy(r)
+    img = getattr(r, "orig_img", None)
+    return boxes.nbytes + kpts.nbytes + (img.nbytes if img is not None else 0) + 1024
+
+
+class PredictionCache:
+    """แคชผลทำนายดิบแบบ LRU จำกัดจำนวนไบต์ พร้อมตัวนับ hit/miss (request ซ้ำที่มาระหว่างกำลังทำนายรอผลตัวแรก)"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict()   # key -> (result, nbytes)
+        self._bytes = 0
+        self._inflight = {}           # key -> Future ของการทำนายที่กำลังรันอยู่
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, r):
+        n = _result_nbytes(r)
+        if n > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (r, n)
+            self._bytes += n
+            while self._bytes > self.max_bytes and self._items:
+                _k, (_r, sz) = self._items.popitem(last=False)
+                self._bytes -= sz
+                self.evictions += 1
+
+    def get_or_predict(self, key, predict):
+        """คืนผลจากแคช หรือเรียก predict() แล้วเก็บไว้; key เดียวกันที่กำลังทำนายอยู่ -> รอผล (หรือ exception) ของตัวแรก"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.coalesced += 1
+        if not owner:
+            return fut.result()
+        try:
+            r = predict()
+            if r is not None:
+                self.put(key, r)   # เก็บลงแคชก่อนถอด in-flight -> request ถัดไปเจอผลในแคชเสมอ
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(r)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return r
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "coalesced": self.coalesced,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
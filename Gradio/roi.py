@@ -0,0 +1,180 @@
+# roi.py
+import numpy as np
+
+from pose_results import result_numpy, build_result
+
+# ===== ค่าเริ่มต้นโหมด ROI (ครอปรอบตัวหมาจากเฟรมก่อนหน้า) =====
+ROI_PAD_RATIO = 0.35        # ขยายกล่องออกไปกี่เท่าของขนาดกล่อง (เผื่อหมาขยับ)
+ROI_MIN_SIDE = 192          # ด้านสั้นสุดของครอป (px) กันครอปเล็กเกินไป
+ROI_FULL_EVERY = 30         # สแกนทั้งเฟรมทุก N เฟรม (หาตัวใหม่ที่เพิ่งเข้ากล้อง)
+ROI_MAX_AREA_RATIO = 0.6    # ถ้าครอปรวมใหญ่เกินสัดส่วนนี้ของเฟรม ให้รันทั้งเฟรมไปเลย
+ROI_NMS_IOU = 0.5           # กล่องซ้ำจากครอปที่ติดกัน
+
+
+def _pad_rects(boxes, W, H, pad_ratio, min_side):
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    hw = np.maximum((x2 - x1) * (1 + 2 * pad_ratio), min_side) / 2
+    hh = np.maximum((y2 - y1) * (1 + 2 * pad_ratio), min_side) / 2
+    rects = np.stack([cx - hw, cy - hh, cx + hw, cy + hh], axis=1)
+    rects = np.round(rects).astype(np.int64)
+    rects[:, [0, 2]] = np.clip(rects[:, [0, 2]], 0, W)
+    rects[:, [1, 3]] = np.clip(rects[:, [1, 3]], 0, H)
+    return rects
+
+
+def _merge_rects(rects):
+    """รวมครอปที่ซ้อนกันให้เป็นครอปเดียว (วนจนไม่มีคู่ไหนซ้อนกัน)"""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged and len(rects) > 1:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
+
+def _nms(boxes, iou_thr):
+    """NMS แบบง่ายบน boxes [N,6] -> index ที่เก็บไว้ (เรียงตาม conf)"""
+    order = np.argsort(-boxes[:, 4])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        area = lambda b: (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+        iou = inter / np.maximum(area(boxes[i]) + area(boxes[rest]) - inter, 1e-6)
+        order = rest[iou <= iou_thr]
+    return np.array(sorted(keep), dtype=np.int64)
+
+
+def plan_crops(boxes, W, H, pad_ratio=ROI_PAD_RATIO, min_side=ROI_MIN_SIDE):
+    """กล่องหมา (พิกัดภาพเต็ม) -> รายการครอป [x1,y1,x2,y2] ที่ขยายขอบแล้วและไม่ซ้อนกัน"""
+    return _merge_rects(_pad_rects(boxes, W, H, pad_ratio, min_side))
+
+
+def combine_crop_results(frame_input, crop_results, rects):
+    """ผลลัพธ์ของแต่ละครอป (ลำดับเดียวกับ rects) -> Results เดียวในพิกัดภาพเต็ม (None ถ้าทุกครอปเป็น None)"""
+    all_b, all_k = [], []
+    template = None
+    for cr, (x1, y1, _x2, _y2) in zip(crop_results, rects):
+        if cr is None:
+            continue
+        if template is None:
+            template = cr
+        b, k = result_numpy(cr)
+        if len(b) == 0:
+            continue
+        b[:, [0, 2]] += x1
+        b[:, [1, 3]] += y1
+        if k.shape[1]:
+            # จุดที่โมเดลให้เป็น (0,0) แปลว่าไม่มี ห้ามเลื่อน
+            vis = (k[..., 0] != 0) | (k[..., 1] != 0)
+            k[..., 0] = np.where(vis, k[..., 0] + x1, 0)
+            k[..., 1] = np.where(vis, k[..., 1] + y1, 0)
+        all_b.append(b)
+        all_k.append(k)
+    if template is None:
+        return None
+    if all_b:
+        boxes = np.concatenate(all_b)
+        kpts = np.concatenate(all_k)
+        keep = _nms(boxes, ROI_NMS_IOU)
+        boxes, kpts = boxes[keep], kpts[keep]
+    else:
+        boxes = np.zeros((0, 6), np.float32)
+        kpts = np.zeros((0, 0, 3), np.float32)
+    return build_result(template, frame_input, boxes, kpts)
+
+
+class RoiPredictor:
+    """
+    ตัวทำนายแบบ predict_batch(frames_bgr) -> results ที่ครอปรอบกล่องหมาของเฟรมก่อนหน้า
+    แล้วแปลงพิกัดกลับเป็นพิกัดเฟรมเต็ม; สแกนทั้งเฟรมเป็นระยะ หรือเมื่อหมาหาย
+    """
+
+    def __init__(self, predict_fn, to_input=None, pad_ratio=ROI_PAD_RATIO, min_side=ROI_MIN_SIDE,
+                 full_every=ROI_FULL_EVERY, max_area_ratio=ROI_MAX_AREA_RATIO):
+        self.predict_fn = predict_fn  # list ของภาพ BGR -> list ของ Results
+        self.to_input = to_input or (lambda frame_bgr: frame_bgr)
+        self.pad_ratio = float(pad_ratio)
+        self.min_side = int(min_side)
+        self.full_every = max(1, int(full_every))
+        self.max_area_ratio = float(max_area_ratio)
+        self._boxes = None          # กล่องล่าสุด (พิกัดเฟรมเต็ม)
+        self._since_full = 0
+        self._force_full = True
+        self.stats = {"full_frames": 0, "roi_frames": 0, "lost": 0}
+
+    def _plan(self, W, H):
+        """คืนรายการครอป [x1,y1,x2,y2] หรือ None (= ต้องสแกนทั้งเฟรม)"""
+        if self._force_full or self._boxes is None or len(self._boxes) == 0:
+            return None
+        if self._since_full >= self.full_every:
+            return None
+        rects = plan_crops(self._boxes, W, H, self.pad_ratio, self.min_side)
+        area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects)
+        if area > self.max_area_ratio * W * H:
+            return None
+        return rects
+
+    def _remember(self, r, n_expected=None):
+        boxes, _ = result_numpy(r)
+        if n_expected is not None and len(boxes) < n_expected:
+            self._force_full = True  # บางตัวหลุดจากครอป -> เฟรมถัดไปสแกนทั้งเฟรม
+            self.stats["lost"] += 1
+        if len(boxes):
+            self._boxes = boxes
+
+    def _predict_full(self, frames):
+        results = self.predict_fn(frames)
+        self.stats["full_frames"] += len(frames)
+        self._since_full = 0
+        self._force_full = False
+        return results
+
+    def _predict_rois(self, frames, rects):
+        crops = [f[y1:y2, x1:x2] for f in frames for (x1, y1, x2, y2) in rects]
+        crop_results = self.predict_fn(crops)
+        n_rect = len(rects)
+        out = [combine_crop_results(self.to_input(frame), crop_results[fi * n_rect:(fi + 1) * n_rect], rects)
+               for fi, frame in enumerate(frames)]
+        self.stats["roi_frames"] += len(frames)
+        return out
+
+    def __call__(self, frames):
+        if not frames:
+            return []
+        H, W = frames[0].shape[:2]
+        rects = self._plan(W, H)
+        n_expected = None
+        if rects is None:
+            results = self._predict_full(frames)
+        else:
+            n_expected = len(self._boxes)
+            results = self._predict_rois(frames, rects)
+            # เฟรมที่ไม่เจอหมาเลยในครอป -> สแกนทั้งเฟรมใหม่ทันที
+            empty = [i for i, r in enumerate(results) if r is None or len(result_numpy(r)[0]) == 0]
+            if empty:
+                self.stats["lost"] += len(empty)
+                redo = self._predict_full([frames[i] for i in empty])
+                for i, r in zip(empty, redo):
+                    results[i] = r
+            else:
+                self._since_full += len(frames)
+        if results:
+            self._remember(results[-1], n_expected=n_expected)
+        return results
@@ -2,8 +2,17 @@
 from pathlib import Path
 import numpy as np
 import cv2
-from PIL import Image, ImageDraw, ImageFont
-from ultralytics import YOLO
+
+from model_registry import ModelRegistry
+from pred_cache import PredictionCache, image_key, CACHE_CONF_FLOOR
+from pose_results import filter_by_conf, scale_result
+from batch_scheduler import BatchScheduler
+from worker_pool import POOL_WORKERS, core_slices, pinned_init
+from metrics import METRICS
+from label_atlas import LabelAtlas
+from kp_post import extract_keypoints, rows_from_keypoints, make_table, kp_name, KP_DTYPE
+from cascade import Cascade
+from backends import model_imgsz
 
 # ===== ตั้งค่าโมเดล =====
 MODEL_PATH = "best.pt"  # เปลี่ยน path ตามเครื่องหมี่เกี๊ยว
@@ -41,176 +50,154 @@ KEYPOINT_NAMES = [
 def _auto_font_scale(w, h):
     return 0.35
 
-def _get_font(scale):
-    size_px = max(12, int(FONT_SIZE_BASE * scale))
-    if FONT_PATH:
-        try:
-            return ImageFont.truetype(FONT_PATH, size_px)
-        except Exception:
-            pass
-    return ImageFont.load_default()
-
-def _put_label_pil(img_bgr, text, anchor_xy, font_scale):
-    """วาดกล่องดำ + ข้อความไทย (PIL) แล้วคืน BGR"""
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    pil_img = Image.fromarray(img_rgb)
-    draw = ImageDraw.Draw(pil_img)
-    font = _get_font(font_scale)
-
-    x, y = int(anchor_xy[0]), int(anchor_xy[1])
-    x1, y1, x2, y2 = draw.textbbox((x, y), text, font=font)
-
-    x1 -= BG_PADDING; y1 -= BG_PADDING
-    x2 += BG_PADDING; y2 += BG_PADDING
-
-    W, H = pil_img.size
-    x1 = max(0, x1); y1 = max(0, y1)
-    x2 = min(W - 1, x2); y2 = min(H - 1, y2)
-
-    draw.rectangle([(x1, y1), (x2, y2)], fill=(0, 0, 0))
-    draw.text((x, y), text, font=font, fill=(255, 255, 255))
-    return cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
-
-# ===== โหลดโมเดลครั้งเดียว =====
-model = YOLO(MODEL_PATH)
-try:
-    model.to(0)  # CUDA ถ้ามี
-except Exception:
-    pass  # ไม่มีก็วิ่งบน CPU
-
-def infer(image, conf: float, show_index: bool, min_kp_conf: float = MIN_KP_CONF_DEFAULT):
-    """ภาพนิ่ง: รับ PIL.Image -> (out_img [RGB np.ndarray], table(list) หรือ None)"""
-    if image is None:
-        return None, None
+def _font_px(scale):
+    return max(12, int(FONT_SIZE_BASE * scale))
 
-    img_rgb = np.array(image.convert("RGB"))
-    results = model.predict(img_rgb, conf=conf, verbose=False)
-    if not results or results[0] is None:
-        return None, None
-    r = results[0]
+# ===== แคช sprite ป้ายชื่อ (rasterize ครั้งเดียวต่อ ข้อความ × ขนาดฟอนต์) =====
+LABEL_ATLAS = LabelAtlas(FONT_PATH, BG_PADDING)
+LABEL_ATLAS.warmup(KEYPOINT_NAMES, _font_px(_auto_font_scale(0, 0)))
 
-    try:
-        plotted = r.plot()  # BGR
-    except Exception:
-        plotted = cv2.cvtColor(img_rgb.copy(), cv2.COLOR_RGB2BGR)
+# ===== registry ของโมเดล: โหลดตอนใช้ครั้งแรก + warm-up, เก็บหลาย checkpoint แบบ LRU =====
+# (เลือก backend ด้วย ENV POSE_BACKEND: torch / onnx / openvino / openvino-int8)
+# ===== worker pool: POSE_WORKERS worker แต่ละตัวมีโมเดลของตัวเอง ผูกกับชุดคอร์ของตัวเอง (worker_pool.py) =====
+WORKER_SLICES = core_slices(POOL_WORKERS)
+MODELS = ModelRegistry(MODEL_PATH, search_root=Path(__file__).resolve().parent.parent, replicas=len(WORKER_SLICES))
 
-    H, W = plotted.shape[:2]
-    fscale = _auto_font_scale(W, H)
-    rows = []
-
-    if getattr(r, "keypoints", None) is None:
-        img_out = cv2.cvtColor(plotted, cv2.COLOR_BGR2RGB)
-        headers = ["บุคคล", "ดัชนีจุด", "ชื่อจุด (ไทย)", "x", "y", "conf"]
-        table = [headers] + rows if rows else None
-        return img_out, table
-
-    kps_xy = r.keypoints.xy  # [N,K,2]
-    kps_conf = getattr(r.keypoints, "conf", None)
-
-    kps_xy = kps_xy.cpu().numpy() if hasattr(kps_xy, "cpu") else np.asarray(kps_xy)
-    if kps_conf is not None:
-        kps_conf = kps_conf.cpu().numpy() if hasattr(kps_conf, "cpu") else np.asarray(kps_conf)
-
-    def _get_conf(pi, ki):
-        if kps_conf is None:
-            return None
-        val = kps_conf[pi, ki]
-        try:
-            val = float(np.squeeze(val))
-        except Exception:
-            return None
-        if np.isnan(val):
-            return None
-        return val
-
-    N, K = kps_xy.shape[:2]
-    for pi in range(N):
-        for ki in range(K):
-            x, y = kps_xy[pi, ki, 0], kps_xy[pi, ki, 1]
-            if np.isnan(x) or np.isnan(y):
-                continue
-
-            name = KEYPOINT_NAMES[ki] if ki < len(KEYPOINT_NAMES) else f"จุด {ki}"
-            if name.strip().lower() == "null":
-                continue
-
-            conf_k = _get_conf(pi, ki)
-            if (conf_k is None) or (float(conf_k) < float(min_kp_conf)):
-                continue
-
-            cv2.circle(plotted, (int(x), int(y)), CIRCLE_RADIUS, (255, 255, 255), -1, lineType=cv2.LINE_AA)
-            label_text = f"{ki}: {name}" if show_index else name
-            tx = min(W - 1, int(x) + 6)
-            ty = max(0, int(y) - 6)
-            plotted = _put_label_pil(plotted, label_text, (tx, ty), fscale)
-
-            rows.append([int(pi), int(ki), name, round(float(x), 2), round(float(y), 2), round(float(conf_k), 3)])
-
-    img_out = cv2.cvtColor(plotted, cv2.COLOR_BGR2RGB)
-    headers = ["บุคคล", "ดัชนีจุด", "ชื่อจุด (ไทย)", "x", "y", "conf"]
-    table = [headers] + rows if rows else None
-    return img_out, table
-
-def infer_frame_bgr(frame_bgr, conf: float, show_index: bool, min_kp_conf: float = MIN_KP_CONF_DEFAULT):
-    """สำหรับวิดีโอ: รับ BGR frame -> คืน BGR frame ที่วาดแล้ว + rows (ต่อเฟรม)"""
-    img_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
-    results = model.predict(img_rgb, conf=conf, verbose=False)
-    if not results or results[0] is None:
-        return frame_bgr, []
-
-    r = results[0]
-    try:
-        plotted = r.plot()  # BGR
-    except Exception:
-        plotted = frame_bgr.copy()
+def get_model(model_name=None, replica=0):
+    """model_name = path ของ weights (None = MODEL_PATH); replica = หมายเลข worker"""
+    return MODELS.get(model_name, replica=replica)
 
-    H, W = plotted.shape[:2]
-    fscale = _auto_font_scale(W, H)
-    rows = []
+# ===== micro-batching: รวม request จากหลายผู้ใช้เป็น forward pass เดียว (ปรับด้วย POSE_BATCH_MAX / POSE_BATCH_WAIT_MS) =====
+def _predict_batch(imgs, conf, model_name, imgsz=None, worker=0):
+    # ส่ง imgsz ทุกครั้ง: predictor ของ ultralytics จำ args ของการเรียกก่อนหน้าไว้ (เช่น imgsz ของ cascade)
+    model = get_model(model_name, worker)
+    return list(model.predict(imgs, conf=conf, verbose=False, imgsz=imgsz or model_imgsz(model)))
 
-    if getattr(r, "keypoints", None) is None:
-        return plotted, rows
+SCHEDULER = BatchScheduler(_predict_batch, workers=len(WORKER_SLICES),
+                           worker_init=pinned_init(WORKER_SLICES) if len(WORKER_SLICES) > 1 else None)
 
-    kps_xy = r.keypoints.xy
-    kps_conf = getattr(r.keypoints, "conf", None)
+def _run_model(imgs, conf: float, model_name=None, imgsz=None):
+    """ทุกการเรียกโมเดลผ่าน scheduler -> list ผลลัพธ์ (ยาวเท่า imgs)"""
+    return SCHEDULER.predict(imgs, conf, model_name or MODEL_PATH, imgsz)
 
-    kps_xy = kps_xy.cpu().numpy() if hasattr(kps_xy, "cpu") else np.asarray(kps_xy)
-    if kps_conf is not None:
-        kps_conf = kps_conf.cpu().numpy() if hasattr(kps_conf, "cpu") else np.asarray(kps_conf)
+# ===== cascade: รันที่ความละเอียดต่ำก่อน ขยับไปครอป/ความละเอียดสูงเฉพาะภาพที่ไม่มั่นใจ (cascade.py) =====
+CASCADE = Cascade()
 
-    def _get_conf(pi, ki):
-        if kps_conf is None:
-            return None
-        val = kps_conf[pi, ki]
+def _predict_maybe_cascade(imgs, conf: float, model_name=None, cascade=False, imgsz=None):
+    if not cascade:
+        return _run_model(imgs, conf, model_name, imgsz)
+    return CASCADE(lambda ims, imgsz: _run_model(ims, conf, model_name, imgsz), imgs)
+
+# ===== แคชผลทำนายภาพนิ่ง (ปรับ conf / show_index ไม่ต้องรันโมเดลใหม่) =====
+PRED_CACHE = PredictionCache()
+
+def _predict_cached(img, conf: float, model_name=None, cascade=False):
+    key = (image_key(img), model_name or MODEL_PATH, MODELS.backend, bool(cascade))
+
+    def _run():
+        return _predict_maybe_cascade([img], min(CACHE_CONF_FLOOR, conf), model_name, cascade)[0]
+
+    return filter_by_conf(PRED_CACHE.get_or_predict(key, _run), conf)
+
+def _draw_keypoints(plotted, kps, show_index: bool):
+    """วาดจุด + ป้ายชื่อ ลงภาพ BGR แบบ in-place ตามลำดับแถวของ kps (KP_DTYPE)"""
+    if kps.size == 0:
+        return plotted
+    H, W = plotted.shape[:2]
+    size_px = _font_px(_auto_font_scale(W, H))
+    xs = kps["x"].astype(np.int32).tolist()
+    ys = kps["y"].astype(np.int32).tolist()
+    for ki, x, y in zip(kps["kp"].tolist(), xs, ys):
+        cv2.circle(plotted, (x, y), CIRCLE_RADIUS, (255, 255, 255), -1, lineType=cv2.LINE_AA)
+        name = kp_name(KEYPOINT_NAMES, ki)
+        label_text = f"{ki}: {name}" if show_index else name
+        tx = min(W - 1, x + 6)
+        ty = max(0, y - 6)
+        LABEL_ATLAS.blit(plotted, LABEL_ATLAS.get(label_text, size_px), (tx, ty))
+    return plotted
+
+_FRAMES = METRICS.counter("frames_processed")
+_DOGS = METRICS.counter("dogs_detected")
+_KPTS = METRICS.counter("keypoints_drawn")
+
+def _render_result(r, fallback_bgr, show_index: bool, min_kp_conf: float):
+    """แกนร่วมของ infer/infer_frame_bgr: ผลลัพธ์ 1 ภาพ -> (plotted BGR, kps KP_DTYPE)"""
+    with METRICS.span("render.plot"):
         try:
-            val = float(np.squeeze(val))
+            plotted = r.plot()  # BGR
         except Exception:
-            return None
-        if np.isnan(val):
-            return None
-        return val
-
-    N, K = kps_xy.shape[:2]
-    for pi in range(N):
-        for ki in range(K):
-            x, y = kps_xy[pi, ki, 0], kps_xy[pi, ki, 1]
-            if np.isnan(x) or np.isnan(y):
-                continue
-
-            name = KEYPOINT_NAMES[ki] if ki < len(KEYPOINT_NAMES) else f"จุด {ki}"
-            if name.strip().lower() == "null":
-                continue
-
-            conf_k = _get_conf(pi, ki)
-            if (conf_k is None) or (float(conf_k) < float(min_kp_conf)):
-                continue
-
-            cv2.circle(plotted, (int(x), int(y)), CIRCLE_RADIUS, (255, 255, 255), -1, lineType=cv2.LINE_AA)
-            label_text = f"{ki}: {name}" if show_index else name
-            tx = min(W - 1, int(x) + 6)
-            ty = max(0, int(y) - 6)
-            plotted = _put_label_pil(plotted, label_text, (tx, ty), fscale)
-
-            rows.append([int(pi), int(ki), name, round(float(x), 2), round(float(y), 2), round(float(conf_k), 3)])
-
-    return plotted, rows
+            plotted = fallback_bgr()
+    with METRICS.span("render.postprocess"):
+        kps = extract_keypoints(r, min_kp_conf, KEYPOINT_NAMES)
+    with METRICS.span("render.labels"):
+        _draw_keypoints(plotted, kps, show_index)
+    boxes = getattr(r, "boxes", None)
+    _FRAMES.inc()
+    _DOGS.inc(len(boxes) if boxes is not None else 0)
+    _KPTS.inc(int(kps.size))
+    return plotted, kps
+
+def infer(image, conf: float, show_index: bool, min_kp_conf: float = MIN_KP_CONF_DEFAULT,
+          model_name=None, cascade=False):
+    """ภาพนิ่ง: รับ PIL.Image -> (out_img [RGB np.ndarray], table(list) หรือ None); cascade=True ใช้โหมด cascade"""
+    if image is None:
+        return None, None
+
+    with METRICS.span("infer.total"):
+        with METRICS.span("infer.to_array"):
+            # ultralytics ถือว่า numpy เป็น BGR (แบบ cv2.imread ตอนเทรน) -> r.plot() ได้ BGR จริง
+            img_bgr = cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+        with METRICS.span("infer.predict"):
+            r = _predict_cached(img_bgr, conf, model_name, cascade)
+        if r is None:
+            return None, None
+
+        plotted, kps = _render_result(r, img_bgr.copy, show_index, min_kp_conf)
+        with METRICS.span("infer.to_rgb"):
+            img_out = cv2.cvtColor(plotted, cv2.COLOR_BGR2RGB)
+        return img_out, make_table(rows_from_keypoints(kps, KEYPOINT_NAMES))
+
+def to_model_input(frame_bgr):
+    """เฟรมในรูปแบบที่ส่งเข้า model.predict: ultralytics รับ numpy เป็น BGR อยู่แล้ว จึงไม่ต้องแปลงสี (ไม่ copy)"""
+    return frame_bgr
+
+def predict_frames_bgr(frames_bgr, conf: float, model_name=None, cascade=False, imgsz=None):
+    """
+    ทำนายหลายเฟรม (BGR) ใน model.predict ครั้งเดียว -> list ผลลัพธ์ (ยาวเท่าจำนวนเฟรม, None ถ้าไม่มี)
+    imgsz = ขนาด inference (None = ขนาดของโมเดล); โหมด cascade ใช้ขนาดของ cascade เอง
+    """
+    if not frames_bgr:
+        return []
+    with METRICS.span("frame.predict"):
+        return _predict_maybe_cascade([to_model_input(f) for f in frames_bgr], conf, model_name, cascade, imgsz)
+
+def render_frame_kps_bgr(r, frame_bgr, show_index: bool, min_kp_conf: float = MIN_KP_CONF_DEFAULT, size=None):
+    """
+    วาดผลลัพธ์ของ 1 เฟรม -> (BGR frame ที่วาดแล้ว, kps KP_DTYPE) ไม่สร้างแถวตาราง
+    size=(w, h): ย่อเฟรมครั้งเดียวก่อนวาด แล้วแปลงพิกัดผลลัพธ์ตามไปด้วย (kps ที่คืนเป็นพิกัดของขนาดนี้)
+    """
+    H, W = frame_bgr.shape[:2]
+    if size is not None and tuple(size) != (W, H):
+        with METRICS.span("frame.resize"):
+            frame_bgr = cv2.resize(frame_bgr, tuple(size), interpolation=cv2.INTER_AREA)
+            if r is not None:
+                r = scale_result(r, frame_bgr, size[0] / W, size[1] / H)
+    if r is None:
+        return frame_bgr, np.empty(0, dtype=KP_DTYPE)
+    with METRICS.span("frame.render"):
+        return _render_result(r, frame_bgr.copy, show_index, min_kp_conf)
+
+def render_frame_bgr(r, frame_bgr, show_index: bool, min_kp_conf: float = MIN_KP_CONF_DEFAULT):
+    """วาดผลลัพธ์ของ 1 เฟรม -> (BGR frame ที่วาดแล้ว, rows)"""
+    plotted, kps = render_frame_kps_bgr(r, frame_bgr, show_index, min_kp_conf)
+    return plotted, rows_from_keypoints(kps, KEYPOINT_NAMES)
+
+def infer_frame_bgr(frame_bgr, conf: float, show_index: bool, min_kp_conf: float = MIN_KP_CONF_DEFAULT,
+                    roi=None, model_name=None, cascade=False):
+    """
+    สำหรับวิดีโอ: รับ BGR frame -> คืน BGR frame ที่วาดแล้ว + rows (ต่อเฟรม)
+    roi: RoiPredictor (ถ้ามี) จะครอปรอบหมาจากเฟรมก่อนหน้าแทนการรันทั้งเฟรม
+    """
+    with METRICS.span("infer_frame.total"):
+        r = roi([frame_bgr])[0] if roi is not None else predict_frames_bgr([frame_bgr], conf, model_name, cascade)[0]
+        return render_frame_bgr(r, frame_bgr, show_index, min_kp_conf)
@@ -0,0 +1,269 @@
+# video_io.py
+"""
+อ่าน/เขียนวิดีโอผ่าน ffmpeg pipe โดยไม่สร้าง array ใหม่ทุกเฟรม
+  FFmpegReader: decode เป็น bgr24 ลง buffer ที่จองไว้ล่วงหน้า (ring) และข้ามเฟรมตาม stride ตั้งแต่ใน ffmpeg
+                (select ก่อนแปลง pixel format -> เฟรมที่ไม่ใช้ไม่ถูกแปลงสี/ไม่ถูกส่งผ่าน pipe)
+  FFmpegWriter: ส่งเฟรม BGR เข้า encoder ผ่าน memoryview (ffmpeg แปลงเป็น yuv420p เอง ไม่ต้อง cvtColor/tobytes)
+ใช้แทน cv2.VideoCapture ได้ตรง ๆ (read / isOpened / get / release)
+"""
+import json
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+VIDEO_IO = os.getenv("POSE_VIDEO_IO", "ffmpeg")   # "ffmpeg" หรือ "cv2" (ตัวอ่านเดิม)
+
+
+def has_ffmpeg():
+    return shutil.which("ffmpeg") is not None and shutil.which("ffprobe") is not None
+
+
+def h264_encode_args(fps, width, height, pix_fmt="bgr24"):
+    """อาร์กิวเมนต์ ffmpeg ส่วนรับ raw frame ทาง stdin + encode H.264 (ใช้ร่วมกันทั้ง MP4 และ HLS)"""
+    # บังคับให้กว้าง/สูงเป็นเลขคู่และใช้ yuv420p เพื่อความเข้ากันได้
+    vf = "scale=trunc(iw/2)*2:trunc(ih/2)*2,format=yuv420p"
+    return [
+        "-f", "rawvideo", "-vcodec", "rawvideo",
+        "-pix_fmt", pix_fmt,
+        "-s", f"{width}x{height}",
+        "-r", f"{max(1.0, float(fps))}",
+        "-i", "-",
+        "-an",
+        "-vf", vf,
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-pix_fmt", "yuv420p",
+    ]
+
+
+def fit_size(width, height, long_side=None):
+    """ขนาดที่ด้านยาวไม่เกิน long_side (คงสัดส่วน, เลขคู่สำหรับ yuv420p); ไม่ขยายภาพ, None/0 = ขนาดเดิม"""
+    if not long_side or max(width, height) <= long_side:
+        return int(width), int(height)
+    s = long_side / max(width, height)
+    return max(2, int(width * s) // 2 * 2), max(2, int(height * s) // 2 * 2)
+
+
+def _kill(proc):
+    """ฆ่า process ของ ffmpeg ที่ยังรันอยู่ ปิด stdin แล้วรอให้จบ (ไม่ทิ้ง zombie)"""
+    if proc.poll() is None:
+        proc.kill()
+    try:
+        proc.stdin.close()
+    except Exception:
+        pass
+    proc.wait()
+
+
+def write_frame(f, frame):
+    """เขียนเฟรมลง pipe (unbuffered) ผ่าน memoryview; วนจนครบเพราะ write อาจเขียนได้ไม่หมดในครั้งเดียว"""
+    mv = memoryview(np.ascontiguousarray(frame)).cast("B")   # ไม่ copy ถ้า contiguous อยู่แล้ว
+    while mv:
+        n = f.write(mv)
+        mv = mv[n:]
+
+
+def _rotation(st):
+    """มุมหมุนของ stream (องศา): side data display matrix (ffmpeg ใหม่) หรือ tag rotate (ไฟล์/ffmpeg เก่า)"""
+    for sd in st.get("side_data_list") or []:
+        if "rotation" in sd:
+            try:
+                return int(float(sd["rotation"]))
+            except (TypeError, ValueError):
+                pass
+    try:
+        return int(float((st.get("tags") or {}).get("rotate", 0)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def probe(path):
+    """
+    ffprobe -> dict(width, height, fps, frames, rotation) ของ video stream แรก (frames = 0 ถ้าไม่รู้)
+    width/height เป็นขนาดหลังหมุนแล้ว เพราะ ffmpeg หมุนเฟรมตาม metadata ให้เอง (autorotate) เหมือน cv2
+    """
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=width,height,avg_frame_rate,r_frame_rate,nb_frames:stream_tags=rotate"
+           ":stream_side_data=rotation",
+           "-of", "json", path]
+    out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    st = json.loads(out)["streams"][0]
+
+    def _rate(s):
+        try:
+            num, den = (float(x) for x in str(s).split("/"))
+            return num / den if den else 0.0
+        except ValueError:
+            return 0.0
+
+    fps = _rate(st.get("avg_frame_rate")) or _rate(st.get("r_frame_rate")) or 25.0
+    try:
+        frames = int(st.get("nb_frames") or 0)
+    except ValueError:
+        frames = 0
+    width, height = int(st["width"]), int(st["height"])
+    rotation = _rotation(st)
+    if rotation % 180:   # 90/270: คลิปมือถือแนวตั้ง -> pipe ส่งเฟรมขนาดสลับกว้าง/สูง
+        width, height = height, width
+    return {"width": width, "height": height, "fps": fps, "frames": frames, "rotation": rotation}
+
+
+class FFmpegReader:
+    """
+    ตัวอ่านแบบ cv2.VideoCapture ที่ decode ผ่าน ffmpeg ลง ring ของ buffer ที่จองไว้
+    เฟรมที่ read() คืนมาเป็น view ของ buffer -> ใช้ได้ถึงการ read() อีก n_buffers ครั้งถัดไป
+    (ผู้เรียกต้องตั้ง n_buffers >= จำนวนเฟรมที่ค้างอยู่ใน pipeline พร้อมกัน ดู video_pipeline.frames_in_flight)
+    stride > 1: ffmpeg ส่งมาเฉพาะเฟรม 0, stride, 2*stride, ... (self.stride ใช้แปลงลำดับกลับเป็นเลขเฟรมต้นฉบับ)
+    """
+
+    def __init__(self, path, stride=1, n_buffers=16, info=None):
+        self.info = info or probe(path)
+        self.width, self.height = self.info["width"], self.info["height"]
+        self.stride = max(1, int(stride))
+        cmd = ["ffmpeg", "-v", "error", "-nostdin", "-i", path, "-map", "0:v:0"]
+        if self.stride > 1:
+            cmd += ["-vf", f"select=not(mod(n\\,{self.stride}))", "-vsync", "passthrough"]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+        # bufsize=0: readinto ลง buffer ของเราโดยตรง ไม่ผ่าน buffer ของ Python อีกชั้น
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+        self._bufs = [np.empty((self.height, self.width, 3), np.uint8) for _ in range(max(2, int(n_buffers)))]
+        self._views = [memoryview(b).cast("B") for b in self._bufs]
+        self._i = 0
+        self._eof = False
+
+    def isOpened(self):
+        return not self._eof
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.info["fps"])
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.info["frames"])
+        return 0.0
+
+    def read(self):
+        if self._eof:
+            return False, None
+        mv = self._views[self._i]
+        got, size = 0, len(mv)
+        while got < size:
+            n = self.proc.stdout.readinto(mv[got:])
+            if not n:
+                self._eof = True
+                return False, None
+            got += n
+        frame = self._bufs[self._i]
+        self._i = (self._i + 1) % len(self._bufs)
+        return True, frame
+
+    def release(self):
+        self._eof = True
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
+
+
+class FFmpegWriter:
+    """encode เฟรม BGR เป็น MP4/H.264 (เล่นบนเบราว์เซอร์ได้) ผ่าน stdin ของ ffmpeg"""
+
+    def __init__(self, out_path, fps, width, height, extra_args=("-movflags", "+faststart")):
+        self.path = out_path
+        cmd = ["ffmpeg", "-y", "-loglevel", "error"] + h264_encode_args(fps, width, height) + list(extra_args) + [out_path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=0)
+        self._closed = False
+
+    def write(self, frame_bgr):
+        write_frame(self.proc.stdin, frame_bgr)
+
+    def close(self):
+        self._closed = True
+        try:
+            self.proc.stdin.close()
+        except Exception:
+            pass
+        return self.proc.wait()
+
+    def abort(self):
+        """ยกเลิกกลางทาง (ผู้ใช้กดหยุด/error): ฆ่า ffmpeg แล้วลบไฟล์ที่เขียนไม่ครบ; ไม่ทำอะไรถ้า close() ไปแล้ว"""
+        if self._closed:
+            return
+        self._closed = True
+        _kill(self.proc)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def open_reader(path, stride=1, n_buffers=16):
+    """FFmpegReader ถ้าใช้ได้ ไม่งั้น cv2.VideoCapture (ฝั่งผู้เรียกใช้ stride กรองเองเหมือนเดิม)"""
+    if VIDEO_IO == "ffmpeg" and has_ffmpeg():
+        try:
+            return FFmpegReader(path, stride=stride, n_buffers=n_buffers)
+        except (subprocess.CalledProcessError, KeyError, IndexError, ValueError) as e:
+            print(f"[video_io] ffprobe อ่าน {path} ไม่ได้ ({e}) -> ใช้ cv2.VideoCapture")
+    return cv2.VideoCapture(path)
+
+
+if __name__ == "__main__":
+    # เทียบ decode -> encode: cv2.VideoCapture + cvtColor + tobytes (ทางเดิม) vs FFmpegReader + FFmpegWriter
+    #   python video_io.py clip.mp4 [stride]
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+
+    path = sys.argv[1]
+    stride = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    def _old(out):
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        W, H = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cmd = ["ffmpeg", "-y", "-loglevel", "error"] + h264_encode_args(fps / stride, W, H, "rgb24") + [out]
+        p = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        n = i = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            if i % stride == 0:
+                p.stdin.write(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).tobytes())
+                n += 1
+            i += 1
+        cap.release()
+        p.stdin.close()
+        p.wait()
+        return n
+
+    def _new(out):
+        rd = FFmpegReader(path, stride=stride, n_buffers=4)
+        wr = FFmpegWriter(out, rd.info["fps"] / stride, rd.width, rd.height)
+        n = 0
+        while True:
+            ok, frame = rd.read()
+            if not ok:
+                break
+            wr.write(frame)
+            n += 1
+        rd.release()
+        wr.close()
+        return n
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in (("cv2+cvtColor+tobytes", _old), ("ffmpeg zero-copy", _new)):
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            n = fn(os.path.join(tmp, f"{name[:3]}.mp4"))
+            dt = time.perf_counter() - t0
+            _cur, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:24s} {n} frames  {n / dt:7.1f} fps  peak python alloc {peak / 2**20:7.1f} MB")
@@ -0,0 +1,217 @@
+# video_pipeline.py
+import queue
+import threading
+
+from metrics import METRICS
+
+# ===== ค่าเริ่มต้นของ pipeline =====
+BATCH_SIZE_DEFAULT = 4     # จำนวนเฟรมต่อ model.predict หนึ่งครั้ง
+QUEUE_BATCHES = 2          # ขนาดคิว (หน่วย = batch) ระหว่างแต่ละ stage -> คุมหน่วยความจำ/backpressure
+MAX_FRAMES_UNKNOWN = 2000  # ถ้าไม่รู้จำนวนเฟรม ให้หยุดที่เท่านี้ (เหมือนลูปเดิม)
+
+_END = object()
+
+
+def frames_in_flight(batch_size=BATCH_SIZE_DEFAULT, queue_batches=QUEUE_BATCHES):
+    """จำนวนเฟรมสูงสุดที่ iter_annotated_frames ถือพร้อมกัน (คิว 2 ช่วง + batch ที่กำลังทำนาย + ตัวที่รอ put/วาด)
+    ใช้กำหนดจำนวน buffer ของ video_io.FFmpegReader"""
+    qsize = max(1, int(batch_size) * int(queue_batches))
+    return 2 * qsize + int(batch_size) + 2
+
+
+class _StageError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _put(q, item, stop):
+    """put แบบ block แต่ยอมออกเมื่อมีการสั่งหยุด (กัน thread ค้างตอนปลายทางเลิกอ่าน)"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _decode_stage(cap, stride, total, q_out, stop):
+    # ตัวอ่านที่ข้ามเฟรมเองใน decoder (video_io.FFmpegReader) มี .stride -> เลขเฟรมต้นฉบับเพิ่มทีละ step
+    step = getattr(cap, "stride", 1)
+    try:
+        frame_idx = 0
+        while not stop.is_set():
+            with METRICS.span("video.decode"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            if stride <= 1 or frame_idx % stride == 0:
+                if not _put(q_out, (frame_idx, frame), stop):
+                    return
+            frame_idx += step
+            if total == 0 and frame_idx > MAX_FRAMES_UNKNOWN:
+                break
+    except Exception as e:
+        _put(q_out, _StageError(e), stop)
+    finally:
+        _put(q_out, _END, stop)
+
+
+def _infer_stage(predict_batch, batch_size, q_in, q_out, stop):
+    try:
+        pending = None
+        while pending is None:
+            # เติม batch ให้เต็มก่อนส่งเข้าโมเดล (หรือจนกว่าวิดีโอจะหมด)
+            batch = []
+            while len(batch) < batch_size:
+                item = _get(q_in, stop)
+                if item is _END or isinstance(item, _StageError):
+                    pending = item
+                    break
+                batch.append(item)
+            if batch:
+                results = predict_batch([f for _, f in batch])
+                for (i, f), r in zip(batch, results):
+                    if not _put(q_out, (i, f, r), stop):
+                        return
+        _put(q_out, pending, stop)
+    except Exception as e:
+        _put(q_out, _StageError(e), stop)
+
+
+def iter_annotated_frames(cap, predict_batch, render, stride=1, total=0,
+                          batch_size=BATCH_SIZE_DEFAULT, queue_batches=QUEUE_BATCHES):
+    """
+    pipeline 3 stage: decode (thread) -> inference เป็น batch (thread) -> render (thread ผู้เรียก)
+    yield (frame_idx, plotted_bgr, rows) ตามลำดับเฟรมเดิม; ผู้เรียกเป็นคน encode/เขียนไฟล์
+    """
+    batch_size = max(1, int(batch_size))
+    stride = max(1, int(stride))
+    qsize = max(1, batch_size * int(queue_batches))
+    q_dec = queue.Queue(maxsize=qsize)
+    q_inf = queue.Queue(maxsize=qsize)
+    stop = threading.Event()
+
+    workers = [
+        threading.Thread(target=_decode_stage, args=(cap, stride, total, q_dec, stop), daemon=True),
+        threading.Thread(target=_infer_stage, args=(predict_batch, batch_size, q_dec, q_inf, stop), daemon=True),
+    ]
+    for t in workers:
+        t.start()
+
+    try:
+        while True:
+            item = q_inf.get()
+            if item is _END:
+                break
+            if isinstance(item, _StageError):
+                raise item.exc
+            idx, frame, r = item
+            plotted, rows = render(r, frame)
+            yield idx, plotted, rows
+    finally:
+        stop.set()
+        for t in workers:
+            t.join(timeout=5)
+
+
+def _iter_decoded(cap, stride, total, qsize):
+    """อ่านเฟรมใน thread แยก (คิวจำกัดขนาด) -> yield (frame_idx, frame)"""
+    q = queue.Queue(maxsize=qsize)
+    stop = threading.Event()
+    t = threading.Thread(target=_decode_stage, args=(cap, stride, total, q, stop), daemon=True)
+    t.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _END:
+                break
+            if isinstance(item, _StageError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        t.join(timeout=5)
+
+
+def iter_keyframe_frames(cap, predict_batch, render, propagator, interval, total=0, stats=None,
+                         queue_size=8):
+    """
+    โหมด keyframe: รันโมเดลเฉพาะทุก interval เฟรม เฟรมระหว่างกลางต่อ keypoints ด้วย propagator
+    ถ้าคุณภาพการตามต่ำเกินไปจะรันโมเดลใหม่ที่เฟรมนั้นทันที; ได้ผลลัพธ์ครบทุกเฟรม (fps เท่าต้นฉบับ)
+    stats (dict) จะถูกอัปเดต: frames, model_calls, refreshes
+    """
+    interval = max(1, int(interval))
+    stats = stats if stats is not None else {}
+    stats.update(frames=0, model_calls=0, refreshes=0)
+    since_key = interval
+    for idx, frame in _iter_decoded(cap, 1, total, queue_size):
+        r = None
+        if since_key < interval and propagator.ready:
+            r, _quality = propagator.step(frame)
+            if r is None:
+                stats["refreshes"] += 1
+        if r is None:
+            r = predict_batch([frame])[0]
+            stats["model_calls"] += 1
+            since_key = 0
+            if r is not None:
+                propagator.reset(frame, r)
+        since_key += 1
+        stats["frames"] += 1
+        plotted, rows = render(r, frame)
+        yield idx, plotted, rows
+
+
+def iter_annotated_frames_serial(cap, predict_batch, render, stride=1, total=0):
+    """ลูปแบบเดิม (อ่าน -> ทำนายทีละเฟรม -> วาด) ไว้เทียบผล/ความเร็วกับ pipeline"""
+    stride = max(1, int(stride))
+    step = getattr(cap, "stride", 1)
+    frame_idx = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if stride <= 1 or frame_idx % stride == 0:
+            r = predict_batch([frame])[0]
+            plotted, rows = render(r, frame)
+            yield frame_idx, plotted, rows
+        frame_idx += step
+        if total == 0 and frame_idx > MAX_FRAMES_UNKNOWN:
+            break
+
+
+if __name__ == "__main__":
+    # เทียบความเร็วลูปเดิม vs pipeline บนคลิปในเครื่อง: python video_pipeline.py clip.mp4 [batch]
+    import sys
+    import time
+    import cv2
+    from set_modal import predict_frames_bgr, render_frame_bgr, MIN_KP_CONF_DEFAULT
+
+    path = sys.argv[1]
+    bs = int(sys.argv[2]) if len(sys.argv) > 2 else BATCH_SIZE_DEFAULT
+    predict = lambda frames: predict_frames_bgr(frames, 0.5)
+    render = lambda r, f: render_frame_bgr(r, f, False, MIN_KP_CONF_DEFAULT)
+
+    for name, make in (
+        ("serial", lambda cap: iter_annotated_frames_serial(cap, predict, render)),
+        (f"pipeline(batch={bs})", lambda cap: iter_annotated_frames(cap, predict, render, batch_size=bs)),
+    ):
+        cap = cv2.VideoCapture(path)
+        t0 = time.perf_counter()
+        n = 0
+        for _idx, plotted, _rows in make(cap):
+            cv2.cvtColor(plotted, cv2.COLOR_BGR2RGB).tobytes()  # จำลองงาน encode
+            n += 1
+        dt = time.perf_counter() - t0
+        cap.release()
+        print(f"{name:>20}: {n} frames in {dt:.2f}s -> {n / max(dt, 1e-9):.1f} fps")
@@ -0,0 +1,141 @@
+# video_stream.py
+"""
+เอาต์พุตวิดีโอแบบทยอยส่ง: encode เป็น HLS (ชิ้น .ts ยาว ~1 วินาที) ระหว่างที่ยังประมวลผลเฟรมอยู่
+แล้วส่งแต่ละชิ้นให้ gr.Video(streaming=True) ทันทีที่ ffmpeg เขียนเสร็จ -> เริ่มเล่นได้ในไม่กี่วินาที
+จบแล้วรวมชิ้นเป็น MP4 ไฟล์เดียว (copy stream ไม่ encode ซ้ำ) สำหรับดาวน์โหลด
+"""
+import os
+import shutil
+import subprocess
+import time
+
+from video_io import h264_encode_args, write_frame, _kill
+
+HLS_SEGMENT_SEC = float(os.getenv("POSE_HLS_SEGMENT_SEC", "1.0"))   # ความยาวต่อชิ้น (วินาที)
+PLAYLIST_NAME = "index.m3u8"
+
+
+class HlsSegmentWriter:
+    """
+    เขียนเฟรม BGR เข้า stdin ของ ffmpeg ที่ตัดเป็นชิ้น HLS
+    new_segments() คืน path ของชิ้นที่เขียนเสร็จแล้ว (ที่อยู่ใน playlist) ที่ยังไม่เคยคืน
+    """
+
+    def __init__(self, out_dir, fps, width, height, segment_sec=HLS_SEGMENT_SEC):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.playlist = os.path.join(out_dir, PLAYLIST_NAME)
+        seg = max(0.5, float(segment_sec))
+        cmd = ["ffmpeg", "-y", "-loglevel", "error"] + h264_encode_args(fps, width, height) + [
+            # ไม่มี lookahead/B-frame ค้างใน encoder และมี keyframe ทุกต้นชิ้น -> ชิ้นปิดได้ตรงเวลา
+            "-tune", "zerolatency",
+            "-force_key_frames", f"expr:gte(t,n_forced*{seg})",
+            "-f", "hls",
+            "-hls_time", f"{seg}",
+            "-hls_list_size", "0",
+            "-hls_segment_type", "mpegts",
+            "-hls_segment_filename", os.path.join(out_dir, "seg_%05d.ts"),
+            self.playlist,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=0)
+        self.stdin = self.proc.stdin
+        self._emitted = 0
+        self._mtime = None
+        self.t0 = time.perf_counter()
+        self.first_segment_s = None   # เวลาจากเริ่มถึงชิ้นแรกพร้อมส่ง
+        self._closed = False
+
+    def write(self, frame_bgr):
+        write_frame(self.stdin, frame_bgr)
+
+    def _listed(self):
+        try:
+            with open(self.playlist, encoding="utf-8") as f:
+                return [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+        except FileNotFoundError:
+            return []
+
+    def new_segments(self):
+        # เช็ก mtime ก่อน (ถูกกว่าอ่านไฟล์ทุกเฟรม)
+        try:
+            mtime = os.stat(self.playlist).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        if mtime == self._mtime:
+            return []
+        self._mtime = mtime
+        names = self._listed()
+        out = [os.path.join(self.out_dir, n) for n in names[self._emitted:]]
+        self._emitted = len(names)
+        if out and self.first_segment_s is None:
+            self.first_segment_s = time.perf_counter() - self.t0
+        return out
+
+    def close(self):
+        """ปิด stdin รอ ffmpeg จบ -> ชิ้นที่เหลือ (รวมชิ้นสุดท้ายที่สั้นกว่า segment_sec)"""
+        self._closed = True
+        try:
+            self.stdin.close()
+        except Exception:
+            pass
+        self.proc.wait()
+        self._mtime = None
+        return self.new_segments()
+
+    def abort(self):
+        """ยกเลิกกลางทาง: ฆ่า ffmpeg แล้วลบโฟลเดอร์ชิ้น HLS ที่ไม่ครบ; ไม่ทำอะไรถ้า close() ไปแล้ว"""
+        if self._closed:
+            return
+        self._closed = True
+        _kill(self.proc)
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def remux_mp4(self, out_mp4):
+        """รวมทุกชิ้นเป็น MP4 (+faststart) แบบ copy stream -> path หรือ None ถ้าไม่สำเร็จ"""
+        cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", self.playlist,
+               "-c", "copy", "-movflags", "+faststart", out_mp4]
+        ok = subprocess.run(cmd).returncode == 0
+        return out_mp4 if ok and os.path.exists(out_mp4) else None
+
+
+if __name__ == "__main__":
+    # เทียบเวลาถึงภาพแรกที่เล่นได้: MP4 ไฟล์เดียว vs HLS ทีละชิ้น
+    #   python video_stream.py [W] [H] [จำนวนเฟรม]
+    import sys
+    import tempfile
+
+    import numpy as np
+
+    W = int(sys.argv[1]) if len(sys.argv) > 1 else 1280
+    H = int(sys.argv[2]) if len(sys.argv) > 2 else 720
+    N = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+    FPS = 25.0
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (H, W, 3), dtype=np.uint8)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        mp4 = os.path.join(tmp, "full.mp4")
+        p = subprocess.Popen(["ffmpeg", "-y", "-loglevel", "error"] + h264_encode_args(FPS, W, H)
+                             + ["-movflags", "+faststart", mp4], stdin=subprocess.PIPE, bufsize=0)
+        for i in range(N):
+            write_frame(p.stdin, np.roll(base, 4 * i, axis=1))
+        p.stdin.close()
+        p.wait()
+        t_mp4 = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        w = HlsSegmentWriter(os.path.join(tmp, "hls"), FPS, W, H)
+        n_seg = 0
+        for i in range(N):
+            w.write(np.roll(base, 4 * i, axis=1))
+            n_seg += len(w.new_segments())
+        n_seg += len(w.close())
+        t_hls = time.perf_counter() - t0
+        w.remux_mp4(os.path.join(tmp, "remux.mp4"))
+        t_remux = time.perf_counter() - t0 - t_hls
+
+    print(f"{W}x{H}, {N} frames")
+    print(f"  mp4 : first frame {t_mp4:.2f}s, total {t_mp4:.2f}s")
+    print(f"  hls : first segment {w.first_segment_s or float('nan'):.2f}s, total {t_hls:.2f}s "
+          f"({n_seg} segments, remux {t_remux:.2f}s)")
@@ -0,0 +1,51 @@
+# worker_pool.py
+"""
+แบ่งคอร์ CPU ให้ worker ของ BatchScheduler: แต่ละ worker มีโมเดลของตัวเอง (ModelRegistry replica)
+ผูกกับชุดคอร์ของตัวเอง และตั้งจำนวน thread ของ torch เท่าจำนวนคอร์ชุดนั้น
+-> request พร้อมกันหลายคนรันขนานกันได้ แทนที่ทุกคนจะแย่งคอร์ทั้งหมดผ่านโมเดลเดียว
+"""
+import os
+
+POOL_WORKERS = int(os.getenv("POSE_WORKERS", "1"))          # จำนวน worker (= จำนวนโมเดลในหน่วยความจำต่อ checkpoint)
+POOL_THREADS = int(os.getenv("POSE_WORKER_THREADS", "0"))   # thread ต่อ worker (0 = เท่าจำนวนคอร์ที่ได้)
+
+
+def available_cores():
+    """คอร์ที่ process นี้ใช้ได้ (เคารพ taskset/cgroup บน Linux)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def core_slices(workers, cores=None):
+    """แบ่งคอร์เป็นชุดติดกันเท่า ๆ กัน -> list ของ list คอร์ (ยาว = min(workers, จำนวนคอร์))"""
+    cores = available_cores() if cores is None else list(cores)
+    n = max(1, min(int(workers), len(cores)))
+    return [cores[i * len(cores) // n:(i + 1) * len(cores) // n] for i in range(n)]
+
+
+def pin_current_thread(cores, threads=POOL_THREADS):
+    """
+    ผูก thread ที่เรียกกับ cores (Linux: pid 0 = thread ปัจจุบัน) แล้วตั้ง intra-op threads ของ torch
+    thread ของ OpenMP/ONNX Runtime ที่ถูกสร้างจาก thread นี้ภายหลังจะสืบทอด affinity ไปด้วย
+    torch.set_num_threads มีผลทั้ง process (ไม่ใช่ต่อ thread) -> ทุก worker ต้องตั้งค่าเดียวกัน (ดู pinned_init)
+    """
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(max(1, threads or len(cores)))
+
+
+def pinned_init(slices, threads=POOL_THREADS):
+    """
+    worker_init สำหรับ BatchScheduler: worker i ผูกกับ slices[i]
+    จำนวน thread ของ torch ใช้ค่าเดียวทุก worker (ชุดคอร์ที่เล็กสุด) -> ไม่ขึ้นกับว่า worker ไหนเริ่มทีหลัง
+    """
+    threads = threads or min(len(s) for s in slices)
+    return lambda worker: pin_current_thread(slices[worker], threads)
@@ -0,0 +1,241 @@
+# batch_infer.py
+# ใช้: python batch_infer.py <โฟลเดอร์ภาพ> <โฟลเดอร์ผลลัพธ์> --model runs/pose/train/weights/best.pt --procs 4
+# ทำนายภาพทั้งโฟลเดอร์ (รวมโฟลเดอร์ย่อย) แบบขนาน: แบ่งภาพให้หลาย process, predict เป็น batch,
+# เขียน JPEG ใน thread pool, เก็บ boxes/keypoints ลง JSONL และรันต่อจากเดิมได้ถ้าถูกขัดจังหวะ
+#
+# ผลลัพธ์ใน <โฟลเดอร์ผลลัพธ์>:
+#   run.json                  ค่าที่ใช้รัน (โมเดล/imgsz/conf) — รันต่อได้เฉพาะเมื่อค่าตรงกัน
+#   predictions-*.jsonl       1 บรรทัดต่อภาพ (= manifest ของภาพที่เสร็จแล้ว)
+#   vis_labels/...            ภาพ overlay (โครงสร้างโฟลเดอร์ตามต้นทาง)
+
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+BATCH_DEFAULT = 8           # ภาพต่อ forward pass
+WRITER_THREADS = 2          # thread เขียน JPEG ต่อ process
+JPEG_QUALITY = 95
+RUN_KEYS = ("model", "imgsz", "conf", "kp_conf")   # ค่าที่ต้องตรงกันถึงจะรันต่อได้
+
+
+def list_images(source):
+    p = Path(source)
+    if p.is_file():
+        return [p.name], p.parent
+    files = sorted(str(f.relative_to(p)).replace(os.sep, "/") for f in p.rglob("*") if f.suffix.lower() in IMAGE_EXTS)
+    return files, p
+
+
+def load_done(out_dir):
+    """อ่าน predictions-*.jsonl ทั้งหมด -> set ของภาพที่เสร็จแล้ว (ข้ามบรรทัดสุดท้ายที่เขียนไม่ครบ)"""
+    done = set()
+    for path in glob.glob(os.path.join(out_dir, "predictions-*.jsonl")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["image"])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+
+def check_run_config(out_dir, cfg):
+    """บันทึก run.json ครั้งแรก; ครั้งต่อไปต้องใช้ค่าเดิม ไม่งั้นผลในโฟลเดอร์จะปนกัน"""
+    path = os.path.join(out_dir, "run.json")
+    cur = {k: cfg[k] for k in RUN_KEYS}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            old = json.load(f)
+        diff = {k: (old.get(k), cur[k]) for k in RUN_KEYS if old.get(k) != cur[k]}
+        if diff:
+            raise SystemExit(f"[ERROR] ค่าไม่ตรงกับรอบก่อนใน {out_dir}: {diff} (ใช้โฟลเดอร์ผลลัพธ์ใหม่ หรือ --fresh)")
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(cur, f, indent=2, ensure_ascii=False)
+
+
+def _record(rel, r):
+    """Results -> dict สำหรับ JSONL (boxes: x1,y1,x2,y2,conf,cls / keypoints: [K][x,y,conf])"""
+    H, W = r.orig_shape
+    boxes = r.boxes.data.cpu().numpy() if r.boxes is not None else np.zeros((0, 6), np.float32)
+    kpts = np.zeros((len(boxes), 0, 3), np.float32)
+    if r.keypoints is not None and r.keypoints.data is not None:
+        kpts = r.keypoints.data.cpu().numpy()
+        if kpts.shape[-1] == 2:   # โมเดลที่ไม่มี conf ต่อจุด
+            kpts = np.concatenate([kpts, np.ones(kpts.shape[:-1] + (1,), kpts.dtype)], axis=-1)
+    return {
+        "image": rel,
+        "width": int(W),
+        "height": int(H),
+        "boxes": np.round(boxes, 2).tolist(),
+        "keypoints": np.round(kpts, 3).tolist(),
+    }
+
+
+def _save_overlay(r, out_path, draw_labels):
+    import modal_test
+    plotted = r.plot()
+    if draw_labels:
+        plotted = modal_test._draw_kp_labels(r, plotted)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if not cv2.imwrite(str(out_path), plotted, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY]):
+        raise RuntimeError(f"เขียนไฟล์ไม่สำเร็จ: {out_path}")
+
+
+def _read(path):
+    img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    if img is None:
+        raise RuntimeError(f"อ่านภาพไม่ได้: {path}")
+    return img
+
+
+def run_shard(args):
+    """worker 1 process: โหลดโมเดลเอง, อ่าน batch ถัดไประหว่างที่ batch ปัจจุบันกำลังทำนาย, เขียน JPEG ใน thread pool"""
+    shard_id, files, src_root, out_dir, cfg = args
+    import torch
+    from ultralytics import YOLO
+    import modal_test
+
+    torch.set_num_threads(cfg["threads"])
+    modal_test.KP_CONF_MIN = cfg["kp_conf"]
+    model = YOLO(cfg["model"])
+    vis_dir = Path(out_dir) / "vis_labels"
+    out_path = os.path.join(out_dir, f"predictions-{cfg['run_id']}-{shard_id:03d}.jsonl")
+    bs = cfg["batch"]
+    batches = [files[i:i + bs] for i in range(0, len(files), bs)]
+    n_done = n_fail = 0
+
+    with open(out_path, "a", encoding="utf-8") as out, \
+         ThreadPoolExecutor(cfg["writer_threads"]) as writers, \
+         ThreadPoolExecutor(1) as reader:
+
+        def _load(batch):
+            return [reader.submit(_read, src_root / rel) for rel in batch]
+
+        pending = []   # (future ของการเขียน JPEG, record) ของ batch ก่อนหน้า
+
+        def _flush(items):
+            nonlocal n_done, n_fail
+            for fut, rec in items:
+                try:
+                    if fut is not None:
+                        fut.result()
+                except Exception as e:
+                    n_fail += 1
+                    print(f"[shard {shard_id}] {rec['image']}: {e}", file=sys.stderr)
+                    continue
+                # เขียนบรรทัดหลังจาก JPEG เสร็จแล้วเท่านั้น -> บรรทัดใน JSONL = ภาพนี้เสร็จครบ
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                n_done += 1
+            out.flush()
+
+        nxt = _load(batches[0]) if batches else []
+        for bi, batch in enumerate(batches):
+            cur, nxt = nxt, (_load(batches[bi + 1]) if bi + 1 < len(batches) else [])
+            imgs, rels = [], []
+            for rel, fut in zip(batch, cur):
+                try:
+                    imgs.append(fut.result())
+                    rels.append(rel)
+                except Exception as e:
+                    n_fail += 1
+                    print(f"[shard {shard_id}] {e}", file=sys.stderr)
+            results = model.predict(imgs, imgsz=cfg["imgsz"], conf=cfg["conf"], device=cfg["device"],
+                                    verbose=False) if imgs else []
+            items = []
+            for rel, r in zip(rels, results):
+                fut = None
+                if cfg["save_images"]:
+                    dst = vis_dir / Path(rel).parent / f"{Path(rel).stem}_kp.jpg"
+                    fut = writers.submit(_save_overlay, r, dst, cfg["draw_labels"])
+                items.append((fut, _record(rel, r)))
+            _flush(pending)
+            pending = items
+        _flush(pending)
+    return shard_id, n_done, n_fail
+
+
+def main():
+    cpu = os.cpu_count() or 1
+    ap = argparse.ArgumentParser(description="batch inference แบบขนาน + รันต่อได้ (JSONL + ภาพ overlay)")
+    ap.add_argument("source", help="โฟลเดอร์ภาพ (รวมโฟลเดอร์ย่อย) หรือไฟล์ภาพเดี่ยว")
+    ap.add_argument("out_dir")
+    ap.add_argument("--model", default=os.getenv("POSE_WEIGHTS", "runs/pose/train/weights/best.pt"))
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--conf", type=float, default=0.5)
+    ap.add_argument("--kp-conf", type=float, default=0.25, help="conf ขั้นต่ำของจุดที่วาดป้าย")
+    ap.add_argument("--device", default="cpu", help='"cpu" หรือ 0, 1, ...')
+    ap.add_argument("--procs", type=int, default=max(1, cpu // 2), help="จำนวน worker process")
+    ap.add_argument("--threads", type=int, default=0, help="torch threads ต่อ process (0 = cpu_count / procs)")
+    ap.add_argument("--batch", type=int, default=BATCH_DEFAULT)
+    ap.add_argument("--writer-threads", type=int, default=WRITER_THREADS)
+    ap.add_argument("--no-images", action="store_true", help="เก็บแค่ JSONL ไม่เขียนภาพ overlay")
+    ap.add_argument("--no-labels", action="store_true", help="ไม่วาดป้ายชื่อจุด (วาดแค่โครงกระดูก)")
+    ap.add_argument("--fresh", action="store_true", help="ลบผลเดิมในโฟลเดอร์ผลลัพธ์แล้วเริ่มใหม่")
+    args = ap.parse_args()
+
+    files, src_root = list_images(args.source)
+    os.makedirs(args.out_dir, exist_ok=True)
+    if args.fresh:
+        for p in glob.glob(os.path.join(args.out_dir, "predictions-*.jsonl")) + [os.path.join(args.out_dir, "run.json")]:
+            if os.path.exists(p):
+                os.remove(p)
+
+    procs = max(1, args.procs)
+    cfg = {
+        "model": os.path.abspath(args.model),
+        "imgsz": args.imgsz,
+        "conf": args.conf,
+        "kp_conf": args.kp_conf,
+        "device": args.device,
+        "batch": max(1, args.batch),
+        "threads": args.threads or max(1, cpu // procs),
+        "writer_threads": max(1, args.writer_threads),
+        "save_images": not args.no_images,
+        "draw_labels": not args.no_labels,
+        "run_id": time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6],
+    }
+    check_run_config(args.out_dir, cfg)
+
+    done = load_done(args.out_dir)
+    todo = [f for f in files if f not in done]
+    print(f"[INFO] พบรูป {len(files)} ไฟล์, เสร็จแล้ว {len(files) - len(todo)}, เหลือ {len(todo)}")
+    if not todo:
+        return
+    procs = min(procs, len(todo))
+    # แบ่งแบบสลับ (i % procs) ให้แต่ละ shard ได้ภาพจากทุกโฟลเดอร์ย่อยพอ ๆ กัน
+    shards = [(i, todo[i::procs], src_root, args.out_dir, cfg) for i in range(procs)]
+    print(f"[INFO] {procs} process x {cfg['threads']} threads, batch={cfg['batch']}")
+
+    t0 = time.perf_counter()
+    total = fails = 0
+    if procs == 1:
+        outputs = [run_shard(shards[0])]
+    else:
+        # spawn: ไม่ fork สถานะของ torch จาก process หลัก
+        with mp.get_context("spawn").Pool(procs) as pool:
+            outputs = []
+            for shard_id, n, nf in pool.imap_unordered(run_shard, shards):
+                print(f"[shard {shard_id}] เสร็จ {n} ภาพ (ล้มเหลว {nf})")
+                outputs.append((shard_id, n, nf))
+    for _sid, n, nf in outputs:
+        total += n
+        fails += nf
+    dt = time.perf_counter() - t0
+    print(f"\n[DONE] {total} ภาพใน {dt:.1f}s ({total / max(dt, 1e-9):.1f} ภาพ/วินาที), ล้มเหลว {fails}")
+    print("ผลลัพธ์:", os.path.abspath(args.out_dir))
+
+
+if __name__ == "__main__":
+    main()
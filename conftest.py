@@ -0,0 +1,3 @@
+# conftest.py
+# modal_test.py เป็นสคริปต์ลองโมเดล (รัน YOLO ตอน import) ไม่ใช่ test ของ pytest
+collect_ignore = ["modal_test.py"]
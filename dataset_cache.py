@@ -0,0 +1,250 @@
+# dataset_cache.py
+# แคชภาพ dataset ที่ resize แล้ว (ตาม IMGSZ) บนดิสก์ แบบ memory map ใช้ซ้ำข้ามรอบการเทรน
+# ใช้: python dataset_cache.py <path/to/data.yaml> --imgsz 640      (เตรียมล่วงหน้า; ไม่เตรียมก็ได้ เทรนครั้งแรกจะสร้างให้)
+#
+# โครงสร้าง: <POSE_DATA_CACHE>/<ชื่อโฟลเดอร์ dataset เช่น dog-pose-2>/<train|val>-<imgsz>-<interp>/
+#   shard_XX.u8     ภาพ BGR uint8 ต่อกัน (1 ไฟล์ต่อ worker ที่เตรียม)
+#   index.npy       [shard, offset, h, w, h0, w0] ต่อภาพ
+#   manifest.json   รายการไฟล์ + fingerprint (ขนาด/เวลาแก้ไข) -> dataset เปลี่ยนเมื่อไรจะสร้างใหม่
+# label ใช้แคชของ ultralytics (labels.cache) ตามเดิม เพราะพิกัดเป็นแบบ normalize ไม่ขึ้นกับขนาดภาพ
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+CACHE_ROOT = os.getenv("POSE_DATA_CACHE", os.path.join(os.getcwd(), ".pose_cache"))
+PREP_WORKERS = int(os.getenv("POSE_CACHE_WORKERS", str(min(8, os.cpu_count() or 1))))
+INDEX_COLS = ("shard", "offset", "h", "w", "h0", "w0")
+
+
+def default_workers():
+    """จำนวน DataLoader worker: Linux (fork) แชร์ memory map ได้ฟรี; Windows ใช้ 0 ตามเดิม"""
+    if sys.platform.startswith("win"):
+        return 0
+    return min(8, max(1, (os.cpu_count() or 1) - 1))
+
+
+def fingerprint(files):
+    h = hashlib.blake2b(digest_size=16)
+    for f in sorted(files):
+        st = os.stat(f)
+        h.update(f"{f}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def cache_dir(dataset_key, split, imgsz, augment):
+    # interpolation ต่างกันระหว่าง train (augment -> LINEAR) กับ val (ย่อด้วย AREA) ตาม ultralytics
+    interp = "linear" if augment else "area"
+    return os.path.join(CACHE_ROOT, dataset_key, f"{split}-{int(imgsz)}-{interp}")
+
+
+def load_resized(path, imgsz, augment):
+    """อ่าน + resize ให้ด้านยาว = imgsz แบบเดียวกับ BaseDataset.load_image(rect_mode=True)"""
+    im = cv2.imread(path)
+    if im is None:
+        raise FileNotFoundError(f"Image Not Found {path}")
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = (min(int(np.ceil(w0 * r)), imgsz), min(int(np.ceil(h0 * r)), imgsz))
+        interp = cv2.INTER_LINEAR if (augment or r > 1) else cv2.INTER_AREA
+        im = cv2.resize(im, (w, h), interpolation=interp)
+    return np.ascontiguousarray(im), (h0, w0)
+
+
+def _build_shard(args):
+    shard, files, out_path, imgsz, augment = args
+    rows = []
+    offset = 0
+    with open(out_path, "wb") as f:
+        for path in files:
+            im, (h0, w0) = load_resized(path, imgsz, augment)
+            f.write(memoryview(im).cast("B"))
+            rows.append((shard, offset, im.shape[0], im.shape[1], h0, w0))
+            offset += im.nbytes
+    return rows
+
+
+class ImageCache:
+    """อ่านภาพจาก shard ผ่าน np.memmap (เปิดตอนใช้ครั้งแรกในแต่ละ process; pickle ได้สำหรับ DataLoader แบบ spawn)"""
+
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.index = np.load(os.path.join(root, "index.npy"))
+        self.pos = {p: i for i, p in enumerate(self.manifest["files"])}
+        self._shards = None
+
+    def __getstate__(self):
+        st = self.__dict__.copy()
+        st["_shards"] = None
+        return st
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self.pos
+
+    def __len__(self):
+        return len(self.pos)
+
+    def _open(self):
+        n = self.manifest["shards"]
+        self._shards = [np.memmap(os.path.join(self.root, f"shard_{s:02d}.u8"), dtype=np.uint8, mode="r")
+                        if os.path.getsize(os.path.join(self.root, f"shard_{s:02d}.u8")) else None
+                        for s in range(n)]
+
+    def get(self, path):
+        """-> (ภาพ BGR แบบ copy ที่แก้ไขได้, (h0, w0), (h, w))"""
+        if self._shards is None:
+            self._open()
+        shard, off, h, w, h0, w0 = (int(v) for v in self.index[self.pos[os.path.abspath(path)]])
+        im = np.array(self._shards[shard][off:off + h * w * 3]).reshape(h, w, 3)
+        return im, (h0, w0), (h, w)
+
+
+def build_cache(files, dataset_key, split, imgsz, augment, workers=PREP_WORKERS):
+    """สร้างแคช (หรือคืนของเดิมถ้า fingerprint ตรง) -> ImageCache"""
+    files = [os.path.abspath(f) for f in files]
+    out = cache_dir(dataset_key, split, imgsz, augment)
+    fp = fingerprint(files)
+    man = os.path.join(out, "manifest.json")
+    if os.path.exists(man):
+        with open(man, encoding="utf-8") as f:
+            if json.load(f).get("fingerprint") == fp:
+                return ImageCache(out)
+        print(f"[cache] dataset เปลี่ยน -> สร้างใหม่: {out}")
+
+    t0 = time.perf_counter()
+    tmp = out + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    n = max(1, min(int(workers), len(files)))
+    chunks = [files[i::n] for i in range(n)]
+    jobs = [(s, chunk, os.path.join(tmp, f"shard_{s:02d}.u8"), int(imgsz), bool(augment)) for s, chunk in enumerate(chunks)]
+    if n == 1:
+        parts = [_build_shard(jobs[0])]
+    else:
+        with ProcessPoolExecutor(n) as ex:
+            parts = list(ex.map(_build_shard, jobs))
+
+    ordered = [f for chunk in chunks for f in chunk]
+    index = np.array([row for part in parts for row in part], dtype=np.int64).reshape(-1, len(INDEX_COLS))
+    np.save(os.path.join(tmp, "index.npy"), index)
+    with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"files": ordered, "fingerprint": fp, "imgsz": int(imgsz), "augment": bool(augment),
+                   "shards": n, "columns": INDEX_COLS}, f)
+    shutil.rmtree(out, ignore_errors=True)
+    os.replace(tmp, out)
+    size = sum(os.path.getsize(os.path.join(out, f"shard_{s:02d}.u8")) for s in range(n))
+    print(f"[cache] {len(files)} ภาพ -> {out} ({size / 2**30:.2f} GB, {time.perf_counter() - t0:.1f}s)")
+    return ImageCache(out)
+
+
+# ---------- ต่อเข้ากับ ultralytics ----------
+try:
+    from ultralytics.data.dataset import YOLODataset
+    from ultralytics.models.yolo.pose import PoseTrainer
+except ImportError:   # ใช้เตรียมแคชอย่างเดียวได้แม้ไม่มี ultralytics
+    YOLODataset = PoseTrainer = None
+
+
+if YOLODataset is not None:
+
+    class CachedYOLODataset(YOLODataset):
+        """YOLODataset ที่อ่านภาพจาก ImageCache แทน cv2.imread + resize ทุก epoch"""
+
+        image_cache = None
+
+        def load_image(self, i, rect_mode=True):
+            path = self.im_files[i]
+            if not rect_mode or self.image_cache is None or path not in self.image_cache:
+                return super().load_image(i, rect_mode)
+            im, hw0, hw = self.image_cache.get(path)
+            if self.augment:
+                # เก็บแค่ลำดับไว้ให้ mosaic สุ่มจาก buffer เหมือนเดิม (ไม่ต้องถือภาพไว้ใน RAM)
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= self.max_buffer_length:
+                    self.buffer.pop(0)
+            return im, hw0, hw
+
+    class CachedPoseTrainer(PoseTrainer):
+        """PoseTrainer ที่ต่อ dataset เข้ากับแคชบนดิสก์ + พิมพ์เวลาเริ่มถึง step แรก / เวลาต่อ epoch"""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._t_start = time.perf_counter()
+            self._t_epoch = None
+            self._first_step = False
+            self.add_callback("on_train_epoch_start", CachedPoseTrainer._on_epoch_start)
+            self.add_callback("on_train_batch_end", CachedPoseTrainer._on_batch_end)
+            self.add_callback("on_train_epoch_end", CachedPoseTrainer._on_epoch_end)
+
+        def build_dataset(self, img_path, mode="train", batch=None):
+            ds = super().build_dataset(img_path, mode, batch)
+            if type(ds) is YOLODataset:
+                key = os.path.basename(os.path.dirname(os.path.abspath(self.args.data)))
+                ds.__class__ = CachedYOLODataset
+                ds.image_cache = build_cache(ds.im_files, key, mode, ds.imgsz, ds.augment)
+            return ds
+
+        @staticmethod
+        def _on_epoch_start(trainer):
+            trainer._t_epoch = time.perf_counter()
+
+        @staticmethod
+        def _on_batch_end(trainer):
+            if not trainer._first_step:
+                trainer._first_step = True
+                print(f"[timing] เริ่มถึง step แรก {time.perf_counter() - trainer._t_start:.1f}s")
+
+        @staticmethod
+        def _on_epoch_end(trainer):
+            if trainer._t_epoch is not None:
+                print(f"[timing] epoch {trainer.epoch + 1}: {time.perf_counter() - trainer._t_epoch:.1f}s")
+
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+def split_images(data_yaml, split):
+    """ไฟล์ภาพ (เรียงแล้ว) ของ split ใน data.yaml -> list (ว่างถ้าไม่มี split นี้)"""
+    import yaml
+
+    with open(data_yaml, encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    base = os.path.dirname(os.path.abspath(data_yaml))
+    rel = data.get(split)
+    if not rel:
+        return []
+    d = rel if os.path.isabs(rel) else os.path.normpath(os.path.join(data.get("path") or base, rel))
+    if not os.path.isdir(d) and rel.startswith("../"):
+        # data.yaml ของ Roboflow อ้าง ../train/images แต่โฟลเดอร์อยู่ข้าง data.yaml
+        d = os.path.normpath(os.path.join(base, rel[3:]))
+    return sorted(os.path.join(r, n) for r, _, ns in os.walk(d) for n in ns if os.path.splitext(n)[1].lower() in IMAGE_EXTS)
+
+
+def prepare_from_yaml(data_yaml, imgsz, workers=PREP_WORKERS):
+    """สร้างแคช train/val จาก data.yaml โดยไม่ต้องมี ultralytics (ใช้ก่อนเทรนหลายงานพร้อมกัน เช่น sweep.py)"""
+    key = os.path.basename(os.path.dirname(os.path.abspath(data_yaml)))
+    for split, augment in (("train", True), ("val", False)):
+        files = split_images(data_yaml, split)
+        if files:
+            build_cache(files, key, split, imgsz, augment, workers)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="เตรียมแคชภาพที่ resize แล้วสำหรับ main.py")
+    ap.add_argument("data_yaml")
+    ap.add_argument("--imgsz", type=int, default=int(os.getenv("IMGSZ", "640")))
+    ap.add_argument("--workers", type=int, default=PREP_WORKERS)
+    args = ap.parse_args()
+    prepare_from_yaml(args.data_yaml, args.imgsz, args.workers)
@@ -0,0 +1,266 @@
+# dataset_store.py
+# ที่เก็บ dataset แบบ offline-first: main.py เรียก ensure_dataset() แทนการสร้าง Roboflow client ทุกครั้ง
+# ต่อ network เฉพาะตอนที่ไม่มีเวอร์ชันนั้นในเครื่อง (หรือไฟล์เสีย) เท่านั้น
+#
+# โครงสร้าง: <POSE_DATASET_STORE>/
+#   objects/ab/abcdef...                 ไฟล์จริง ตั้งชื่อตาม sha256 ของเนื้อหา (read-only, ใช้ร่วมข้ามเวอร์ชัน)
+#   versions/<project>-<version>/        โครงเดียวกับที่ Roboflow โหลดมา (data.yaml, train/images, ...) เป็น hardlink ไป objects
+#       .manifest.json                   {ไฟล์: [sha256, size, mtime_ns]}, จำนวนภาพ/label ต่อ split
+#
+# ใช้: python dataset_store.py ingest <โฟลเดอร์ dataset> --project dog-pose --version 2   (นำเข้าจากไฟล์ที่ copy มาเอง)
+#      python dataset_store.py verify dog-pose 2 [--full]
+#      python dataset_store.py list
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+STORE_ROOT = os.getenv("POSE_DATASET_STORE", os.path.join(os.getcwd(), ".datasets"))
+DATASET_SOURCE = os.getenv("POSE_DATASET_SOURCE")   # โฟลเดอร์ dataset ในเครื่อง ใช้แทนการโหลดจาก Roboflow
+OFFLINE = os.getenv("POSE_OFFLINE", "0") == "1"     # 1 = ห้ามต่อ network เด็ดขาด
+HASH_WORKERS = int(os.getenv("POSE_HASH_WORKERS", str(min(8, os.cpu_count() or 1))))
+MANIFEST = ".manifest.json"
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+class DatasetIntegrityError(RuntimeError):
+    def __init__(self, msg, bad_objects=()):
+        super().__init__(msg)
+        self.bad_objects = list(bad_objects)   # sha256 ของ object ที่เนื้อหาเสีย (ต้องลบก่อนนำเข้าใหม่)
+
+
+def sha256_file(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def version_dir(project, version, root=STORE_ROOT):
+    # ชื่อเดียวกับโฟลเดอร์ที่ Roboflow สร้าง -> key ของ dataset_cache ไม่เปลี่ยน
+    return os.path.join(root, "versions", f"{project}-{version}")
+
+
+def _object_path(digest, root):
+    return os.path.join(root, "objects", digest[:2], digest)
+
+
+def _walk(src):
+    for r, dirs, names in os.walk(src):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for n in names:
+            if n == MANIFEST or n.endswith(".cache"):   # labels.cache ของ ultralytics สร้างใหม่ได้เสมอ
+                continue
+            full = os.path.join(r, n)
+            yield os.path.relpath(full, src).replace(os.sep, "/"), full
+
+
+def count_split(rel_paths):
+    """-> {split: {"images": n, "labels": n}} จาก path แบบ <split>/images/... และ <split>/labels/*.txt"""
+    counts = {}
+    for rel in rel_paths:
+        parts = rel.split("/")
+        if len(parts) < 3 or parts[1] not in ("images", "labels"):
+            continue
+        kind = parts[1]
+        ext = os.path.splitext(rel)[1].lower()
+        if (kind == "images" and ext in IMAGE_EXTS) or (kind == "labels" and ext == ".txt"):
+            counts.setdefault(parts[0], {"images": 0, "labels": 0})[kind] += 1
+    return counts
+
+
+def _place(digest, src, root):
+    """คัดลอกไฟล์เข้า objects ถ้ายังไม่มี (atomic) แล้วตั้งเป็น read-only กันการแก้ไขทับผ่าน hardlink"""
+    obj = _object_path(digest, root)
+    if not os.path.exists(obj):
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(obj))
+        os.close(fd)
+        shutil.copy2(src, tmp)
+        os.chmod(tmp, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(tmp, obj)
+    return obj
+
+
+def _link(obj, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(obj, dst)
+    except OSError:   # ต่าง filesystem / ไม่รองรับ hardlink -> copy
+        shutil.copy2(obj, dst)
+
+
+def _rmtree(path):
+    # ไฟล์ใน objects เป็น read-only -> Windows ลบไม่ได้จนกว่าจะปลด
+    def _onerror(func, p, _exc):
+        os.chmod(p, stat.S_IWRITE)
+        func(p)
+    if os.path.exists(path):
+        shutil.rmtree(path, onerror=_onerror)
+
+
+def ingest(src, project, version, root=STORE_ROOT, workers=HASH_WORKERS):
+    """นำโฟลเดอร์ dataset (ที่มี data.yaml) เข้าที่เก็บ -> path ของ data.yaml ในที่เก็บ"""
+    if not os.path.exists(os.path.join(src, "data.yaml")):
+        raise FileNotFoundError(f"ไม่พบ data.yaml ใน {src}")
+    t0 = time.perf_counter()
+    entries = sorted(_walk(src))
+    with ThreadPoolExecutor(max(1, workers)) as ex:   # hashlib ปล่อย GIL ระหว่าง hash
+        digests = list(ex.map(lambda e: sha256_file(e[1]), entries))
+
+    out = version_dir(project, version, root)
+    tmp = out + ".tmp"
+    _rmtree(tmp)
+    files = {}
+    for (rel, full), digest in zip(entries, digests):
+        dst = os.path.join(tmp, *rel.split("/"))
+        _link(_place(digest, full, root), dst)
+        st = os.stat(dst)
+        files[rel] = [digest, st.st_size, st.st_mtime_ns]
+    manifest = {
+        "project": project, "version": str(version), "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "files": files, "counts": count_split(files),
+    }
+    with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    _rmtree(out)
+    os.replace(tmp, out)
+    size = sum(v[1] for v in files.values())
+    print(f"[dataset] นำเข้า {project}-{version}: {len(files)} ไฟล์ ({size / 2**20:.1f} MB, "
+          f"{time.perf_counter() - t0:.1f}s) -> {out}")
+    return os.path.join(out, "data.yaml")
+
+
+def verify(project, version, root=STORE_ROOT, full=False):
+    """
+    ตรวจเวอร์ชันในที่เก็บ -> path ของ data.yaml หรือโยน DatasetIntegrityError / FileNotFoundError
+    quick (ค่าเริ่มต้น): รายการไฟล์ + จำนวนภาพ/label ต่อ split + ขนาด/mtime ตรง manifest (hash ซ้ำเฉพาะไฟล์ที่ไม่ตรง)
+    full: hash ทุกไฟล์ใหม่
+    """
+    out = version_dir(project, version, root)
+    man = os.path.join(out, MANIFEST)
+    if not os.path.exists(man):
+        raise FileNotFoundError(f"ไม่มี {project}-{version} ในที่เก็บ ({out})")
+    with open(man, encoding="utf-8") as f:
+        manifest = json.load(f)
+    files = manifest["files"]
+
+    present = {rel: full_path for rel, full_path in _walk(out)}
+    missing = sorted(set(files) - set(present))
+    extra = sorted(set(present) - set(files))
+    if missing or extra:
+        raise DatasetIntegrityError(f"{project}-{version}: ไฟล์หาย {len(missing)} {missing[:3]}, "
+                                    f"ไฟล์เกิน {len(extra)} {extra[:3]}")
+    counts = count_split(present)
+    if counts != manifest["counts"]:
+        raise DatasetIntegrityError(f"{project}-{version}: จำนวนไม่ตรง {counts} != {manifest['counts']}")
+
+    suspect = []
+    for rel, (digest, size, mtime) in files.items():
+        st = os.stat(present[rel])
+        if full or st.st_size != size or st.st_mtime_ns != mtime:
+            suspect.append(rel)
+    with ThreadPoolExecutor(max(1, HASH_WORKERS)) as ex:
+        bad = [rel for rel, d in zip(suspect, ex.map(lambda r: sha256_file(present[r]), suspect)) if d != files[rel][0]]
+    if bad:
+        raise DatasetIntegrityError(f"{project}-{version}: hash ไม่ตรง {len(bad)} ไฟล์ {bad[:3]}",
+                                    bad_objects=[files[rel][0] for rel in bad])
+    return os.path.join(out, "data.yaml")
+
+
+def roboflow_fetch(workspace, project, version, api_key, dest):
+    """โหลดจาก Roboflow ลง dest (import roboflow ตอนนี้เท่านั้น) -> โฟลเดอร์ที่มี data.yaml"""
+    from roboflow import Roboflow
+    if not api_key:
+        raise RuntimeError("Missing environment variable: RF_API_KEY (ต้องใช้เมื่อยังไม่มี dataset ในเครื่อง)")
+    rf = Roboflow(api_key=api_key)
+    ds = rf.workspace(workspace).project(project).version(int(version)).download("yolov8", location=dest)
+    return ds.location
+
+
+def local_fetch(source):
+    """ตัวแทนการโหลด: ใช้โฟลเดอร์ dataset ที่มีอยู่แล้วในเครื่อง (เช่น copy มาเครื่อง air-gapped)"""
+    def _fetch(workspace, project, version, api_key, dest):
+        return source
+    return _fetch
+
+
+def ensure_dataset(workspace, project, version, api_key=None, root=STORE_ROOT, fetch=None, full_verify=False):
+    """
+    -> path ของ data.yaml ที่พร้อมใช้
+    1) มีในที่เก็บและตรวจผ่าน -> ใช้เลย (ไม่ต่อ network)
+    2) มีโฟลเดอร์ <project>-<version> แบบเดิมใน cwd -> นำเข้าที่เก็บ (ย้ายจากการโหลดแบบเก่า)
+    3) ไม่มี/เสีย -> fetch (POSE_DATASET_SOURCE หรือ Roboflow) แล้วนำเข้า
+    """
+    try:
+        data_yaml = verify(project, version, root, full=full_verify)
+        print("Found dataset in store, skip download ->", data_yaml)
+        return data_yaml
+    except FileNotFoundError:
+        pass
+    except DatasetIntegrityError as e:
+        print(f"[dataset] {e} -> นำเข้าใหม่")
+        for digest in e.bad_objects:   # hardlink = inode เดียวกับ object -> object เสียด้วย
+            obj = _object_path(digest, root)
+            if os.path.exists(obj):
+                os.chmod(obj, stat.S_IWRITE)
+                os.remove(obj)
+
+    legacy = os.path.join(os.getcwd(), f"{project}-{version}")
+    if fetch is None and os.path.exists(os.path.join(legacy, "data.yaml")):
+        return ingest(legacy, project, version, root)
+
+    if fetch is None:
+        if DATASET_SOURCE:
+            fetch = local_fetch(DATASET_SOURCE)
+        elif OFFLINE:
+            raise RuntimeError(f"POSE_OFFLINE=1 แต่ไม่มี {project}-{version} ในที่เก็บ {root} "
+                               f"(นำเข้าด้วย python dataset_store.py ingest <โฟลเดอร์> --project {project} --version {version})")
+        else:
+            fetch = roboflow_fetch
+    with tempfile.TemporaryDirectory(dir=root if os.path.isdir(root) else None) as tmp:
+        src = fetch(workspace, project, version, api_key, os.path.join(tmp, f"{project}-{version}"))
+        data_yaml = ingest(src, project, version, root)
+    print("Downloaded dataset ->", data_yaml)
+    return data_yaml
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="ที่เก็บ dataset แบบ offline-first")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("ingest", help="นำโฟลเดอร์ dataset เข้าที่เก็บ")
+    p.add_argument("src")
+    p.add_argument("--project", required=True)
+    p.add_argument("--version", required=True)
+    p = sub.add_parser("verify", help="ตรวจความครบถ้วนของเวอร์ชัน")
+    p.add_argument("project")
+    p.add_argument("version")
+    p.add_argument("--full", action="store_true", help="hash ทุกไฟล์ใหม่")
+    sub.add_parser("list", help="แสดงเวอร์ชันที่มี")
+    args = ap.parse_args()
+
+    if args.cmd == "ingest":
+        ingest(args.src, args.project, args.version)
+    elif args.cmd == "verify":
+        t0 = time.perf_counter()
+        print(verify(args.project, args.version, full=args.full), f"OK ({time.perf_counter() - t0:.2f}s)")
+    else:
+        vroot = os.path.join(STORE_ROOT, "versions")
+        for name in sorted(os.listdir(vroot)) if os.path.isdir(vroot) else []:
+            try:
+                with open(os.path.join(vroot, name, MANIFEST), encoding="utf-8") as f:
+                    m = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            print(f"{name:30s} {len(m['files']):6d} ไฟล์  {m['counts']}  ({m['created']})")
@@ -18,6 +18,12 @@ CONF_BOX    = 0.50      # ค่าความมั่นใจขั้นต
 DEVICE      = 0         # 0=GPU ตัวแรก, หรือ "cpu"
 WORKERS     = 0         # Windows-friendly
 
+# === โหมด cascade: รันที่ CASCADE_LOW ก่อน ภาพที่ไม่มั่นใจค่อยรันใหม่ที่ IMGSZ ===
+CASCADE          = False
+CASCADE_LOW      = 320
+CASCADE_BOX_CONF = 0.50     # หมาทุกตัวต้องมี conf กล่อง >= ค่านี้
+CASCADE_KP_CONF  = 0.50     # และค่าเฉลี่ย conf ของจุด >= ค่านี้
+
 # === ค่าตกแต่ง label ===
 DRAW_LABELS      = True     # เปิด/ปิดการวาง label ที่ keypoint
 KP_CONF_MIN      = 0.25     # วาง label เฉพาะจุดที่ conf >= ค่านี้ (ถ้าโมเดลมี conf ต่อจุด)
@@ -60,7 +66,7 @@ def _draw_kp_labels(result, img):
         return img
 
     kps_xy = result.keypoints.xy  # [num_person, K, 2]
-    kps_conf = getattr(result.keypoints, 'confidence', None)  # อาจเป็น None ถ้าเวอร์ชัน/โมเดลไม่ให้ค่า
+    kps_conf = getattr(result.keypoints, 'conf', None)  # อาจเป็น None ถ้าเวอร์ชัน/โมเดลไม่ให้ค่า
     kps_xy = kps_xy.cpu().numpy() if hasattr(kps_xy, "cpu") else np.asarray(kps_xy)
     if kps_conf is not None:
         kps_conf = kps_conf.cpu().numpy() if hasattr(kps_conf, "cpu") else np.asarray(kps_conf)
@@ -98,6 +104,17 @@ def _draw_kp_labels(result, img):
 
     return img
 
+def _cascade_ok(result):
+    """ผลที่ความละเอียดต่ำ -> (พอใช้ไหม, เหตุผล)"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return False, "no_dog"
+    if float(result.boxes.conf.min()) < CASCADE_BOX_CONF:
+        return False, "low_box_conf"
+    kp = result.keypoints
+    if kp is not None and kp.conf is not None and float(kp.conf.mean(dim=1).min()) < CASCADE_KP_CONF:
+        return False, "low_kp_conf"
+    return True, "confident"
+
 def main():
     # โหลดโมเดล
     model = YOLO(MODEL_PATH)
@@ -115,7 +132,7 @@ def main():
     # ใช้ stream=True เพื่อวนทีละภาพ แล้วเราจะวาด label เอง
     results = model.predict(
         source=SOURCE,
-        imgsz=IMGSZ,
+        imgsz=CASCADE_LOW if CASCADE else IMGSZ,
         conf=CONF_BOX,
         device=DEVICE,
         workers=WORKERS,
@@ -123,9 +140,25 @@ def main():
         verbose=True
     )
 
+    # โมเดลอีกชุดสำหรับรอบความละเอียดสูง: predictor ของ model ถูก generator ด้านบนจับ lock ไว้ตลอด
+    # (เรียก model.predict ซ้อนระหว่าง stream จะค้าง และเขียนทับ imgsz/args ของ stream ที่กำลังรัน)
+    high_model = None
+
     # ประมวลผลและบันทึก
     count = 0
+    escalated = 0
     for result in results:
+        if CASCADE:
+            ok, reason = _cascade_ok(result)
+            if not ok:
+                # ไม่มั่นใจที่ความละเอียดต่ำ -> รันภาพนี้ใหม่ที่ IMGSZ
+                if high_model is None:
+                    high_model = YOLO(MODEL_PATH)
+                result = high_model.predict(source=result.path, imgsz=IMGSZ, conf=CONF_BOX, device=DEVICE,
+                                            verbose=False)[0]
+                escalated += 1
+            print(f"[CASCADE] {Path(result.path).name}: {'low' if ok else 'full'} ({reason})")
+
         # วาด keypoints/โครงกระดูกแบบ default ของ ultralytics ก่อน
         plotted = result.plot()  # ได้ภาพ overlay แล้ว
 
@@ -144,6 +177,8 @@ def main():
     print("\n[DONE] รูปผลลัพธ์ถูกบันทึกไว้ที่:")
     print(save_dir)
     print(f"[INFO] บันทึก {count} ไฟล์")
+    if CASCADE:
+        print(f"[CASCADE] รันใหม่ที่ {IMGSZ}: {escalated}/{count} ภาพ")
 
 if __name__ == "__main__":
     main()
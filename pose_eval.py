@@ -0,0 +1,311 @@
+# pose_eval.py
+# ประเมินโมเดล pose แบบ offline: รันโมเดลครั้งเดียวต่อ (checkpoint, split) แล้วแคชผลทำนาย
+# จากนั้นคำนวณ OKS / PCK@α / AP ต่อ keypoint ต่อ threshold ด้วย NumPy ทั้งชุดในครั้งเดียว
+# -> เปลี่ยน conf / sigma / threshold แล้วคิดใหม่ได้ในไม่กี่วินาที ไม่ต้องรัน val ใหม่
+#
+# ใช้: python pose_eval.py runs/pose/train/weights/best.pt <data.yaml> [--split val] [--conf 0.25] [--sigmas 0.05]
+#
+# แคช: <POSE_EVAL_CACHE>/<hash ของ checkpoint + รายการภาพ + imgsz>.npz
+#   img (N,) ลำดับภาพ, boxes (N,4) xyxy, scores (N,), kpts (N,K,3) x,y,conf — ทำนายที่ conf ต่ำสุด (PRED_CONF)
+# การ match ใช้วิธีเดียวกับ ultralytics val: จับคู่ตามค่า similarity มากสุดก่อน (pred/gt ใช้ได้ครั้งเดียว)
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from dataset_cache import fingerprint, split_images
+
+EVAL_CACHE = os.getenv("POSE_EVAL_CACHE", os.path.join(os.getcwd(), ".pose_cache", "eval"))
+PRED_CONF = 0.001                          # conf ตอนแคช (ต่ำพอสำหรับ AP); conf ที่ใช้จริงกรองทีหลัง
+OKS_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+PCK_ALPHAS = (0.05, 0.1, 0.2)              # สัดส่วนของด้านยาวของกล่อง gt
+AREA_SCALE = 0.53                          # area = w*h*0.53 แบบ ultralytics (ไม่มี segmentation)
+
+
+# ---------- ground truth ----------
+def label_path(img_path):
+    head, sep, tail = img_path.rpartition(f"{os.sep}images{os.sep}")
+    return os.path.splitext(f"{head}{os.sep}labels{os.sep}{tail}" if sep else img_path)[0] + ".txt"
+
+
+def load_ground_truth(files, kpt_shape):
+    """-> dict(img, boxes xyxy px, kpts (G,K,3) px + visibility, sizes (n_img,2) w,h)"""
+    from PIL import Image
+
+    K, D = kpt_shape
+    img, boxes, kpts, sizes = [], [], [], []
+    for i, f in enumerate(files):
+        with Image.open(f) as im:   # อ่านแค่ header
+            w, h = im.size
+        sizes.append((w, h))
+        try:
+            rows = np.loadtxt(label_path(f), ndmin=2, dtype=np.float64)
+        except (FileNotFoundError, ValueError):
+            continue
+        if rows.size == 0:
+            continue
+        cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+        boxes.append(np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], 1))
+        kp = rows[:, 5:5 + K * D].reshape(-1, K, D)
+        if D == 2:
+            kp = np.concatenate([kp, np.ones(kp.shape[:2] + (1,))], 2)
+        kp = kp * np.array([w, h, 1.0])
+        kp[..., 2] = (kp[..., 2] > 0) & (kp[..., 0] > 0) & (kp[..., 1] > 0)   # (0,0) = ไม่ได้ label
+        kpts.append(kp)
+        img.append(np.full(len(rows), i))
+    cat = lambda xs, shape: np.concatenate(xs) if xs else np.zeros(shape)
+    return {"img": cat(img, (0,)).astype(np.int64), "boxes": cat(boxes, (0, 4)),
+            "kpts": cat(kpts, (0, K, 3)), "sizes": np.array(sizes, np.float64).reshape(-1, 2)}
+
+
+# ---------- prediction cache ----------
+def _file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for b in iter(lambda: f.read(1 << 20), b""):
+            h.update(b)
+    return h.hexdigest()
+
+
+def cached_predictions(weights, files, imgsz, device=None, batch=16):
+    """ผลทำนายทั้ง split (แคชตาม checkpoint + รายการภาพ + imgsz) -> dict ของ array"""
+    key = hashlib.blake2b(f"{_file_hash(weights)}|{fingerprint(files)}|{imgsz}|{PRED_CONF}".encode(),
+                          digest_size=12).hexdigest()
+    path = os.path.join(EVAL_CACHE, f"{key}.npz")
+    if os.path.exists(path):
+        with np.load(path) as z:
+            return {k: z[k] for k in z.files}
+
+    from ultralytics import YOLO
+
+    t0 = time.perf_counter()
+    model = YOLO(weights)
+    img, boxes, scores, kpts = [], [], [], []
+    pos = {os.path.abspath(f): i for i, f in enumerate(files)}
+    for r in model.predict(files, stream=True, conf=PRED_CONF, imgsz=imgsz, device=device, batch=batch, verbose=False):
+        n = 0 if r.boxes is None else len(r.boxes)
+        if not n:
+            continue
+        img.append(np.full(n, pos[os.path.abspath(r.path)]))
+        boxes.append(r.boxes.xyxy.cpu().numpy())
+        scores.append(r.boxes.conf.cpu().numpy())
+        kp = r.keypoints.data.cpu().numpy()
+        if kp.shape[-1] == 2:   # โมเดลที่ไม่มี conf ต่อจุด
+            kp = np.concatenate([kp, np.ones(kp.shape[:-1] + (1,), kp.dtype)], -1)
+        kpts.append(kp)
+    K = model.model.kpt_shape[0]
+    out = {
+        "img": np.concatenate(img) if img else np.zeros(0, np.int64),
+        "boxes": np.concatenate(boxes) if boxes else np.zeros((0, 4), np.float32),
+        "scores": np.concatenate(scores) if scores else np.zeros(0, np.float32),
+        "kpts": np.concatenate(kpts) if kpts else np.zeros((0, K, 3), np.float32),
+    }
+    os.makedirs(EVAL_CACHE, exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **out)
+    os.replace(tmp, path)
+    print(f"[eval] ทำนาย {len(files)} ภาพ ({time.perf_counter() - t0:.1f}s) -> {path}")
+    return out
+
+
+# ---------- metrics ----------
+def _pairs(p_img, g_img, n_img):
+    """ทุกคู่ (pred, gt) ที่อยู่ภาพเดียวกัน -> (pi, gi) โดยไม่วนทีละภาพ"""
+    g_order = np.argsort(g_img, kind="stable")
+    g_count = np.bincount(g_img, minlength=n_img)
+    g_start = np.concatenate([[0], np.cumsum(g_count)[:-1]])
+    reps = g_count[p_img]
+    pi = np.repeat(np.arange(len(p_img)), reps)
+    offs = np.arange(reps.sum()) - np.repeat(np.cumsum(reps) - reps, reps)
+    gi = g_order[np.repeat(g_start[p_img], reps) + offs]
+    return pi, gi
+
+
+def _match(pi, gi, sim, valid, thresholds, n_pred):
+    """-> tp (T, n_pred): จับคู่ similarity มากสุดก่อน แต่ละ pred/gt ใช้ได้ครั้งเดียว (ต่อ threshold)"""
+    tp = np.zeros((len(thresholds), n_pred), bool)
+    order = np.argsort(-sim, kind="stable")
+    pi, gi, sim, valid = pi[order], gi[order], sim[order], valid[order]
+    for t, thr in enumerate(thresholds):
+        m = valid & (sim >= thr)
+        p, g = pi[m], gi[m]
+        # คู่เรียงจาก sim มาก -> น้อย: ครั้งแรกที่ pred / gt ปรากฏ = คู่ที่ดีที่สุดของมัน
+        keep = np.zeros(len(p), bool)
+        keep[np.unique(p, return_index=True)[1]] = True
+        p, g = p[keep], g[keep]
+        p = p[np.unique(g, return_index=True)[1]]
+        tp[t, p] = True
+    return tp
+
+
+def average_precision(tp, scores, n_gt):
+    """AP แบบ COCO (101 จุด) ต่อแถว: tp (R, N) bool, scores (R, N) หรือ (N,), n_gt (R,) -> (R,)"""
+    R, N = tp.shape
+    n_gt = np.asarray(n_gt, np.float64).reshape(R, 1)
+    if N == 0:
+        return np.where(n_gt[:, 0] > 0, 0.0, np.nan)
+    scores = np.broadcast_to(scores, (R, N))
+    order = np.argsort(-scores, axis=1, kind="stable")
+    tps = np.take_along_axis(tp, order, 1)
+    tpc = np.cumsum(tps, 1)
+    fpc = np.cumsum(~tps, 1)
+    recall = tpc / np.maximum(n_gt, 1)
+    precision = tpc / (tpc + fpc)
+    envelope = np.maximum.accumulate(precision[:, ::-1], 1)[:, ::-1]
+    rs = np.linspace(0, 1, 101)
+    ap = np.zeros(R)
+    for r in range(R):   # searchsorted ต่อแถว (recall ไม่ลดลงในแต่ละแถว)
+        idx = np.searchsorted(recall[r], rs, side="left")
+        ap[r] = np.where(idx < N, envelope[r, np.minimum(idx, N - 1)], 0.0).mean()
+    return np.where(n_gt[:, 0] > 0, ap, np.nan)
+
+
+class PoseEvaluator:
+    """เก็บผลทำนาย + gt และคู่ (pred, gt) ที่คำนวณไว้แล้ว; score() คิด metric ใหม่ได้เร็วตาม conf/sigma/threshold"""
+
+    def __init__(self, preds, gt, kpt_names=None):
+        self.p, self.g = preds, gt
+        self.K = gt["kpts"].shape[1]
+        self.kpt_names = list(kpt_names or [str(k) for k in range(self.K)])
+        self.pi, self.gi = _pairs(preds["img"], gt["img"], len(gt["sizes"]))
+
+        pb, gb = preds["boxes"][self.pi].astype(np.float64), gt["boxes"][self.gi]
+        lt, rb = np.maximum(pb[:, :2], gb[:, :2]), np.minimum(pb[:, 2:], gb[:, 2:])
+        inter = np.prod(np.clip(rb - lt, 0, None), 1)
+        area_p, area_g = np.prod(pb[:, 2:] - pb[:, :2], 1), np.prod(gb[:, 2:] - gb[:, :2], 1)
+        self.iou = inter / (area_p + area_g - inter + 1e-9)
+
+        self.d2 = ((preds["kpts"][self.pi, :, :2].astype(np.float64) - gt["kpts"][self.gi, :, :2]) ** 2).sum(-1)  # (M,K)
+        self.vis = gt["kpts"][self.gi, :, 2] > 0                                                                   # (M,K)
+        self.area = area_g * AREA_SCALE
+        wh = gt["boxes"][:, 2:] - gt["boxes"][:, :2]
+        self.g_scale = wh.max(1)                                     # ตัวหารของ PCK ต่อ gt
+
+    def score(self, conf=PRED_CONF, kp_conf=0.0, sigmas=None, thresholds=OKS_THRESHOLDS, pck_alphas=PCK_ALPHAS):
+        K, thresholds = self.K, np.asarray(thresholds, np.float64)
+        sigmas = np.full(K, 1.0 / K) if sigmas is None else np.broadcast_to(np.asarray(sigmas, np.float64), (K,))
+        n_pred = len(self.p["scores"])
+        use = self.p["scores"] >= conf                                # pred ที่ผ่าน conf
+        pair_ok = use[self.pi]
+        kp_c = self.p["kpts"][..., 2]                                 # (N,K)
+
+        # OKS ต่อคู่ และความคล้ายต่อ keypoint (ks)
+        ks = np.exp(-self.d2 / ((2 * sigmas) ** 2 * (self.area[:, None] + 1e-9) * 2))
+        n_vis = self.vis.sum(1)
+        oks = np.where(n_vis > 0, (ks * self.vis).sum(1) / np.maximum(n_vis, 1), 0.0)
+
+        n_gt = len(self.g["img"])
+        box_tp = _match(self.pi, self.gi, self.iou, pair_ok, thresholds, n_pred)
+        pose_tp = _match(self.pi, self.gi, oks, pair_ok & (n_vis > 0), thresholds, n_pred)
+        box_ap = average_precision(box_tp[:, use], self.p["scores"][use], np.full(len(thresholds), n_gt))
+        n_gt_pose = int((self.g["kpts"][..., 2] > 0).any(1).sum())
+        pose_ap = average_precision(pose_tp[:, use], self.p["scores"][use], np.full(len(thresholds), n_gt_pose))
+
+        # AP ต่อ keypoint: ใช้ ks ของจุดนั้นแทน OKS, score = conf ของกล่อง x conf ของจุด
+        # pred ที่ตรงกับ gt (OKS สูงสุด) ซึ่งจุดนั้นไม่ได้ label -> ไม่นับ (ไม่ใช่ false positive) แบบ COCO
+        p_gt = np.full(n_pred, -1)
+        cand = np.flatnonzero(pair_ok & (oks > 0))
+        if len(cand):
+            cand = cand[np.lexsort((-oks[cand], self.pi[cand]))]
+            first = np.unique(self.pi[cand], return_index=True)[1]
+            p_gt[self.pi[cand[first]]] = self.gi[cand[first]]
+        ignore = (p_gt[:, None] >= 0) & ~(self.g["kpts"][np.maximum(p_gt, 0), :, 2] > 0)      # (N,K)
+        kp_ap = np.zeros((K, len(thresholds)))
+        kp_gt = (self.g["kpts"][..., 2] > 0).sum(0)
+        for k in range(K):
+            tp_k = _match(self.pi, self.gi, ks[:, k], pair_ok & self.vis[:, k], thresholds, n_pred)
+            sel = use & ~ignore[:, k]
+            kp_ap[k] = average_precision(tp_k[:, sel], (self.p["scores"] * kp_c[:, k])[sel],
+                                         np.full(len(thresholds), kp_gt[k]))
+
+        # PCK@α: แต่ละ gt ใช้ pred ที่ OKS สูงสุด (ภาพเดียวกัน ผ่าน conf); จุดที่ conf < kp_conf = ทำนายไม่ได้
+        best = np.full(n_gt, -1)
+        cand = np.flatnonzero(pair_ok)
+        if len(cand):
+            cand = cand[np.lexsort((-oks[cand], self.gi[cand]))]
+            first = np.unique(self.gi[cand], return_index=True)[1]
+            best[self.gi[cand[first]]] = cand[first]
+        has = best >= 0
+        g_vis = self.g["kpts"][..., 2] > 0                              # (G,K)
+        dist = np.full((n_gt, K), np.inf)
+        if has.any():
+            d = np.sqrt(self.d2[best[has]])
+            d[kp_c[self.pi[best[has]]] < kp_conf] = np.inf
+            dist[has] = d
+        pck = {}
+        for a in pck_alphas:
+            ok = (dist <= a * self.g_scale[:, None]) & g_vis
+            pck[a] = np.where(g_vis.any(0), ok.sum(0) / np.maximum(g_vis.sum(0), 1), np.nan)
+        matched_oks = oks[best[has]] if has.any() else np.zeros(0)
+
+        return {
+            "images": int(len(self.g["sizes"])), "instances": n_gt, "predictions": int(use.sum()),
+            "conf": conf, "kp_conf": kp_conf, "thresholds": thresholds.tolist(),
+            "box_ap50": float(box_ap[0]), "box_ap50_95": float(np.nanmean(box_ap)),
+            "pose_ap50": float(pose_ap[0]), "pose_ap50_95": float(np.nanmean(pose_ap)),
+            "mean_oks": float(matched_oks.mean()) if len(matched_oks) else float("nan"),
+            "per_keypoint": [
+                {"name": self.kpt_names[k], "gt": int(kp_gt[k]), "ap": kp_ap[k].tolist(),
+                 "ap50": float(kp_ap[k, 0]), "ap50_95": float(np.nanmean(kp_ap[k])) if kp_gt[k] else float("nan"),
+                 **{f"pck@{a}": float(pck[a][k]) for a in pck_alphas}}
+                for k in range(K)
+            ],
+        }
+
+
+def print_report(rep):
+    print(f"images={rep['images']} instances={rep['instances']} predictions={rep['predictions']} "
+          f"(conf>={rep['conf']}, kp_conf>={rep['kp_conf']})")
+    print(f"box  AP50 {rep['box_ap50']:.4f}  AP50-95 {rep['box_ap50_95']:.4f}")
+    print(f"pose AP50 {rep['pose_ap50']:.4f}  AP50-95 {rep['pose_ap50_95']:.4f}  mean OKS {rep['mean_oks']:.4f}")
+    pck_keys = [k for k in rep["per_keypoint"][0] if k.startswith("pck@")] if rep["per_keypoint"] else []
+    print(f"{'keypoint':>20s} {'gt':>5s} {'AP50':>7s} {'AP50-95':>8s} " + " ".join(f"{k:>9s}" for k in pck_keys))
+    for row in rep["per_keypoint"]:
+        print(f"{row['name']:>20s} {row['gt']:5d} {row['ap50']:7.3f} {row['ap50_95']:8.3f} "
+              + " ".join(f"{row[k]:9.3f}" for k in pck_keys))
+
+
+def evaluate(weights, data_yaml, split="val", imgsz=640, device=None, **score_kw):
+    """แคชผลทำนาย (ถ้ายังไม่มี) + คิด metric -> (report dict, PoseEvaluator สำหรับคิดใหม่ด้วยค่าอื่น)"""
+    import yaml
+
+    with open(data_yaml, encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    kpt_shape = data.get("kpt_shape") or [26, 3]
+    files = split_images(data_yaml, split)
+    if not files:
+        raise FileNotFoundError(f"ไม่มีภาพใน split '{split}' ของ {data_yaml}")
+    gt = load_ground_truth(files, kpt_shape)
+    preds = cached_predictions(weights, files, imgsz, device)
+    ev = PoseEvaluator(preds, gt, data.get("kpt_names"))
+    t0 = time.perf_counter()
+    rep = ev.score(**score_kw)
+    print(f"[eval] คิด metric {len(files)} ภาพ ใน {time.perf_counter() - t0:.2f}s")
+    return rep, ev
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="ประเมิน pose แบบ offline จากผลทำนายที่แคชไว้")
+    ap.add_argument("weights")
+    ap.add_argument("data_yaml")
+    ap.add_argument("--split", default="val")
+    ap.add_argument("--imgsz", type=int, default=int(os.getenv("IMGSZ", "640")))
+    ap.add_argument("--device", default=None)
+    ap.add_argument("--conf", type=float, default=PRED_CONF, help="กรองกล่องก่อนคิด metric")
+    ap.add_argument("--kp-conf", type=float, default=0.0, help="จุดที่ conf ต่ำกว่านี้ถือว่าทำนายไม่ได้ (PCK)")
+    ap.add_argument("--sigmas", default=None, help="ค่าเดียว (ทุกจุด) หรือคั่นด้วย , ครบ K ค่า (ค่าเริ่มต้น 1/K แบบ ultralytics)")
+    ap.add_argument("--json", default=None, help="บันทึก report เป็น JSON")
+    args = ap.parse_args()
+
+    sigmas = [float(x) for x in args.sigmas.split(",")] if args.sigmas else None
+    rep, _ = evaluate(args.weights, args.data_yaml, args.split, args.imgsz, args.device,
+                      conf=args.conf, kp_conf=args.kp_conf, sigmas=sigmas)
+    print_report(rep)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=1, ensure_ascii=False)
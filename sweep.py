@@ -0,0 +1,287 @@
+# sweep.py
+# จูน hyperparameter หลายชุดพร้อมกันผ่าน try_train + หยุดชุดที่แย่ก่อนด้วย successive halving
+# ใช้: python sweep.py <path/to/data.yaml> --trials 12 --epochs 27 [--space space.json] [--devices 0,1 | cpu] [--per-device 2]
+#
+# ทุก trial = process แยก (python sweep.py _trial ...) เทรนใน <out>/trial_XX/ ตามปกติ
+# ตัวหลักอ่าน results.csv ของแต่ละ trial: เมื่อถึง rung (min_epochs * eta^k) ถ้าค่า metric ไม่อยู่ใน 1/eta อันดับแรก
+# ของ trial ที่ถึง rung นั้นแล้ว -> หยุด trial นั้น (แบบ asynchronous: ไม่ต้องรอให้ทุก trial ถึง rung ก่อน)
+# ผล: <out>/summary.csv (เรียงอันดับ), <out>/best_hyp.json (ใช้กับ main.py: POSE_HYP=<out>/best_hyp.json)
+# --serial: รัน trial ชุดเดียวกัน (seed เดิม) ซ้ำทีละ trial ด้วยทุกคอร์ ไม่หยุดก่อน ใน <out>/serial/ -> เทียบเวลาจริง
+
+import csv
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+METRIC = os.getenv("SWEEP_METRIC", "metrics/mAP50-95(P)")   # คอลัมน์ใน results.csv ที่ใช้จัดอันดับ (มากกว่า = ดีกว่า)
+POLL_SEC = float(os.getenv("SWEEP_POLL_SEC", "5"))
+
+# ช่วงค่าเริ่มต้น: list = เลือก 1 ค่า, {"range": [a, b]} = สุ่มแบบ uniform, {"log": [a, b]} = สุ่มแบบ log-uniform
+DEFAULT_SPACE = {
+    "lr0": {"log": [1e-4, 1e-3]},
+    "hsv_h": {"range": [0.0, 0.03]},
+    "hsv_s": {"range": [0.2, 0.7]},
+    "hsv_v": {"range": [0.2, 0.6]},
+    "degrees": {"range": [0.0, 15.0]},
+    "scale": {"range": [0.05, 0.3]},
+    "fliplr": [0.0, 0.3, 0.5],
+    "imgsz": [512, 640],
+}
+
+
+def sample(space, rng):
+    out = {}
+    for k, v in space.items():
+        if isinstance(v, list):
+            out[k] = rng.choice(v)
+        elif isinstance(v, dict) and "range" in v:
+            a, b = v["range"]
+            out[k] = round(rng.uniform(a, b), 4)
+        elif isinstance(v, dict) and "log" in v:
+            a, b = v["log"]
+            out[k] = float(f"{math.exp(rng.uniform(math.log(a), math.log(b))):.3g}")
+        else:
+            out[k] = v
+    return out
+
+
+def rungs(min_epochs, max_epochs, eta):
+    r, out = int(min_epochs), []
+    while r < max_epochs:
+        out.append(r)
+        r *= eta
+    return out
+
+
+def read_metric(results_csv, metric=METRIC):
+    """-> ค่า metric ต่อ epoch (ลำดับตาม results.csv) หรือ [] ถ้ายังไม่มี"""
+    try:
+        with open(results_csv, newline="", encoding="utf-8") as f:
+            rows = list(csv.reader(f))
+    except FileNotFoundError:
+        return []
+    if len(rows) < 2:
+        return []
+    header = [h.strip() for h in rows[0]]   # ultralytics บางเวอร์ชันเติมช่องว่างหน้าชื่อคอลัมน์
+    if metric not in header:
+        raise KeyError(f"ไม่มีคอลัมน์ {metric} ใน {results_csv} (มี {header})")
+    col = header.index(metric)
+    # แถวที่ยังเขียนไม่ครบ (ultralytics กำลัง append) ข้ามไปก่อน
+    return [float(r[col]) for r in rows[1:] if len(r) == len(header) and r[col].strip()]
+
+
+def promotable(value, competing, eta):
+    """ไปต่อได้ถ้าอยู่ใน 1/eta อันดับแรกของค่าที่ถึง rung นี้แล้ว (ตัวแรกที่ถึง rung ไปต่อเสมอ)"""
+    k = max(0, len(competing) // eta - 1)
+    return value >= sorted(competing, reverse=True)[k]
+
+
+class Trial:
+    def __init__(self, idx, params, out_dir):
+        self.idx = idx
+        self.name = f"trial_{idx:02d}"
+        self.params = params
+        self.dir = os.path.join(out_dir, self.name)
+        self.proc = None
+        self.device = None
+        self.status = "pending"
+        self.judged = set()
+        self.history = []
+        self.t0 = self.t1 = None
+
+    @property
+    def best(self):
+        return max(self.history) if self.history else float("nan")
+
+
+def launch(trial, args, device, threads):
+    spec = {"data": os.path.abspath(args.data), "model": args.model, "epochs": args.epochs, "batch": args.batch,
+            "device": device, "project": os.path.abspath(args.out), "name": trial.name, "workers": args.workers,
+            "threads": threads, "probe": args.probe, "params": trial.params}
+    env = dict(os.environ)
+    if device == "cpu":
+        env.update(OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+    os.makedirs(trial.dir, exist_ok=True)
+    log = open(os.path.join(trial.dir, "trial.log"), "w", encoding="utf-8")
+    trial.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "_trial", json.dumps(spec)],
+                                  stdout=log, stderr=subprocess.STDOUT, env=env)
+    trial.proc.log = log
+    trial.device = device
+    trial.status = "running"
+    trial.t0 = time.perf_counter()
+
+
+def _finish(trial, status):
+    if trial.proc.poll() is None:
+        trial.proc.terminate()
+        try:
+            trial.proc.wait(30)
+        except subprocess.TimeoutExpired:
+            trial.proc.kill()
+            trial.proc.wait()
+    trial.proc.log.close()
+    trial.status = status
+    trial.t1 = time.perf_counter()
+
+
+def run_sweep(args, out_dir=None, halving=True):
+    """halving=False: baseline แบบเดิม -> ทีละ trial บนอุปกรณ์แรก ใช้ทุกคอร์ เทรนครบทุก epoch"""
+    out_dir = out_dir or args.out
+    rng = random.Random(args.seed)
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space, encoding="utf-8") as f:
+            space = json.load(f)
+    os.makedirs(out_dir, exist_ok=True)
+    trials = [Trial(i, sample(space, rng), out_dir) for i in range(args.trials)]
+
+    # เตรียมแคชภาพครั้งเดียวก่อน (ไม่ให้หลาย trial สร้างแคชเดียวกันพร้อมกัน)
+    if os.getenv("DATA_CACHE", "disk") == "disk":
+        from dataset_cache import prepare_from_yaml
+        for size in sorted({int(t.params.get("imgsz", args.imgsz)) for t in trials}):
+            prepare_from_yaml(args.data, size)
+
+    devices = [d.strip() for d in args.devices.split(",")]
+    slots = [d for d in devices for _ in range(args.per_device)] if halving else devices[:1]
+    n_cpu_slots = sum(1 for d in slots if d == "cpu")
+    threads = max(1, (os.cpu_count() or 1) // max(1, n_cpu_slots))
+    ladder = rungs(args.min_epochs, args.epochs, args.eta) if halving else []
+    at_rung = {r: [] for r in ladder}
+    print(f"[sweep] {len(trials)} trials, slots={slots}, rungs={ladder} (eta={args.eta}), metric={METRIC}")
+
+    t_start = time.perf_counter()
+    pending = list(trials)
+    running = []
+    while pending or running:
+        free = list(slots)
+        for t in running:
+            free.remove(t.device)
+        while pending and free:
+            t = pending.pop(0)
+            launch(t, args, free.pop(0), threads)
+            running.append(t)
+            print(f"[sweep] start {t.name} on {t.device}: {t.params}")
+
+        time.sleep(POLL_SEC)
+        for t in list(running):
+            try:
+                t.history = read_metric(os.path.join(t.dir, "results.csv"))
+            except KeyError as e:
+                print(f"[sweep] {e}")
+            for r in ladder:
+                if r in t.judged or len(t.history) < r:
+                    continue
+                t.judged.add(r)
+                value = max(t.history[:r])
+                at_rung[r].append(value)
+                if not promotable(value, at_rung[r], args.eta):
+                    _finish(t, f"stopped@{r}")
+                    print(f"[sweep] stop {t.name} at epoch {r}: {value:.4f} ไม่อยู่ใน 1/{args.eta} แรก")
+                    break
+            if t.status == "running" and t.proc.poll() is not None:
+                _finish(t, "done" if t.proc.returncode == 0 else f"failed({t.proc.returncode})")
+                print(f"[sweep] {t.status} {t.name}: best {t.best:.4f}")
+            if t.status != "running":
+                running.remove(t)
+
+    wall = time.perf_counter() - t_start
+    return trials, wall
+
+
+def write_summary(trials, out_dir, wall):
+    ranked = sorted(trials, key=lambda t: (not math.isnan(t.best), t.best), reverse=True)
+    keys = sorted({k for t in trials for k in t.params})
+    path = os.path.join(out_dir, "summary.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["rank", "trial", "status", "epochs", METRIC, "minutes"] + keys)
+        for i, t in enumerate(ranked, 1):
+            w.writerow([i, t.name, t.status, len(t.history), f"{t.best:.5f}", f"{(t.t1 - t.t0) / 60:.1f}"]
+                       + [t.params.get(k, "") for k in keys])
+    best = ranked[0]
+    if not math.isnan(best.best):
+        with open(os.path.join(out_dir, "best_hyp.json"), "w", encoding="utf-8") as f:
+            json.dump(best.params, f, indent=2)
+
+    print(f"\n[sweep] จบใน {wall / 60:.1f} นาที -> {path}")
+    for i, t in enumerate(ranked[:5], 1):
+        print(f"  {i}. {t.name} {t.status:12s} {METRIC}={t.best:.4f}  {t.params}")
+    return best
+
+
+def _trial_main(spec):
+    """(process ลูก) เทรน 1 ชุด hyperparameter"""
+    import torch
+    from ultralytics import YOLO
+
+    from dataset_cache import CachedPoseTrainer
+    from train_utils import load_hyp, try_train
+
+    torch.set_num_threads(int(spec["threads"]))
+    hyp = load_hyp()
+    hyp.update(spec["params"])
+    imgsz = int(hyp.pop("imgsz", int(os.getenv("IMGSZ", "640"))))
+    device = spec["device"] if spec["device"] == "cpu" else int(spec["device"])
+    try_train(
+        YOLO(spec["model"]),
+        probe=spec["probe"],
+        data=spec["data"],
+        epochs=spec["epochs"],
+        imgsz=imgsz,
+        batch=spec["batch"],
+        device=device,
+        workers=spec["workers"],
+        project=spec["project"],
+        name=spec["name"],
+        exist_ok=True,
+        plots=False,
+        val=True,
+        cache=(os.getenv("DATA_CACHE", "disk") == "ram"),
+        trainer=CachedPoseTrainer if os.getenv("DATA_CACHE", "disk") == "disk" else None,
+        **hyp,
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "_trial":
+        _trial_main(json.loads(sys.argv[2]))
+        sys.exit(0)
+
+    import argparse
+
+    ap = argparse.ArgumentParser(description="hyperparameter sweep + successive halving บน try_train")
+    ap.add_argument("data", help="data.yaml")
+    ap.add_argument("--out", default=os.path.join("runs", "sweep", time.strftime("%Y%m%d-%H%M%S")))
+    ap.add_argument("--model", default=os.getenv("POSE_MODEL", "yolov8n-pose.pt"))
+    ap.add_argument("--space", help="ไฟล์ JSON ของช่วงค่า (ไม่ระบุ = DEFAULT_SPACE)")
+    ap.add_argument("--trials", type=int, default=12)
+    ap.add_argument("--epochs", type=int, default=27, help="epoch สูงสุดต่อ trial")
+    ap.add_argument("--min-epochs", type=int, default=3, help="rung แรก")
+    ap.add_argument("--eta", type=int, default=3, help="เก็บ 1/eta ต่อ rung")
+    ap.add_argument("--imgsz", type=int, default=int(os.getenv("IMGSZ", "640")), help="ใช้เมื่อ space ไม่มี imgsz")
+    ap.add_argument("--batch", type=int, default=int(os.getenv("BATCH", "16")))
+    ap.add_argument("--devices", default=os.getenv("SWEEP_DEVICES", "cpu"), help="เช่น 0,1 หรือ cpu")
+    ap.add_argument("--per-device", type=int, default=None,
+                    help="trial พร้อมกันต่ออุปกรณ์ (ค่าเริ่มต้น: GPU 1, CPU = คอร์/4)")
+    ap.add_argument("--workers", type=int, default=2, help="DataLoader workers ต่อ trial")
+    ap.add_argument("--probe", action="store_true", help="ให้ try_train probe หน่วยความจำก่อนทุก trial")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--serial", action="store_true",
+                    help="รัน trial ชุดเดียวกันซ้ำทีละ trial (ทุกคอร์, ไม่หยุดก่อน) เพื่อวัดว่า sweep เร็วกว่าจริงกี่เท่า")
+    args = ap.parse_args()
+    if args.per_device is None:
+        args.per_device = max(1, (os.cpu_count() or 1) // 4) if args.devices == "cpu" else 1
+
+    trials, wall = run_sweep(args)
+    best = write_summary(trials, args.out, wall)
+    if args.serial:
+        serial_out = os.path.join(args.out, "serial")
+        s_trials, s_wall = run_sweep(args, serial_out, halving=False)
+        s_best = write_summary(s_trials, serial_out, s_wall)
+        print(f"\n[sweep] ทีละ trial {s_wall / 60:.1f} นาที vs sweep {wall / 60:.1f} นาที "
+              f"-> เร็วขึ้น x{s_wall / max(wall, 1e-9):.2f}; "
+              f"best {METRIC} {best.best:.4f} ({best.name}) vs {s_best.best:.4f} ({s_best.name})")
@@ -0,0 +1,88 @@
+# test_dataset_store.py
+# ensure_dataset แบบ offline: ใช้ local_fetch แทนการโหลดจาก Roboflow (ไม่ต่อ network)
+import os
+import stat
+
+import pytest
+
+import dataset_store
+from dataset_store import ensure_dataset, local_fetch, sha256_file, version_dir, _object_path
+
+
+def _make_dataset(path):
+    files = {
+        "data.yaml": "train: train/images\nval: valid/images\nkpt_shape: [24, 3]\n",
+        "train/images/a.jpg": "jpeg-a",
+        "train/images/b.jpg": "jpeg-b",
+        "train/labels/a.txt": "0 0.5 0.5 0.2 0.2\n",
+        "train/labels/b.txt": "0 0.4 0.4 0.1 0.1\n",
+        "valid/images/c.jpg": "jpeg-c",
+        "valid/labels/c.txt": "0 0.3 0.3 0.1 0.1\n",
+    }
+    for rel, text in files.items():
+        p = path / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text)
+    return str(path)
+
+
+def _counting(fetch):
+    calls = []
+
+    def _fetch(*args):
+        calls.append(args)
+        return fetch(*args)
+    _fetch.calls = calls
+    return _fetch
+
+
+def _no_fetch(*_args):
+    raise AssertionError("ไม่ควรเรียก fetch เมื่อมี dataset ในที่เก็บแล้ว")
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)   # กันไม่ให้ไปเจอโฟลเดอร์ <project>-<version> แบบเดิมใน cwd
+    return str(tmp_path / "store")
+
+
+def test_local_fetch_ingests(tmp_path, store):
+    src = _make_dataset(tmp_path / "src")
+    fetch = _counting(local_fetch(src))
+    data_yaml = ensure_dataset("ws", "dog-pose", 2, root=store, fetch=fetch)
+
+    assert len(fetch.calls) == 1
+    assert data_yaml == os.path.join(version_dir("dog-pose", 2, store), "data.yaml")
+    assert (tmp_path / "store" / "versions" / "dog-pose-2" / "train" / "images" / "a.jpg").read_text() == "jpeg-a"
+
+
+def test_second_call_skips_fetch(tmp_path, store):
+    src = _make_dataset(tmp_path / "src")
+    first = ensure_dataset("ws", "dog-pose", 2, root=store, fetch=local_fetch(src))
+    assert ensure_dataset("ws", "dog-pose", 2, root=store, fetch=_no_fetch) == first
+
+
+def test_changed_content_refetches(tmp_path, store):
+    src = _make_dataset(tmp_path / "src")
+    ensure_dataset("ws", "dog-pose", 2, root=store, fetch=local_fetch(src))
+    target = os.path.join(version_dir("dog-pose", 2, store), "train", "images", "a.jpg")
+    digest = sha256_file(target)
+    obj = _object_path(digest, store)
+
+    os.chmod(target, stat.S_IREAD | stat.S_IWRITE)
+    with open(target, "w") as f:   # hardlink -> object ใน objects/ เสียไปด้วย
+        f.write("jpeg-X")
+    assert sha256_file(obj) != digest
+
+    fetch = _counting(local_fetch(src))
+    ensure_dataset("ws", "dog-pose", 2, root=store, fetch=fetch)
+    assert len(fetch.calls) == 1
+    assert sha256_file(obj) == digest   # object เสียถูกลบแล้วนำเข้าใหม่จากต้นทาง
+    assert sha256_file(target) == digest
+
+
+def test_offline_missing_version_raises(store, monkeypatch):
+    monkeypatch.setattr(dataset_store, "OFFLINE", True)   # = POSE_OFFLINE=1
+    monkeypatch.setattr(dataset_store, "DATASET_SOURCE", None)
+    with pytest.raises(RuntimeError, match="POSE_OFFLINE=1"):
+        ensure_dataset("ws", "dog-pose", 3, root=store)
@@ -0,0 +1,278 @@
+# train_utils.py
+# try_train: หา batch/imgsz ที่ใหญ่สุดที่พอดีกับงบหน่วยความจำ (GPU หรือ RAM) ก่อนเทรน
+# และถ้า OOM กลางทาง -> ลดขนาดแล้ว resume ต่อจาก last.pt แทนการเริ่ม epoch 0 ใหม่
+# การตัดสินใจทุกครั้ง (ค่า + เหตุผล) ถูกบันทึกลง <run dir>/sizing.jsonl
+
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+
+import torch
+from ultralytics import YOLO
+
+MEM_BUDGET_GB = os.getenv("TRAIN_MEM_BUDGET_GB")   # ไม่ตั้ง = 90% ของ VRAM หรือ 80% ของ RAM ที่ว่าง
+MEM_MARGIN = float(os.getenv("TRAIN_MEM_MARGIN", "1.2"))   # เผื่อ dataloader/fragmentation เหนือค่าที่ probe ได้
+MIN_BATCH = 4
+IMGSZ_FALLBACK = 512          # ลด imgsz เหลือเท่านี้เมื่อ batch ลดถึง MIN_BATCH แล้วยังไม่พอ
+SIZING_LOG = "sizing.jsonl"
+
+# hyperparameter ของ Phase 1 (main.py) = จุดตั้งต้นของ sweep.py
+BASE_HYP = dict(
+    optimizer="adamw",                            # AdamW เหมาะกับ keypoint
+    lr0=3e-4,                                     # ลด LR เล็กน้อย เพราะ dataset เล็ก/ซับซ้อน
+    lrf=0.01,
+    patience=8,                                   # รอ early stopping นานขึ้น เพราะ loss อาจแกว่ง
+    pretrained=True,                              # เริ่มจาก pretrained weights
+    # --- Augment สำหรับ dog pose (นุ่มนวล) ---
+    hsv_h=0.02, hsv_s=0.4, hsv_v=0.4,
+    degrees=10, translate=0.05, scale=0.15,
+    shear=0.0, mosaic=0.0,
+    perspective=0.0,                              # ไม่บิดภาพ
+    fliplr=0.3,
+)
+
+
+
+def load_hyp(path=None):
+    """BASE_HYP ทับด้วยค่าจากไฟล์ JSON (เช่น best_hyp.json ที่ sweep.py เขียน) ถ้ามี"""
+    hyp = dict(BASE_HYP)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            hyp.update(json.load(f))
+    return hyp
+
+
+_OOM_MARKERS = (
+    "out of memory",
+    "cuda error",
+    "cublas_status_alloc_failed",
+    "can't allocate memory",          # CPU: DefaultCPUAllocator
+    "not enough memory",
+)
+
+
+def is_oom(e):
+    """OOM ของ CUDA / MPS / CPU allocator (รวม MemoryError ของ Python)"""
+    if isinstance(e, MemoryError):
+        return True
+    msg = str(e).lower()
+    return any(m in msg for m in _OOM_MARKERS)
+
+
+def _is_cuda(device):
+    return torch.cuda.is_available() and str(device) not in ("cpu", "mps")
+
+
+def memory_budget(device, budget_gb=MEM_BUDGET_GB):
+    """-> (ไบต์, ชนิด 'gpu'/'host')"""
+    kind = "gpu" if _is_cuda(device) else "host"
+    if budget_gb:
+        return int(float(budget_gb) * 2**30), kind
+    if kind == "gpu":
+        idx = int(str(device).split(",")[0]) if str(device).split(",")[0].isdigit() else 0
+        return int(torch.cuda.get_device_properties(idx).total_memory * 0.9), kind
+    import psutil
+    return int(psutil.virtual_memory().available * 0.8), kind
+
+
+def _flatten(out):
+    if torch.is_tensor(out):
+        yield out
+    elif isinstance(out, (list, tuple)):
+        for o in out:
+            yield from _flatten(o)
+    elif isinstance(out, dict):
+        for o in out.values():
+            yield from _flatten(o)
+
+
+class ProbeError(RuntimeError):
+    """probe ใช้ไม่ได้ด้วยเหตุอื่นที่ไม่ใช่ OOM (วัดหน่วยความจำไม่ได้, timeout, error อื่น) -> ใช้ค่าที่ขอมาตามเดิม"""
+
+
+def _peak_rss():
+    """peak RSS ของ process นี้ (ไบต์) หรือ None ถ้าวัดไม่ได้ (Windows ไม่มีโมดูล resource -> ใช้ psutil)"""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024   # macOS เป็นไบต์, Linux เป็น KB
+    except ImportError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    mi = psutil.Process().memory_info()
+    return getattr(mi, "peak_wset", mi.rss)   # Windows: peak working set
+
+
+def _probe_main(src, imgsz, batch, device):
+    """(รันใน process ลูก) forward + backward + AdamW step 1 รอบ แล้วพิมพ์หน่วยความจำสูงสุด (ไบต์, null = วัดไม่ได้)"""
+    cuda = _is_cuda(device)
+    dev = torch.device(f"cuda:{str(device).split(',')[0]}" if cuda and str(device)[0].isdigit() else
+                       ("cuda" if cuda else "cpu"))
+    m = YOLO(src).model.float().to(dev).train()
+    for p in m.parameters():
+        p.requires_grad_(True)
+    opt = torch.optim.AdamW(m.parameters(), lr=1e-4)
+    base = None if cuda else _peak_rss()
+    if cuda:
+        torch.cuda.reset_peak_memory_stats(dev)
+    x = torch.rand(batch, 3, imgsz, imgsz, device=dev)
+    with torch.autocast(device_type="cuda", enabled=cuda):   # ตรงกับ amp=True ของ trainer บน GPU
+        out = m(x)
+    loss = sum(t.float().sum() for t in _flatten(out))
+    loss.backward()
+    opt.step()
+    if cuda:
+        peak = torch.cuda.max_memory_allocated(dev)
+    else:
+        now = _peak_rss()
+        peak = now - base if now is not None and base is not None else None
+    print(json.dumps({"peak": int(peak) if peak is not None else None}))
+
+
+def probe_peak(src, imgsz, batch, device, timeout=600):
+    """
+    หน่วยความจำสูงสุดของ 1 training step (ไบต์) หรือ None ถ้า OOM — รันใน process แยก ไม่ทำให้ CUDA context หลักเสีย
+    ล้มเหลวด้วยเหตุอื่น / วัดไม่ได้ -> ProbeError
+    """
+    cmd = [sys.executable, os.path.abspath(__file__), "--probe", str(src), str(imgsz), str(batch), str(device)]
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        raise ProbeError(f"probe เกินเวลา {timeout}s (imgsz={imgsz}, batch={batch})") from e
+    if p.returncode != 0:
+        if is_oom(RuntimeError(p.stderr)) or p.returncode in (-9, 137):   # -9 = ถูก OOM killer ฆ่า
+            return None
+        raise ProbeError(f"probe ล้มเหลว (imgsz={imgsz}, batch={batch}):\n{p.stderr[-2000:]}")
+    try:
+        peak = json.loads(p.stdout.strip().splitlines()[-1])["peak"]
+    except (IndexError, KeyError, ValueError) as e:
+        raise ProbeError(f"อ่านผล probe ไม่ได้: {p.stdout[-500:]!r}") from e
+    if peak is None:
+        raise ProbeError("วัดหน่วยความจำของ process ไม่ได้ (ไม่มี resource/psutil)")
+    return peak
+
+
+def fit_to_budget(src, batch, imgsz, device, budget):
+    """
+    หา (batch, imgsz) ใหญ่สุดที่ไม่เกิน budget: probe batch 1 และ 2 -> ค่าคงที่ + ต่อภาพ, ประมาณ batch สูงสุด
+    แล้ว probe ยืนยันอีกครั้ง (ไม่พอ -> ลดครึ่ง); ลด batch ต่ำกว่า MIN_BATCH (หรือต่ำกว่าที่ขอ ถ้าขอน้อยกว่านั้น)
+    แล้วยังไม่พอ -> ลด imgsz
+    -> (batch, imgsz, เหตุผล)
+    """
+    limit = budget / MEM_MARGIN
+    for size in (imgsz, IMGSZ_FALLBACK) if imgsz > IMGSZ_FALLBACK else (imgsz,):
+        p1, p2 = probe_peak(src, size, 1, device), probe_peak(src, size, 2, device)
+        if p1 is None or p2 is None:
+            continue
+        per_img = max(p2 - p1, 1)
+        fixed = max(p1 - per_img, 0)
+        b = int(min(batch, (limit - fixed) // per_img))
+        while b >= 1:
+            peak = probe_peak(src, size, b, device)
+            if peak is not None and peak <= limit:
+                reason = (f"probe: peak {peak / 2**30:.2f} GB x{MEM_MARGIN} <= budget {budget / 2**30:.2f} GB "
+                          f"(~{per_img / 2**20:.0f} MB/ภาพ + {fixed / 2**20:.0f} MB คงที่)")
+                if b >= min(batch, MIN_BATCH) or size == IMGSZ_FALLBACK or imgsz <= IMGSZ_FALLBACK:
+                    return b, size, reason
+                break   # batch เล็กเกินไป -> ลอง imgsz ที่เล็กลง
+            b //= 2
+    raise RuntimeError(f"แม้ batch=1 ก็เกินงบหน่วยความจำ {budget / 2**30:.2f} GB")
+
+
+def next_smaller(batch, imgsz):
+    """ขั้นถัดไปเมื่อ OOM (แบบเดียวกับของเดิม): ลด batch ครึ่งหนึ่งจนถึง MIN_BATCH แล้วลด imgsz"""
+    if batch > MIN_BATCH:
+        return max(MIN_BATCH, batch // 2), imgsz
+    if imgsz > IMGSZ_FALLBACK:
+        return batch, IMGSZ_FALLBACK
+    return None
+
+
+def _last_checkpoint(model):
+    tr = getattr(model, "trainer", None)
+    last = os.path.join(str(tr.save_dir), "weights", "last.pt") if tr is not None else None
+    return last if last and os.path.exists(last) else None
+
+
+def _attach_log(model, events):
+    """เขียน events ที่ยังไม่ได้เขียนลง <save_dir>/sizing.jsonl ตอน trainer เริ่ม (ตอนนั้นรู้ save_dir แล้ว)"""
+    def _write(trainer):
+        path = os.path.join(str(trainer.save_dir), SIZING_LOG)
+        with open(path, "a", encoding="utf-8") as f:
+            for ev in events:
+                if not ev.get("_logged"):
+                    ev["_logged"] = True
+                    f.write(json.dumps({k: v for k, v in ev.items() if k != "_logged"}, ensure_ascii=False) + "\n")
+    model.add_callback("on_pretrain_routine_start", _write)
+
+
+def try_train(model, probe=True, budget_gb=MEM_BUDGET_GB, **kwargs):
+    """
+    รัน train แบบกัน OOM:
+      1) (probe=True) หา batch/imgsz ที่พอดีกับงบหน่วยความจำก่อนเริ่ม
+      2) ถ้ายัง OOM กลางทาง: ลด batch -> ลด imgsz แล้ว resume จาก last.pt ของรอบนั้น (ไม่เริ่ม epoch 0 ใหม่)
+    """
+    batch = int(kwargs.get("batch", os.getenv("BATCH", 16)))
+    imgsz = int(kwargs.get("imgsz", os.getenv("IMGSZ", 640)))
+    device = kwargs.get("device", "cpu")
+    events = []
+
+    def _event(kind, reason, **extra):
+        ev = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "event": kind, "batch": batch, "imgsz": imgsz,
+              "reason": reason, **extra}
+        events.append(ev)
+        print(f"[sizing] {kind}: batch={batch} imgsz={imgsz} ({reason})")
+
+    if probe:
+        budget, mem_kind = memory_budget(device, budget_gb)
+        src = getattr(model, "ckpt_path", None) or getattr(model, "cfg", None)
+        if src:
+            req = (batch, imgsz)
+            try:
+                batch, imgsz, reason = fit_to_budget(src, batch, imgsz, device, budget)
+                _event("probe", reason, requested={"batch": req[0], "imgsz": req[1]},
+                       budget_gb=round(budget / 2**30, 2), memory=mem_kind)
+            except ProbeError as e:
+                # probe ใช้ไม่ได้ (ไม่ใช่ OOM) -> เทรนด้วยค่าที่ขอ แล้วพึ่งการ resume ตอน OOM แทน
+                _event("probe_skipped", str(e).splitlines()[0][:200])
+
+    run_model = model
+    while True:
+        _attach_log(run_model, events)
+        try:
+            print(f"[train] epochs={kwargs.get('epochs')} batch={batch} imgsz={imgsz}")
+            args = {**kwargs, "batch": batch, "imgsz": imgsz}
+            if run_model is not model:
+                args["resume"] = True
+            return run_model.train(**args)
+        except (RuntimeError, MemoryError) as e:
+            if not is_oom(e):
+                raise  # ถ้าเป็น error อื่นให้โยนต่อ
+            smaller = next_smaller(batch, imgsz)
+            if smaller is None:
+                raise
+            last = _last_checkpoint(run_model)
+            batch, imgsz = smaller
+            _event("oom", str(e).strip().splitlines()[0][:200],
+                   resume_from=last or "(ยังไม่มี checkpoint -> เริ่มใหม่)")
+            if last:
+                # last.pt ถูกบันทึกทุก epoch -> ต่อจาก epoch ล่าสุดที่เสร็จ ด้วย batch/imgsz ใหม่
+                # (ultralytics ใช้ args จาก checkpoint ยกเว้น imgsz/batch/device ที่ส่งมาใหม่)
+                run_model = YOLO(last)
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            time.sleep(1)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--probe":
+        _probe_main(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), sys.argv[5])
+    else:
+        print("ใช้ภายใน main.py: from train_utils import try_train")